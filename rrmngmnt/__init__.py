@@ -1,13 +1,19 @@
-from rrmngmnt.host import Host
-from rrmngmnt.user import (
-    User,
-    UserWithPKey,
-    RootUser,
-    Domain,
-    InternalDomain,
-    ADUser,
-)
-from rrmngmnt.db import Database
+"""
+Names of package are imported on first access, so 'import rrmngmnt'
+doesn't load paramiko and modules of all services.
+"""
+import importlib
+
+_names = {
+    'Host': 'rrmngmnt.host',
+    'User': 'rrmngmnt.user',
+    'UserWithPKey': 'rrmngmnt.user',
+    'RootUser': 'rrmngmnt.user',
+    'Domain': 'rrmngmnt.user',
+    'InternalDomain': 'rrmngmnt.user',
+    'ADUser': 'rrmngmnt.user',
+    'Database': 'rrmngmnt.db',
+}
 
 
 __all__ = [
@@ -20,3 +26,17 @@ __all__ = [
     'ADUser',
     'Database',
 ]
+
+
+def __getattr__(name):
+    if name not in _names:
+        raise AttributeError(
+            "module %r has no attribute %r" % (__name__, name)
+        )
+    value = getattr(importlib.import_module(_names[name]), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_names))
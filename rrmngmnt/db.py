@@ -1,7 +1,167 @@
+import contextlib
+import csv
+import itertools
+import queue
+import re
+import shlex
+import subprocess
+import threading
+import uuid
+import zlib
+
+import six
+
+from rrmngmnt.common import normalize_string
 from rrmngmnt.service import Service
 
 
+class _Drain(threading.Thread):
+    """
+    Read rest of stream in background, so process is never blocked on
+    writing to it while its other stream is consumed
+    """
+    def __init__(self, fh):
+        super(_Drain, self).__init__()
+        self.daemon = True
+        self._fh = fh
+        self._data = None
+        self._error = None
+        self.start()
+
+    def run(self):
+        try:
+            self._data = self._fh.read()
+        except Exception as ex:
+            self._error = ex
+
+    def read(self):
+        self.join()
+        if self._error is not None:
+            raise self._error
+        return self._data
+
+
+class PsqlSession(object):
+    """
+    Long-lived psql process which runs queries sent over its stdin.
+
+    End of the output of each query is detected by unique marker echoed
+    to both stdout and stderr after the query.
+    """
+    record_separator = '__RECORD_SEPARATOR__'
+    # psql prefixes messages about commands read from stdin by location
+    message_prefix = re.compile(r'^psql:<stdin>:\d+: ')
+    message_levels = ('NOTICE:', 'WARNING:', 'INFO:', 'LOG:', 'DEBUG:')
+    sql_mode = (
+        '\\pset tuples_only on',
+        '\\pset format unaligned',
+        "\\pset recordsep '%s'" % record_separator,
+    )
+    cmd_mode = (
+        '\\pset tuples_only off',
+        '\\pset format aligned',
+        "\\pset recordsep '\\n'",
+    )
+
+    def __init__(self, in_, out, err):
+        """
+        Args:
+            in_ (file): stdin of psql process
+            out (file): stdout of psql process
+            err (file): stderr of psql process
+        """
+        super(PsqlSession, self).__init__()
+        self._in = in_
+        self._out = out
+        self._err = err
+        self._mode = None
+        self.marker = self._new_marker()
+        # stderr is read by thread, so notices can't fill up its pipe while
+        # stdout is read
+        self._err_lines = queue.Queue()
+        if err is not None:
+            reader = threading.Thread(target=self._read_lines, args=(err,))
+            reader.daemon = True
+            reader.start()
+
+    def _read_lines(self, fh):
+        while True:
+            line = fh.readline()
+            self._err_lines.put(line)
+            if not line:
+                return
+
+    @staticmethod
+    def _new_marker():
+        return '__END_OF_RESULT_%s__' % uuid.uuid4().hex
+
+    @staticmethod
+    def _read_until(readline, marker):
+        lines = []
+        while True:
+            line = readline()
+            if not line:
+                raise Exception("psql session terminated unexpectedly")
+            if line.rstrip('\n') == marker:
+                return ''.join(lines)
+            lines.append(line)
+
+    def _errors(self, err):
+        """
+        Returns:
+            tuple: (bool, str) whether err reports failure and err stripped
+                of location prefixes
+        """
+        failed = False
+        lines = []
+        for line in err.splitlines():
+            match = self.message_prefix.match(line)
+            if match:
+                line = line[match.end():]
+                if not line.startswith(self.message_levels):
+                    failed = True
+            lines.append(line)
+        return failed, '\n'.join(lines)
+
+    def run(self, command, mode):
+        """
+        Execute command in the session
+
+        Args:
+            command (str): sql or psql special command
+            mode (tuple): psql settings used to format the output
+
+        Returns:
+            tuple: (bool, str, str) failure flag, out and err
+        """
+        lines = []
+        if mode is not self._mode:
+            lines.append('\\set QUIET on')
+            lines.extend(mode)
+            lines.append('\\set QUIET off')
+            self._mode = mode
+        lines.append(command)
+        if mode is self.sql_mode:
+            # terminate the statement, psql -c doesn't require it
+            lines[-1] = command.rstrip().rstrip(';')
+            lines.append(';')
+        lines.append('\\echo %s' % self.marker)
+        lines.append('\\! echo %s >&2' % self.marker)
+        self._in.write('\n'.join(lines) + '\n')
+        self._in.flush()
+        out = self._read_until(self._out.readline, self.marker)
+        failed, err = self._errors(
+            self._read_until(self._err_lines.get, self.marker)
+        )
+        return failed, out, err
+
+
 class Database(Service):
+    csv_null = '\\N'
+    default_batch_size = 1000
+    copy_chunk_size = 64 * 1024
+    # zlib wbits for data in gzip container
+    gzip_wbits = 16 + zlib.MAX_WBITS
 
     def __init__(self, host, name, user):
         """
@@ -13,6 +173,59 @@ class Database(Service):
         super(Database, self).__init__(host)
         self.name = name
         self.user = user
+        self._session = None
+
+    def _psql_base_cmd(self):
+        return [
+            'export', 'PGPASSWORD=%s;' % self.user.password,
+            'psql', '-d', self.name, '-U', self.user.name, '-h', 'localhost',
+        ]
+
+    @staticmethod
+    def _command(executor, session, cmd):
+        """
+        Create command of session, cmd is shell command line which may set
+        variables and contain pipes. With sudo whole command line is run
+        by privileged shell, prepending sudo would apply to its first
+        command only.
+        """
+        if not executor.sudo:
+            return session.command(cmd)
+        # bash, as pipefail is not supported by every sh
+        script = subprocess.list2cmdline(cmd)
+        command = session.command(['sudo', 'bash', '-c', script])
+        command.cmd = "sudo bash -c %s" % shlex.quote(script)
+        return command
+
+    @contextlib.contextmanager
+    def session(self):
+        """
+        Keep single psql process running on the host, psql and psql_cmd
+        calls made inside of this context are executed by it instead of
+        connecting to the host and database for every call.
+
+        Example:
+            with db.session():
+                for vm_id in vm_ids:
+                    db.psql("SELECT status FROM vm_dynamic WHERE vm_guid = "
+                            "'%s'", vm_id)
+        """
+        if self._session is not None:
+            yield self
+            return
+        cmd = self._psql_base_cmd() + ['-X']
+        executor = self.host.executor()
+        with executor.session() as ss:
+            command = self._command(executor, ss, cmd)
+            with command.execute() as (in_, out, err):
+                self._session = PsqlSession(in_, out, err)
+                try:
+                    yield self
+                finally:
+                    self._session = None
+                    # psql runs until end of its input
+                    in_.write('\\q\n')
+                    in_.close()
 
     def psql(self, sql, *args):
         """
@@ -25,18 +238,20 @@ class Database(Service):
         Returns:
             list: list of lines with records.
         """
-        separator = '__RECORD_SEPARATOR__'
+        separator = PsqlSession.record_separator
         sql = sql % tuple(args)
-        cmd = [
-            'export', 'PGPASSWORD=%s;' % self.user.password,
-            'psql', '-d', self.name, '-U', self.user.name, '-h', 'localhost',
-            '-R', separator, '-t', '-A', '-c', sql,
-        ]
+        if self._session is not None:
+            failed, out, err = self._session.run(sql, PsqlSession.sql_mode)
+        else:
+            cmd = self._psql_base_cmd() + [
+                '-R', separator, '-t', '-A', '-c', sql,
+            ]
 
-        executor = self.host.executor()
-        with executor.session() as ss:
-            rc, out, err = ss.run_cmd(cmd)
-        if rc:
+            executor = self.host.executor()
+            with executor.session() as ss:
+                rc, out, err = self._command(executor, ss, cmd).run(None)
+            failed = bool(rc)
+        if failed:
             raise Exception(
                 "Failed to exec sql command: %s" % err
             )
@@ -57,15 +272,17 @@ class Database(Service):
         Returns:
             str: output of the command
         """
-        cmd = [
-            'export', 'PGPASSWORD=%s;' % self.user.password,
-            'psql', '-d', self.name, '-U', self.user.name, '-h', 'localhost',
-            '-c', command
-        ]
-        executor = self.host.executor()
-        with executor.session() as ss:
-            rc, out, err = ss.run_cmd(cmd)
-        if rc:
+        if self._session is not None:
+            failed, out, err = self._session.run(
+                command, PsqlSession.cmd_mode
+            )
+        else:
+            cmd = self._psql_base_cmd() + ['-c', command]
+            executor = self.host.executor()
+            with executor.session() as ss:
+                rc, out, err = self._command(executor, ss, cmd).run(None)
+            failed = bool(rc)
+        if failed:
             raise Exception(
                 "Failed to exec command: %s" % err
             )
@@ -73,6 +290,245 @@ class Database(Service):
             out = err
         return out
 
+    def _copy_to_stdout_cmd(self, query, header=False):
+        options = "FORMAT csv, NULL '%s'" % self.csv_null
+        if header:
+            options += ", HEADER"
+        copy = "COPY (%s) TO STDOUT WITH (%s)" % (
+            query.strip().rstrip(';'), options
+        )
+        return self._psql_base_cmd() + [
+            '-X', '-q', '-v', 'ON_ERROR_STOP=1', '-c', copy,
+        ]
+
+    def query_iter(self, sql, *args, types=None, as_dict=False):
+        """
+        Execute sql query on host and stream its rows as they arrive
+
+        The query is wrapped into COPY ... TO STDOUT in CSV format, so values
+        containing separators, quotes or new lines are parsed correctly and
+        only one row is kept in memory at a time.
+
+        Args:
+            sql (str): sql query, it must return rows (SELECT, VALUES, ...)
+            args (list): positional format arguments for query
+            types (list|dict): optional converters applied on not NULL
+                values, list is matched with columns by position, dict by
+                column name. For example [int, str] or {'vm_guid': UUID}
+            as_dict (bool): yield dicts keyed by column names instead of
+                lists
+
+        Yields:
+            list|dict: row with values, NULL is represented by None
+
+        Raises:
+            Exception: if the query failed
+        """
+        header = as_dict or isinstance(types, dict)
+        cmd = self._copy_to_stdout_cmd(sql % tuple(args), header=header)
+
+        executor = self.host.executor()
+        with executor.session() as ss:
+            command = self._command(executor, ss, cmd)
+            with command.execute() as (_, out, err):
+                err = _Drain(err)
+                rows = csv.reader(iter(out.readline, ''))
+                columns = next(rows, None) if header else None
+                converters = types
+                if isinstance(types, dict):
+                    converters = [types.get(c) for c in columns or []]
+                for row in rows:
+                    row = [None if v == self.csv_null else v for v in row]
+                    if converters:
+                        row = [
+                            f(v) if f is not None and v is not None else v
+                            for f, v in itertools.zip_longest(
+                                converters[:len(row)], row
+                            )
+                        ]
+                    if as_dict:
+                        row = dict(zip(columns, row))
+                    yield row
+                err = err.read()
+            rc = command.rc
+        if rc:
+            raise Exception(
+                "Failed to exec sql command: %s" % err
+            )
+
+    def query_batches(self, sql, *args, batch_size=None, **kwargs):
+        """
+        Same as query_iter, but yields rows in lists of given size
+
+        Args:
+            sql (str): sql query
+            args (list): positional format arguments for query
+            batch_size (int): maximal number of rows in one batch,
+                default_batch_size when None
+            kwargs (dict): other keyword arguments of query_iter
+
+        Yields:
+            list: list of rows
+        """
+        if batch_size is None:
+            batch_size = self.default_batch_size
+        rows = self.query_iter(sql, *args, **kwargs)
+        while True:
+            batch = list(itertools.islice(rows, batch_size))
+            if not batch:
+                return
+            yield batch
+
+    def _csv_chunks(self, rows):
+        """
+        Serialize rows to CSV in chunks of copy_chunk_size bytes
+        """
+        buf = six.StringIO()
+        writer = csv.writer(buf, lineterminator='\n')
+        for row in rows:
+            writer.writerow(
+                [self.csv_null if v is None else v for v in row]
+            )
+            if buf.tell() >= self.copy_chunk_size:
+                yield buf.getvalue().encode('utf-8')
+                buf.seek(0)
+                buf.truncate()
+        if buf.tell():
+            yield buf.getvalue().encode('utf-8')
+
+    def _file_chunks(self, fh):
+        while True:
+            chunk = fh.read(self.copy_chunk_size)
+            if not chunk:
+                return
+            if isinstance(chunk, six.text_type):
+                chunk = chunk.encode('utf-8')
+            yield chunk
+
+    def _gzip_chunks(self, chunks):
+        compressor = zlib.compressobj(wbits=self.gzip_wbits)
+        for chunk in chunks:
+            chunk = compressor.compress(chunk)
+            if chunk:
+                yield chunk
+        yield compressor.flush()
+
+    def copy_in(self, table, source, header=False, compress=False):
+        """
+        Bulk load data into table by COPY ... FROM STDIN streamed through
+        single SSH channel
+
+        Args:
+            table (str): table name, optionally with list of columns, for
+                example "vds_static (vds_id, vds_name)"
+            source (str|file|iterable): local path or file object with CSV
+                data, or iterable of rows (sequences of values, None is
+                loaded as NULL)
+            header (bool): CSV data in source starts with header line
+            compress (bool): send data compressed by gzip, decompressed by
+                gunzip on the host
+
+        Returns:
+            int: number of copied rows
+
+        Raises:
+            Exception: if the copy failed
+        """
+        options = "FORMAT csv, NULL '%s'" % self.csv_null
+        if header:
+            options += ", HEADER"
+        cmd = self._psql_base_cmd() + [
+            '-X', '-v', 'ON_ERROR_STOP=1',
+            '-c', "COPY %s FROM STDIN WITH (%s)" % (table, options),
+        ]
+        if compress:
+            cmd[2:2] = ['gunzip', '-c', '|']
+
+        with contextlib.ExitStack() as stack:
+            if isinstance(source, six.string_types):
+                source = stack.enter_context(open(source, 'rb'))
+            if hasattr(source, 'read'):
+                chunks = self._file_chunks(source)
+            else:
+                chunks = self._csv_chunks(source)
+            if compress:
+                chunks = self._gzip_chunks(chunks)
+
+            executor = self.host.executor()
+            ss = stack.enter_context(executor.session())
+            command = self._command(executor, ss, cmd)
+            with command.execute() as (in_, out, err):
+                out, err = _Drain(out), _Drain(err)
+                for chunk in chunks:
+                    in_.write(chunk)
+                in_.close()
+                out = out.read()
+                err = err.read()
+            rc = command.rc
+        if rc:
+            raise Exception(
+                "Failed to copy data into %s: %s" % (table, err)
+            )
+        match = re.search(r'^COPY (\d+)', normalize_string(out), re.M)
+        return int(match.group(1)) if match else 0
+
+    def copy_out(self, source, destination, header=False, compress=False):
+        """
+        Bulk export table or query result in CSV format by COPY ... TO
+        STDOUT streamed through single SSH channel
+
+        Args:
+            source (str): table name or sql query
+            destination (str|file): local path or binary file object
+            header (bool): include header line
+            compress (bool): transfer data compressed by gzip on the host,
+                data is stored decompressed
+
+        Returns:
+            int: number of written bytes
+
+        Raises:
+            Exception: if the copy failed
+        """
+        if len(source.split()) > 1:
+            source = "(%s)" % source.strip().rstrip(';')
+        options = "FORMAT csv, NULL '%s'" % self.csv_null
+        if header:
+            options += ", HEADER"
+        cmd = self._psql_base_cmd() + [
+            '-X', '-q', '-v', 'ON_ERROR_STOP=1',
+            '-c', "COPY %s TO STDOUT WITH (%s)" % (source, options),
+        ]
+        if compress:
+            # report failure of psql rather than success of gzip
+            cmd = ['set', '-o', 'pipefail;'] + cmd + ['|', 'gzip', '-c']
+        written = 0
+        with contextlib.ExitStack() as stack:
+            if isinstance(destination, six.string_types):
+                destination = stack.enter_context(open(destination, 'wb'))
+            decompressor = zlib.decompressobj(self.gzip_wbits)
+            executor = self.host.executor()
+            ss = stack.enter_context(executor.session())
+            command = self._command(executor, ss, cmd)
+            with command.execute() as (_, out, err):
+                err = _Drain(err)
+                for chunk in self._file_chunks(out):
+                    if compress:
+                        chunk = decompressor.decompress(chunk)
+                    destination.write(chunk)
+                    written += len(chunk)
+                if compress:
+                    chunk = decompressor.flush()
+                    destination.write(chunk)
+                    written += len(chunk)
+                err = err.read()
+            rc = command.rc
+        if rc:
+            raise Exception(
+                "Failed to copy data from %s: %s" % (source, err)
+            )
+        return written
+
     def restart(self):
         """
         Restart postgresql service
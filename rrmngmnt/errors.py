@@ -86,6 +86,37 @@ class FailCreateTemp(FileSystemError):
     pass
 
 
+class ChecksumMismatch(FileSystemError):
+    """
+    Content of transferred file differs from its source
+    """
+    def __init__(self, path, expected, actual):
+        """
+        Args:
+            path (str): path to destination file
+            expected (str): sha256 of source
+            actual (str): sha256 of destination
+        """
+        super(ChecksumMismatch, self).__init__(path, expected, actual)
+
+    @property
+    def path(self):
+        return self.args[0]
+
+    @property
+    def expected(self):
+        return self.args[1]
+
+    @property
+    def actual(self):
+        return self.args[2]
+
+    def __str__(self):
+        return "Checksum of {0} is {1}, expected {2}".format(
+            self.path, self.actual, self.expected
+        )
+
+
 class MountCommandError(MountError):
     def __init__(self, mp, stdout, stderr):
         super(MountCommandError, self).__init__(mp)
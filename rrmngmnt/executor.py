@@ -2,8 +2,99 @@
 This module was created for easier testing of whole package.
 """
 import contextlib
+from rrmngmnt.common import normalize_string
 from rrmngmnt.resource import Resource
 
+# Prefix of shell command which drops its stdout on the host, so it is not
+# transferred nor kept in memory, for commands where only rc matters. Stderr
+# is kept, it explains failures.
+DISCARD_OUTPUT = "exec >/dev/null; "
+
+_PENDING = object()
+
+
+class CommandResult(object):
+    """
+    Result of command, behaves as tuple (rc, out, err).
+
+    Output is kept as received and decoded to str on first access of
+    out / err, raw output is available as out_bytes / err_bytes.
+    """
+    __slots__ = ('rc', '_raw_out', '_raw_err', '_out', '_err')
+
+    def __init__(self, rc=None, out=None, err=None):
+        """
+        Args:
+            rc (int): return code
+            out (bytes): standard output, str is accepted too
+            err (bytes): standard error output, str is accepted too
+        """
+        self.rc = rc
+        self.out = out
+        self.err = err
+
+    @staticmethod
+    def _encode(data):
+        if data is None or isinstance(data, bytes):
+            return data
+        return data.encode('utf-8')
+
+    @property
+    def out(self):
+        if self._out is _PENDING:
+            self._out = normalize_string(self._raw_out)
+        return self._out
+
+    @out.setter
+    def out(self, data):
+        self._raw_out = data
+        self._out = _PENDING
+
+    @property
+    def err(self):
+        if self._err is _PENDING:
+            self._err = normalize_string(self._raw_err)
+        return self._err
+
+    @err.setter
+    def err(self, data):
+        self._raw_err = data
+        self._err = _PENDING
+
+    @property
+    def out_bytes(self):
+        return self._encode(self._raw_out)
+
+    @property
+    def err_bytes(self):
+        return self._encode(self._raw_err)
+
+    def __iter__(self):
+        return iter((self.rc, self.out, self.err))
+
+    def __len__(self):
+        return 3
+
+    def __getitem__(self, index):
+        return tuple(self)[index]
+
+    def __eq__(self, other):
+        if isinstance(other, (tuple, CommandResult)):
+            return tuple(self) == tuple(other)
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    def __hash__(self):
+        return hash(tuple(self))
+
+    def __repr__(self):
+        return "CommandResult(rc=%r, out=%r, err=%r)" % tuple(self)
+
 
 class Executor(Resource):
 
@@ -23,6 +114,9 @@ class Executor(Resource):
             )
 
     class Session(object):
+        # Files returned by open_file support seek
+        random_access = True
+
         def __init__(self, executor):
             super(Executor.Session, self).__init__()
             self._executor = executor
@@ -47,19 +141,42 @@ class Executor(Resource):
         def command(self, cmd):
             return Executor.Command(cmd, self)
 
-        def run_cmd(self, cmd, input_):
+        def run_cmd(self, cmd, input_=None, discard_output=False):
             cmd = self.command(cmd)
+            if discard_output:
+                cmd.discard_output()
             return cmd.run(input_)
 
     class Command(object):
         def __init__(self, cmd, session):
             super(Executor.Command, self).__init__()
             self.cmd = cmd
-            self.out = None
-            self.err = None
+            self.result = CommandResult()
             self._ss = session
             self._rc = None
 
+        @property
+        def out(self):
+            return self.result.out
+
+        @out.setter
+        def out(self, data):
+            self.result.out = data
+
+        @property
+        def err(self):
+            return self.result.err
+
+        @err.setter
+        def err(self, data):
+            self.result.err = data
+
+        def discard_output(self):
+            """
+            Make command drop its output on the host
+            """
+            self.cmd = DISCARD_OUTPUT + self.cmd
+
         @property
         def logger(self):
             return self._ss.logger
@@ -90,14 +207,18 @@ class Executor(Resource):
     def session(self):
         return Executor.Session(self)
 
-    def run_cmd(self, cmd, input_=None):
+    def run_cmd(self, cmd, input_=None, discard_output=False):
         """
         Args:
             cmd (list): command
             input_(str): input data
+            discard_output (bool): drop stdout on the host, only rc and
+                err are of interest
         """
         with self.session() as session:
-            return session.run_cmd(cmd, input_)
+            return session.run_cmd(
+                cmd, input_, discard_output=discard_output,
+            )
 
 
 class ExecutorFactory(object):
@@ -1,12 +1,620 @@
+import contextlib
+import errno
+import functools
+import hashlib
 import os
+import queue
+import re
+import shlex
+import stat
+import sys
+import tarfile
+import threading
+import uuid
+from collections import deque, namedtuple
 
 import six
 import warnings
 
 from rrmngmnt import errors
+from rrmngmnt.common import normalize_string
 from rrmngmnt.service import Service
 from rrmngmnt.resource import Resource
 
+READ_CHUNK = 1024 * 1024
+TAIL_BLOCK = 64 * 1024
+# automatic number of parallel streams gives each at least this many bytes
+PARALLEL_PART = 32 * 1024 * 1024
+MAX_STREAMS = 8
+# buffer of tar member data, the option is available since Python 3.8
+_TAR_COPY = {'copybufsize': READ_CHUNK} if sys.version_info >= (3, 8) else {}
+
+FollowedLine = namedtuple('FollowedLine', ['host', 'path', 'line'])
+# before / after are lists of context lines
+GrepMatch = namedtuple(
+    'GrepMatch', ['path', 'line_number', 'line', 'before', 'after']
+)
+FindEntry = namedtuple('FindEntry', ['path', 'type', 'size', 'mtime'])
+# sha256 is None unless checksums were requested
+ManifestEntry = namedtuple(
+    'ManifestEntry', ['type', 'size', 'mtime', 'sha256']
+)
+# relative paths of entries touched by sync
+SyncResult = namedtuple('SyncResult', ['added', 'changed', 'deleted'])
+# file sent by sparse transfer, chunks yield (offset, data) of extents
+_SparseFile = namedtuple('_SparseFile', ['size', 'extents', 'chunks'])
+
+# type, permissions, size, mtime, depth, owner, group and path of entry
+_ENTRY_FORMAT = '%y %m %s %T@ %d %u %g %p\\0'
+
+
+class FsEntry(namedtuple(
+    'FsEntry',
+    ['path', 'type', 'size', 'mode', 'owner', 'group', 'mtime', 'depth'],
+)):
+    """
+    Entry of directory tree on host, type is one of find's %y letters,
+    mode are permission bits and depth is relative to root of listing.
+    """
+    __slots__ = ()
+
+    @property
+    def name(self):
+        return os.path.basename(self.path)
+
+    def is_dir(self):
+        return self.type == 'd'
+
+    def is_file(self):
+        return self.type == 'f'
+
+    def is_symlink(self):
+        return self.type == 'l'
+
+
+def _parse_entry(record):
+    type_, mode, size, mtime, depth, owner, group, path = record.split(b' ', 7)
+    return FsEntry(
+        normalize_string(path), normalize_string(type_), int(size),
+        int(mode, 8), normalize_string(owner), normalize_string(group),
+        float(mtime), int(depth),
+    )
+
+
+def _normpath(path):
+    return path.rstrip('/') or '/'
+
+
+class FsTree(object):
+    """
+    Directory tree listed by single find command, indexed by path
+    """
+    def __init__(self, root, entries, max_depth=None):
+        """
+        Args:
+            root (str): path to root of tree
+            entries (iterable): FsEntry items in order printed by find
+            max_depth (int): depth of listing, directories in this depth
+                are not listed
+        """
+        super(FsTree, self).__init__()
+        self.root = _normpath(root)
+        self.max_depth = max_depth
+        self.entries = {}
+        self._children = {}
+        for entry in entries:
+            self.entries[entry.path] = entry
+            if entry.depth:
+                self._children.setdefault(
+                    os.path.dirname(entry.path), []
+                ).append(entry.name)
+
+    def __getitem__(self, path):
+        return self.entries[_normpath(path)]
+
+    def __contains__(self, path):
+        return _normpath(path) in self.entries
+
+    def __iter__(self):
+        return iter(self.entries.values())
+
+    def __len__(self):
+        return len(self.entries)
+
+    def listdir(self, path):
+        """
+        Args:
+            path (str): path to directory in tree
+
+        Returns:
+            list: names of entries in directory
+        """
+        return list(self._children.get(_normpath(path), []))
+
+    def walk(self, path=None, topdown=True):
+        """
+        Same as os.walk, with topdown directories can be pruned by
+        modifying dirnames in place.
+
+        Args:
+            path (str): directory to start at, root of tree by default
+            topdown (bool): yield directory before its subdirectories
+
+        Returns:
+            generator: (dirpath, dirnames, filenames) tuples
+        """
+        path = self.root if path is None else _normpath(path)
+        dirs, files = [], []
+        for name in self._children.get(path, []):
+            entry = self.entries[os.path.join(path, name)]
+            (dirs if entry.is_dir() else files).append(name)
+        if topdown:
+            yield path, dirs, files
+        for name in dirs:
+            subdir = os.path.join(path, name)
+            if (
+                self.max_depth is None or
+                self.entries[subdir].depth < self.max_depth
+            ):
+                for item in self.walk(subdir, topdown):
+                    yield item
+        if not topdown:
+            yield path, dirs, files
+
+
+# Attributes of entries under directory relative to it, with checksums the
+# listing is followed by '#' record and output of sha256sum. Missing
+# directory has empty manifest.
+_MANIFEST_SCRIPT = (
+    "cd %s 2>/dev/null || exit 0; "
+    "find . -mindepth 1 -printf '%%y %%s %%T@ %%P\\0'"
+)
+_MANIFEST_SUMS = "; printf '#\\0'; find . -type f -exec sha256sum -- {} +"
+
+_SHA256_ESCAPE = re.compile(br'\\(.)', re.S)
+
+# Content addressed upload, entry of cache is named by sha256 of file. Hit
+# refreshes mtime of entry, which is used for LRU eviction. Destination is
+# printed NUL terminated, so any path can be parsed.
+_CACHE_LOOKUP = """mkdir -p {cache} || exit 1
+dst={dst}
+if [ -d "$dst" ]; then dst="$dst"/{name}; fi
+printf '%s\\0' "$dst"
+if [ -f {entry} ]; then
+  touch {entry} && {place} && printf hit
+fi"""
+_CACHE_STORE = "mv -f {tmp} {entry} && {place}"
+_CACHE_LINK = 'ln -f {entry} "$dst" 2>/dev/null || cp -f {entry} "$dst"'
+_CACHE_COPY = 'cp -f {entry} "$dst"'
+# Sparse file is extracted to temporary directory, 'cp' writes it into
+# destination in place and skips its holes.
+_SPARSE_WRITE = """tmp=$(mktemp -d {dir}/.rrmngmnt.XXXXXX) || exit 1
+trap 'rm -rf "$tmp"' EXIT
+tar -x --no-same-owner --touch -C "$tmp" -f - &&
+cp --sparse=always -- "$tmp"/data {dst}"""
+# Newest entries are kept until their total size reaches limit, only
+# complete entries are considered, temporary files of uploads in progress
+# are not.
+_CACHE_EVICT = (
+    "; cd {cache} && find . -maxdepth 1 -type f -name '%s' "
+    "-printf '%%T@ %%s %%f\\n' | "
+    "sort -rn | awk -v limit={limit} '(total += $2) > limit {{print $3}}' | "
+    "xargs -r rm -f --"
+) % ('[0-9a-f]' * 64)
+
+_digests = {}
+_digests_lock = threading.Lock()
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(READ_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_sha256(path):
+    """
+    Compute sha256 of local file. Digests are cached for whole process by
+    path, modification time and size of file, so unchanged file is read
+    once.
+
+    Args:
+        path (str): path to file
+
+    Returns:
+        str: hex digest
+    """
+    path = os.path.abspath(path)
+    st = os.stat(path)
+    stamp = (st.st_mtime_ns, st.st_size)
+    with _digests_lock:
+        cached = _digests.get(path)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    digest = _sha256(path)
+    with _digests_lock:
+        _digests[path] = (stamp, digest)
+    return digest
+
+
+def clear_digest_cache():
+    """
+    Forget all computed digests of local files
+    """
+    with _digests_lock:
+        _digests.clear()
+
+
+def local_manifest(root, checksum=False):
+    """
+    Describe local directory tree, symbolic links are not followed
+
+    Args:
+        root (str): path to directory
+        checksum (bool): compute sha256 of regular files
+
+    Returns:
+        dict: ManifestEntry items by path relative to root, type is 'f',
+            'd' or 'l' same as find's %y, other types are skipped
+    """
+    manifest = {}
+    for dirpath, dirnames, filenames in os.walk(root):
+        for name in dirnames + filenames:
+            path = os.path.join(dirpath, name)
+            st = os.lstat(path)
+            if stat.S_ISDIR(st.st_mode):
+                type_ = 'd'
+            elif stat.S_ISLNK(st.st_mode):
+                type_ = 'l'
+            elif stat.S_ISREG(st.st_mode):
+                type_ = 'f'
+            else:
+                continue
+            manifest[os.path.relpath(path, root)] = ManifestEntry(
+                type_, st.st_size, st.st_mtime,
+                file_sha256(path) if checksum and type_ == 'f' else None,
+            )
+    return manifest
+
+
+def _parse_manifest(data):
+    manifest = {}
+    records = data.split(b'\0')
+    sums = records.pop()
+    for record in records:
+        if record == b'#':
+            break
+        type_, size, mtime, path = record.split(b' ', 3)
+        manifest[normalize_string(path)] = ManifestEntry(
+            normalize_string(type_), int(size), float(mtime), None,
+        )
+    for line in sums.split(b'\n'):
+        if not line:
+            continue
+        # names with backslash or newline are escaped by sha256sum
+        escaped = line.startswith(b'\\')
+        if escaped:
+            line = line[1:]
+        digest, path = line[:64], line[66:]
+        if escaped:
+            path = _SHA256_ESCAPE.sub(
+                lambda m: b'\n' if m.group(1) == b'n' else m.group(1), path
+            )
+        path = normalize_string(path[2:])
+        if path in manifest:
+            manifest[path] = manifest[path]._replace(
+                sha256=normalize_string(digest)
+            )
+    return manifest
+
+
+def _differs(root, rel, entry, other):
+    """
+    Compare local entry with remote one of the same type, mtime is compared
+    in whole seconds
+    """
+    if entry.type == 'd':
+        return False
+    if entry.size != other.size:
+        return True
+    if other.sha256 is not None:
+        return (
+            entry.sha256 or file_sha256(os.path.join(root, rel))
+        ) != other.sha256
+    return int(entry.mtime) != int(other.mtime)
+
+
+def _data_extents(fd, size):
+    """
+    Find data extents of local file, holes are skipped. When filesystem
+    doesn't report holes, whole file is one extent.
+
+    Returns:
+        generator: (offset, length) tuples
+    """
+    if not hasattr(os, 'SEEK_DATA'):
+        if size:
+            yield 0, size
+        return
+    offset = 0
+    while offset < size:
+        try:
+            start = os.lseek(fd, offset, os.SEEK_DATA)
+        except OSError as ex:
+            if ex.errno == errno.ENXIO:
+                # only hole up to the end
+                return
+            if ex.errno != errno.EINVAL or offset:
+                raise
+            yield 0, size
+            return
+        end = min(os.lseek(fd, start, os.SEEK_HOLE), size)
+        yield start, end - start
+        offset = end
+
+
+def _read_extents(fh, extents, seek=False):
+    """
+    Read content of extents, either from file which supports seek or from
+    stream where they follow each other
+
+    Returns:
+        generator: (offset, data) tuples
+    """
+    for offset, length in extents:
+        if seek:
+            fh.seek(offset)
+        while length > 0:
+            data = fh.read(min(READ_CHUNK, length))
+            if not data:
+                raise IOError("Unexpected end of data at %d" % offset)
+            yield offset, data
+            offset += len(data)
+            length -= len(data)
+
+
+def _write_extents(fh, size, chunks):
+    """
+    Write chunks to their offsets, skipped ranges stay holes
+    """
+    for offset, data in chunks:
+        fh.seek(offset)
+        fh.write(data)
+    fh.truncate(size)
+
+
+@contextlib.contextmanager
+def _local_sparse_file(path):
+    with open(path, 'rb') as fh:
+        st = os.fstat(fh.fileno())
+        extents = list(_data_extents(fh.fileno(), st.st_size))
+        yield _SparseFile(
+            st.st_size, extents, _read_extents(fh, extents, seek=True),
+        )
+
+
+def _sparse_tarinfo(name, source):
+    """
+    Describe sparse file as member of PAX 1.0 sparse format, the data of
+    member start with map of extents.
+
+    Returns:
+        tuple: TarInfo and map of extents
+    """
+    extents = [extent for extent in source.extents if extent[1]]
+    if not extents or sum(extents[-1]) < source.size:
+        # file ends by hole
+        extents.append((source.size, 0))
+    numbers = [len(extents)] + [n for extent in extents for n in extent]
+    sparse_map = b''.join(b'%d\n' % n for n in numbers)
+    sparse_map += b'\0' * (-len(sparse_map) % tarfile.BLOCKSIZE)
+    info = tarfile.TarInfo('GNUSparseFile.0/%s' % name)
+    info.size = len(sparse_map) + sum(length for _, length in extents)
+    # the same mode as new file created by open_file gets
+    info.mode = 0o666
+    info.pax_headers = {
+        'GNU.sparse.major': '1',
+        'GNU.sparse.minor': '0',
+        'GNU.sparse.name': name,
+        'GNU.sparse.realsize': str(source.size),
+    }
+    return info, sparse_map
+
+
+class _ChunkReader(object):
+    """
+    File-like object which reads head followed by data of chunks
+    """
+    def __init__(self, head, chunks):
+        self._chunks = iter(chunks)
+        self._data = head
+        self._pos = 0
+
+    def read(self, size):
+        parts = []
+        while size > 0:
+            if self._pos >= len(self._data):
+                chunk = next(self._chunks, None)
+                if chunk is None:
+                    break
+                self._data, self._pos = chunk[1], 0
+                continue
+            part = self._data[self._pos:self._pos + size]
+            self._pos += len(part)
+            size -= len(part)
+            parts.append(part)
+        return b''.join(parts)
+
+
+def _stream_count(streams, size):
+    """
+    Number of parallel streams for file, each of them gets at least one
+    chunk
+
+    Args:
+        streams (int): requested number of streams, None for automatic
+        size (int): size of file
+
+    Returns:
+        int: number of streams
+    """
+    if streams is None:
+        streams = min(MAX_STREAMS, size // PARALLEL_PART)
+    return max(1, min(streams, -(-size // READ_CHUNK)))
+
+
+def _ranges(size, streams):
+    part = -(-size // streams)
+    return [
+        (offset, min(part, size - offset))
+        for offset in range(0, size, part)
+    ]
+
+
+@contextlib.contextmanager
+def _open_remote(executor, path, mode):
+    """
+    Open file in its own session, so its transfer has own connection
+    """
+    with executor.session() as ss:
+        with ss.open_file(path, mode) as fh:
+            yield fh
+
+
+def _copy_ranges(open_src, open_dst, size, streams):
+    """
+    Copy file by byte ranges concurrently, each range has its own handles of
+    source and destination which are opened by given callables.
+
+    Args:
+        open_src (callable): returns context manager of source handle
+        open_dst (callable): returns context manager of destination handle
+        size (int): size of file
+        streams (int): number of ranges
+    """
+    failures = []
+
+    def copy(offset, length):
+        try:
+            with open_src() as rh, open_dst() as wh:
+                _pipeline(wh)
+                wh.seek(offset)
+                while length > 0:
+                    data = _read_at(rh, offset, min(READ_CHUNK, length))
+                    if not data:
+                        raise IOError(
+                            "Unexpected end of data at %d" % offset
+                        )
+                    wh.write(data)
+                    offset += len(data)
+                    length -= len(data)
+        except Exception as ex:
+            failures.append(ex)
+
+    threads = [
+        threading.Thread(target=copy, args=part)
+        for part in _ranges(size, streams)
+    ]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if failures:
+        raise failures[0]
+
+
+def _check_digest(path, expected, actual):
+    if expected != actual:
+        raise errors.ChecksumMismatch(path, expected, actual)
+
+
+# Each file is followed by its own 'tail -F', lines are tagged by index of
+# file: 'N:line' for content, 'N!message' for messages of tail and
+# 'N@offset' for position where following started. Following ends when
+# input of command is closed, tail watches process which reads the input.
+FOLLOW_SCRIPT = """follow() {
+  size=$(stat -c %%s "$2" 2>/dev/null || echo 0)
+  offset=$3
+  if [ "$offset" -lt 0 ]; then offset=$size
+  elif [ "$offset" -gt "$size" ]; then offset=0; fi
+  echo "$1@$offset"
+  { { tail -F --pid=$input -c +$((offset + 1)) "$2" 2>&1 1>&3 3>&- |
+      sed -u "s/^/$1!/" >&4; } 3>&1 | sed -u "s/^/$1:/"; } 4>&1
+}
+exec 5<&0
+cat <&5 >/dev/null &
+input=$!
+exec 5<&-
+%s
+wait $input
+"""
+_FOLLOWED_LINE = re.compile(br'(\d+)([:!@])(.*)', re.S)
+# tail reads file from beginning after these messages
+_FOLLOW_RESET = (b'truncated', b'replaced', b'appeared')
+# 'number:line' of match, 'number-line' of context line
+_GREP_LINE = re.compile(br'(\d+)([:-])(.*)', re.S)
+
+
+def _read_at(fh, offset, length):
+    """
+    Read block of file. SFTP file sends all requests for the block at once
+    (readv), instead of waiting for each of them, sequential only streams
+    are just read.
+    """
+    if hasattr(fh, 'readv'):
+        return b''.join(fh.readv([(offset, length)]))
+    seekable = getattr(fh, 'seekable', None)
+    if seekable is not None and seekable():
+        fh.seek(offset)
+    return fh.read(length)
+
+
+def _pipeline(fh):
+    """
+    Don't wait for acknowledge of each SFTP write
+    """
+    if hasattr(fh, 'set_pipelined'):
+        fh.set_pipelined(True)
+
+
+def _copy_file(rh, wh):
+    """
+    Copy file by chunks, SFTP reads of chunk are requested at once and SFTP
+    writes are pipelined
+    """
+    _pipeline(wh)
+    offset = 0
+    while True:
+        data = _read_at(rh, offset, READ_CHUNK)
+        if not data:
+            break
+        wh.write(data)
+        offset += len(data)
+
+
+def _read_available(stream, size=64 * 1024):
+    """
+    Read data which are available in output of command, empty bytes mean
+    end of output.
+    """
+    if hasattr(stream, 'read1'):
+        return stream.read1(size)
+    channel = getattr(stream, 'channel', None)
+    if channel is not None:
+        # paramiko.ChannelFile.read waits for all requested data
+        return channel.recv(size)
+    data = stream.read(size)
+    return data if isinstance(data, bytes) else data.encode('utf-8')
+
+
+def _timestamp(value):
+    if hasattr(value, 'timestamp'):
+        return value.timestamp()
+    return float(value)
+
 
 class FileSystem(Service):
     """
@@ -53,9 +661,8 @@ class FileSystem(Service):
         )[0] == 0
 
     def listdir(self, path):
-        return self.host.executor().run_cmd(
-            ['ls', '-A1', path]
-        )[1].split()
+        out = self.host.executor().run_cmd(['ls', '-A1', path])[1]
+        return [name for name in out.splitlines() if name]
 
     def touch(self, *args):
         """
@@ -120,6 +727,463 @@ class FileSystem(Service):
         rc, out, _ = self.host.run_command(cmd)
         return out if not rc else ""
 
+    @contextlib.contextmanager
+    def open(self, path, mode='rb'):
+        """
+        Open remote file, handle is valid inside of with block only
+
+        with host.fs.open('/var/log/messages') as fh:
+            fh.seek(-1024, os.SEEK_END)
+
+        Args:
+            path (str): path to file
+            mode (str): mode, same as for builtin open
+
+        Returns:
+            file-like object: handle of remote file, it supports seek unless
+                executor provides sequential access only or uses sudo
+        """
+        executor = self.host.executor()
+        with executor.session() as ss:
+            if executor.sudo:
+                with self._open_by_command(executor, ss, path, mode) as fh:
+                    yield fh
+                return
+            with ss.open_file(path, mode) as fh:
+                yield fh
+
+    @contextlib.contextmanager
+    def _open_by_command(self, executor, session, path, mode):
+        """
+        Open file through 'cat' pipe, so it is accessed by sudo like by
+        commands. Only sequential reading, writing and appending is
+        supported.
+        """
+        redirect = {'r': '<', 'w': '>', 'a': '>>'}.get(mode[:1])
+        if redirect is None or '+' in mode:
+            raise ValueError("Mode %s is not supported with sudo" % mode)
+        command = self._command(
+            executor, session, ['sh', '-c', 'cat %s "$1"' % redirect, 'sh', path],
+        )
+        with command.execute() as (in_, out, err):
+            yield out if redirect == '<' else in_
+            in_.close()
+            # cat can't exit until rest of file is read
+            while out.read(READ_CHUNK):
+                pass
+            err = err.read()
+        if command.rc:
+            raise IOError("%s: %s" % (path, normalize_string(err).strip()))
+
+    def iter_lines(self, path, chunk_size=READ_CHUNK):
+        """
+        Iterate over lines of remote file. File is read by chunks, when
+        iteration stops early, rest of file is not transferred.
+
+        Args:
+            path (str): path to file
+            chunk_size (int): number of bytes to read at once
+
+        Returns:
+            generator: lines of file without line endings
+        """
+        with self.open(path) as fh:
+            offset = 0
+            pending = b''
+            while True:
+                chunk = _read_at(fh, offset, chunk_size)
+                if not chunk:
+                    break
+                offset += len(chunk)
+                lines = (pending + chunk).split(b'\n')
+                pending = lines.pop()
+                for line in lines:
+                    yield normalize_string(line)
+            if pending:
+                yield normalize_string(pending)
+
+    @staticmethod
+    def _read_by_command(executor, session, cmd):
+        rc, _, err = result = session.run_cmd(cmd)
+        if rc:
+            raise errors.CommandExecutionFailure(
+                cmd=cmd, executor=executor, rc=rc, err=err
+            )
+        return result.out_bytes
+
+    def read_range(self, path, offset, length):
+        """
+        Read part of remote file, only requested bytes are transferred
+
+        Args:
+            path (str): path to file
+            offset (int): position to start at
+            length (int): number of bytes to read
+
+        Returns:
+            bytes: data, shorter than length when file ends sooner
+
+        Raises:
+            IOError: if file can't be read
+            CommandExecutionFailure: if file can't be read by executor
+                without random access to files or with sudo
+        """
+        executor = self.host.executor()
+        with executor.session() as ss:
+            # file opened by session isn't accessed by sudo
+            if executor.sudo or not ss.random_access:
+                return self._read_by_command(executor, ss, [
+                    'dd', 'if=%s' % path, 'iflag=skip_bytes,count_bytes',
+                    'skip=%d' % offset, 'count=%d' % length,
+                    'bs=%d' % READ_CHUNK, 'status=none',
+                ])
+            with ss.open_file(path, 'rb') as fh:
+                return _read_at(fh, offset, length)
+
+    def tail(self, path, lines=10):
+        """
+        Read last lines of remote file, file is read from its end by blocks
+        until there are enough lines.
+
+        Args:
+            path (str): path to file
+            lines (int): number of lines
+
+        Returns:
+            str: last lines, same as output of 'tail -n'
+
+        Raises:
+            IOError: if file can't be read
+            CommandExecutionFailure: if file can't be read by executor
+                without random access to files or with sudo
+        """
+        executor = self.host.executor()
+        with executor.session() as ss:
+            if executor.sudo or not ss.random_access:
+                return normalize_string(self._read_by_command(
+                    executor, ss, ['tail', '-n', str(lines), path]
+                ))
+            if lines <= 0:
+                return ''
+            with ss.open_file(path, 'rb') as fh:
+                fh.seek(0, os.SEEK_END)
+                offset = fh.tell()
+                data = b''
+                while offset > 0 and data[:-1].count(b'\n') < lines:
+                    size = min(TAIL_BLOCK, offset)
+                    offset -= size
+                    data = _read_at(fh, offset, size) + data
+        end = b''
+        if data.endswith(b'\n'):
+            data, end = data[:-1], b'\n'
+        return normalize_string(b'\n'.join(data.split(b'\n')[-lines:]) + end)
+
+    def follow(self, paths, callback=None, **kwargs):
+        """
+        Follow files on host, see LogFollower
+
+        with host.fs.follow(['/var/log/messages']) as lines:
+            for host, path, line in lines:
+                ...
+
+        Args:
+            paths (list): paths to files
+            callback (func): function called with each FollowedLine, it
+                stops following by returning False
+            kwargs (dict): parameters of LogFollower
+
+        Returns:
+            LogFollower: follower to use in with statement, None when
+                callback is given, the call then blocks until callback stops
+        """
+        return follow([self.host], paths, callback, **kwargs)
+
+    @staticmethod
+    def _command(executor, session, cmd):
+        """
+        Create command of session, arguments are quoted for shell and sudo
+        is prepended when executor uses it
+        """
+        if executor.sudo:
+            cmd = ['sudo'] + cmd
+        command = session.command(cmd)
+        command.cmd = " ".join(shlex.quote(arg) for arg in cmd)
+        return command
+
+    def _run_script(self, executor, session, script, input_=None):
+        """
+        Run shell script on host
+
+        Returns:
+            CommandResult: result of script
+
+        Raises:
+            CommandExecutionFailure: if script fails
+        """
+        cmd = ['sh', '-c', script]
+        result = self._command(executor, session, cmd).run(input_)
+        if result.rc:
+            raise errors.CommandExecutionFailure(
+                cmd=cmd, executor=executor, rc=result.rc, err=result.err
+            )
+        return result
+
+    def _stream(self, cmd, separator=b'\n', expected_rcs=(0,)):
+        """
+        Run command and yield records of its output as they come
+
+        Args:
+            cmd (list): command, arguments are quoted for shell
+            separator (bytes): separator of records
+            expected_rcs (tuple): return codes which are not failure
+
+        Returns:
+            generator: records of output as bytes
+
+        Raises:
+            CommandExecutionFailure: if command fails, after all records
+                were read
+        """
+        executor = self.host.executor()
+        with executor.session() as ss:
+            command = self._command(executor, ss, cmd)
+            with command.execute() as (in_, out, err):
+                in_.close()
+                pending = b''
+                while True:
+                    data = _read_available(out)
+                    if not data:
+                        break
+                    records = (pending + data).split(separator)
+                    pending = records.pop()
+                    for record in records:
+                        yield record
+                if pending:
+                    yield pending
+                err = err.read()
+            rc = command.rc
+        if rc not in expected_rcs:
+            raise errors.CommandExecutionFailure(
+                cmd=cmd, executor=executor, rc=rc, err=normalize_string(err)
+            )
+
+    def grep(
+        self, pattern, paths, recursive=False, max_matches=None, context=0,
+        ignore_case=False, fixed=False,
+    ):
+        """
+        Search files on host by grep, matches are streamed as they are
+        found and only matching lines are transferred.
+
+        for match in host.fs.grep('ERROR', ['/var/log/vdsm/vdsm.log']):
+            print(match.path, match.line_number, match.line)
+
+        Args:
+            pattern (str): extended regular expression
+            paths (list): files or directories to search
+            recursive (bool): search directories recursively
+            max_matches (int): stop after this number of matches
+            context (int): number of context lines before and after match
+            ignore_case (bool): ignore case
+            fixed (bool): pattern is fixed string, not regular expression
+
+        Returns:
+            generator: GrepMatch items, context lines are in before / after
+
+        Raises:
+            CommandExecutionFailure: if grep fails, e.g. file doesn't exist
+        """
+        cmd = ['grep', '--null', '-H', '-n', '-F' if fixed else '-E']
+        if recursive:
+            cmd.append('-r')
+        if ignore_case:
+            cmd.append('-i')
+        if max_matches:
+            # limits matches per file, total is checked here
+            cmd.extend(['-m', str(max_matches)])
+        if context:
+            cmd.extend(['-C', str(context)])
+        cmd.extend(['-e', pattern, '--'] + list(paths))
+
+        count = 0
+        pending = deque()  # matches collecting lines after them
+        before = deque(maxlen=context)
+        last_path = None
+        with contextlib.closing(
+            self._stream(cmd, expected_rcs=(0, 1))
+        ) as records:
+            for record in records:
+                path, found, rest = record.partition(b'\0')
+                parsed = _GREP_LINE.match(rest) if found else None
+                if parsed is None:
+                    # separator of groups or message about binary file
+                    continue
+                path = normalize_string(path)
+                number = int(parsed.group(1))
+                line = normalize_string(parsed.group(3))
+                if path != last_path:
+                    before.clear()
+                    last_path = path
+                while pending and (
+                    pending[0].path != path or
+                    number > pending[0].line_number + context
+                ):
+                    yield pending.popleft()
+                    count += 1
+                    if max_matches and count >= max_matches:
+                        return
+                for match in pending:
+                    match.after.append(line)
+                if parsed.group(2) == b':':
+                    pending.append(GrepMatch(
+                        path, number, line,
+                        [ln for n, ln in before if n >= number - context], [],
+                    ))
+                before.append((number, line))
+        while pending:
+            yield pending.popleft()
+            count += 1
+            if max_matches and count >= max_matches:
+                return
+
+    def find(
+        self, root, name=None, type_=None, min_size=None, max_size=None,
+        newer_than=None, older_than=None, max_depth=None,
+    ):
+        """
+        Search for files on host by find, entries are streamed as they are
+        found.
+
+        Args:
+            root (str): directory to search in
+            name (str): shell pattern of base name
+            type_ (str): type of file, e.g. 'f' or 'd', same as for find
+            min_size (int): minimal size in bytes
+            max_size (int): maximal size in bytes
+            newer_than (datetime): modified after, also timestamp is accepted
+            older_than (datetime): modified before, also timestamp is
+                accepted
+            max_depth (int): maximal depth of directories, 0 is root only
+
+        Returns:
+            generator: FindEntry items, type is one of find's %y letters
+
+        Raises:
+            CommandExecutionFailure: if find fails, e.g. when some directory
+                is not readable
+        """
+        cmd = ['find', root]
+        if max_depth is not None:
+            cmd.extend(['-maxdepth', str(max_depth)])
+        if name:
+            cmd.extend(['-name', name])
+        if type_:
+            cmd.extend(['-type', type_])
+        if min_size:
+            cmd.extend(['-size', '+%dc' % (min_size - 1)])
+        if max_size is not None:
+            cmd.extend(['-size', '-%dc' % (max_size + 1)])
+        if newer_than is not None:
+            cmd.extend(['-newermt', '@%r' % _timestamp(newer_than)])
+        if older_than is not None:
+            cmd.extend(['!', '-newermt', '@%r' % _timestamp(older_than)])
+        cmd.extend(['-printf', '%y %s %T@ %p\\0'])
+        for record in self._stream(cmd, separator=b'\0'):
+            type_, size, mtime, path = record.split(b' ', 3)
+            yield FindEntry(
+                normalize_string(path), normalize_string(type_),
+                int(size), float(mtime),
+            )
+
+    def iter_tree(self, root, max_depth=None, depth_first=False):
+        """
+        Stream entries of directory tree listed by single find command,
+        symbolic links are not followed except root.
+
+        Args:
+            root (str): path to directory
+            max_depth (int): maximal depth to list, 0 is root only
+            depth_first (bool): entries of directory come before it
+
+        Returns:
+            generator: FsEntry items, root included
+
+        Raises:
+            CommandExecutionFailure: if find fails, e.g. when some directory
+                is not readable
+        """
+        cmd = ['find', '-H', _normpath(root)]
+        if depth_first:
+            cmd.append('-depth')
+        if max_depth is not None:
+            cmd.extend(['-maxdepth', str(max_depth)])
+        cmd.extend(['-printf', _ENTRY_FORMAT])
+        for record in self._stream(cmd, separator=b'\0'):
+            yield _parse_entry(record)
+
+    def tree(self, root, max_depth=None):
+        """
+        List directory tree by single command
+
+        Args:
+            root (str): path to directory
+            max_depth (int): maximal depth to list, 0 is root only
+
+        Returns:
+            FsTree: tree indexed by path
+        """
+        return FsTree(root, self.iter_tree(root, max_depth), max_depth)
+
+    def scandir(self, path):
+        """
+        List directory with attributes of entries, by single command
+
+        Args:
+            path (str): path to directory
+
+        Returns:
+            list: FsEntry items of directory entries
+        """
+        return [
+            entry for entry in self.iter_tree(path, max_depth=1)
+            if entry.depth
+        ]
+
+    def walk(self, root, max_depth=None, topdown=True):
+        """
+        Same as os.walk, whole tree is listed by single command. With
+        topdown the tree is kept in memory, without it entries are
+        streamed and only directories in progress are kept, which suits
+        huge trees.
+
+        Args:
+            root (str): path to directory
+            max_depth (int): maximal depth to list, 0 is root only
+            topdown (bool): yield directory before its subdirectories
+
+        Returns:
+            generator: (dirpath, dirnames, filenames) tuples
+        """
+        if topdown:
+            for item in self.tree(root, max_depth).walk():
+                yield item
+            return
+        pending = {}
+        for entry in self.iter_tree(root, max_depth, depth_first=True):
+            # same as topdown, root is always walked, other directories when
+            # their content is listed
+            if entry.is_dir() and (
+                max_depth is None or entry.depth < max_depth or
+                not entry.depth
+            ):
+                dirs, files = pending.pop(entry.path, ([], []))
+                yield entry.path, dirs, files
+            if entry.depth:
+                dirs, files = pending.setdefault(
+                    os.path.dirname(entry.path), ([], [])
+                )
+                (dirs if entry.is_dir() else files).append(entry.name)
+
     def move(self, source_path, destination_path):
         """
         Moves a file or directory from source to destination.
@@ -210,45 +1274,166 @@ class FileSystem(Service):
         """
         self._exec_command(['chmod', mode, path])
 
-    def get(self, path_src, path_dst):
+    def get(self, path_src, path_dst, sparse=False, streams=1):
         """
         Fetch file from Host and store on local system
 
         Args:
             path_src (str): path to file on remote system
             path_dst (str): path to file on local system or directory
+            sparse (bool): transfer only data extents of file by
+                'tar --sparse' stream, holes are recreated in destination
+            streams (int): number of concurrent connections, each of them
+                transfers own range of file, None to choose by size of
+                file. Parallel transfer is verified by checksum, it needs
+                executor with random access to files.
 
         Returns:
             str: Path to destination file
+
+        Raises:
+            ChecksumMismatch: if parallel transfer corrupted file
         """
         if os.path.isdir(path_dst):
             path_dst = os.path.join(path_dst, os.path.basename(path_src))
-        with self.host.executor().session() as ss:
+        executor = self.host.executor()
+        with executor.session() as ss:
+            if sparse:
+                with self._read_sparse(executor, ss, path_src) as source:
+                    with open(path_dst, 'wb') as wh:
+                        _write_extents(wh, source.size, source.chunks)
+                return path_dst
             with ss.open_file(path_src, 'rb') as rh:
-                with open(path_dst, 'wb') as wh:
-                    wh.write(rh.read())
+                count = 1
+                if streams != 1 and ss.random_access:
+                    rh.seek(0, os.SEEK_END)
+                    size = rh.tell()
+                    count = _stream_count(streams, size)
+                    rh.seek(0)
+                if count == 1:
+                    with open(path_dst, 'wb') as wh:
+                        _copy_file(rh, wh)
+                    return path_dst
+        with open(path_dst, 'wb') as wh:
+            wh.truncate(size)
+        _copy_ranges(
+            functools.partial(_open_remote, executor, path_src, 'rb'),
+            functools.partial(open, path_dst, 'r+b'),
+            size, count,
+        )
+        _check_digest(path_dst, self.sha256(path_src), file_sha256(path_dst))
         return path_dst
 
-    def put(self, path_src, path_dst):
+    def put(
+        self, path_src, path_dst, cache_dir=None, cache_size=None, link=True,
+        sparse=False, streams=1,
+    ):
         """
         Upload file from local system to Host
 
+        With cache_dir the upload is content addressed: file is stored in
+        cache directory on host under its sha256, and when it is there
+        already it is only placed to destination, without upload. Lookup
+        and placement take one command.
+
         Args:
             path_src (str): path to file on local system
             path_dst (str): path to file on remote system or directory
+            cache_dir (str): directory of cache on remote system
+            cache_size (int): limit of cache in bytes, least recently used
+                entries are removed when upload exceeds it
+            link (bool): hard link cache entry to destination when they are
+                on the same filesystem, else copy it. Linked file shares
+                content and attributes with the entry, so it must not be
+                modified in place.
+            sparse (bool): upload only data extents of file by tar stream,
+                holes are recreated in destination. Existing destination
+                keeps its inode and mode as without sparse.
+            streams (int): number of concurrent connections, each of them
+                uploads own range of file, None to choose by size of file.
+                Parallel upload is verified by checksum, it needs executor
+                with random access to files. Ignored with sparse.
 
         Returns:
             str: path to destination file
+
+        Raises:
+            ChecksumMismatch: if parallel upload corrupted file
         """
+        if cache_dir:
+            return self._put_cached(
+                path_src, path_dst, cache_dir, cache_size, link, sparse,
+                streams,
+            )
         if self.isdir(path_dst):
             path_dst = os.path.join(path_dst, os.path.basename(path_src))
-        with self.host.executor().session() as ss:
+        executor = self.host.executor()
+        with executor.session() as ss:
+            self._upload(executor, ss, path_src, path_dst, sparse, streams)
+        return path_dst
+
+    def _upload(self, executor, session, path_src, path_dst, sparse, streams):
+        if sparse:
+            with _local_sparse_file(path_src) as source:
+                self._write_sparse(executor, session, path_dst, source)
+            return
+        size = os.path.getsize(path_src)
+        count = 1
+        if session.random_access:
+            count = _stream_count(streams, size)
+        if count == 1:
             with open(path_src, 'rb') as rh:
-                with ss.open_file(path_dst, 'wb') as wh:
-                    wh.write(rh.read())
+                with session.open_file(path_dst, 'wb') as wh:
+                    _copy_file(rh, wh)
+            return
+        # ranges are written to empty file
+        with session.open_file(path_dst, 'wb'):
+            pass
+        _copy_ranges(
+            functools.partial(open, path_src, 'rb'),
+            functools.partial(_open_remote, executor, path_dst, 'r+b'),
+            size, count,
+        )
+        _check_digest(path_dst, file_sha256(path_src), self.sha256(path_dst))
+
+    def _put_cached(
+        self, path_src, path_dst, cache_dir, cache_size, link, sparse,
+        streams,
+    ):
+        digest = file_sha256(path_src)
+        entry = shlex.quote(os.path.join(cache_dir, digest))
+        place = (_CACHE_LINK if link else _CACHE_COPY).format(entry=entry)
+        executor = self.host.executor()
+        with executor.session() as ss:
+            out = self._run_script(
+                executor, ss, _CACHE_LOOKUP.format(
+                    cache=shlex.quote(cache_dir), dst=shlex.quote(path_dst),
+                    name=shlex.quote(os.path.basename(path_src)),
+                    entry=entry, place=place,
+                ),
+            ).out_bytes
+            path_dst, _, hit = out.partition(b'\0')
+            path_dst = normalize_string(path_dst)
+            if hit == b'hit':
+                self.logger.debug("Cache hit for %s: %s", path_src, digest)
+                return path_dst
+            tmp = os.path.join(
+                cache_dir, '%s.%s.tmp' % (digest, uuid.uuid4().hex[:8])
+            )
+            self._upload(executor, ss, path_src, tmp, sparse, streams)
+            script = "dst=%s; " % shlex.quote(path_dst) + _CACHE_STORE.format(
+                tmp=shlex.quote(tmp), entry=entry, place=place,
+            )
+            if cache_size is not None:
+                script += _CACHE_EVICT.format(
+                    cache=shlex.quote(cache_dir), limit=int(cache_size),
+                )
+            self._run_script(executor, ss, script)
         return path_dst
 
-    def transfer(self, path_src, target_host, path_dst):
+    def transfer(
+        self, path_src, target_host, path_dst, sparse=False, streams=1,
+    ):
         """
         Transfer file from one remote system (self) to other
         remote system (target_host).
@@ -257,19 +1442,267 @@ class FileSystem(Service):
             path_src (str): path to file on local system
             target_host (Host): target system
             path_dst (str): path to file on remote system or directory
+            sparse (bool): transfer only data extents of file by tar
+                streams, holes are recreated in destination
+            streams (int): number of concurrent connection pairs, each of
+                them transfers own range of file, None to choose by size
+                of file. Parallel transfer is verified by checksum, it needs
+                executors with random access to files.
 
         Returns:
             str: path to destination file
+
+        Raises:
+            ChecksumMismatch: if parallel transfer corrupted file
         """
         if target_host.fs.isdir(path_dst):
             path_dst = os.path.join(path_dst, os.path.basename(path_src))
-        with self.host.executor().session() as h1s:
-            with target_host.executor().session() as h2s:
+        executor = self.host.executor()
+        target_executor = target_host.executor()
+        with executor.session() as h1s:
+            with target_executor.session() as h2s:
+                if sparse:
+                    with self._read_sparse(executor, h1s, path_src) as source:
+                        target_host.fs._write_sparse(
+                            target_executor, h2s, path_dst, source,
+                        )
+                    return path_dst
                 with h1s.open_file(path_src, 'rb') as rh:
-                    with h2s.open_file(path_dst, 'wb') as wh:
-                        wh.write(rh.read())
+                    count = 1
+                    if (
+                        streams != 1 and h1s.random_access and
+                        h2s.random_access
+                    ):
+                        rh.seek(0, os.SEEK_END)
+                        size = rh.tell()
+                        count = _stream_count(streams, size)
+                        rh.seek(0)
+                    if count == 1:
+                        with h2s.open_file(path_dst, 'wb') as wh:
+                            _copy_file(rh, wh)
+                        return path_dst
+                # ranges are written to empty file
+                with h2s.open_file(path_dst, 'wb'):
+                    pass
+        _copy_ranges(
+            functools.partial(_open_remote, executor, path_src, 'rb'),
+            functools.partial(_open_remote, target_executor, path_dst, 'r+b'),
+            size, count,
+        )
+        _check_digest(
+            path_dst, self.sha256(path_src), target_host.fs.sha256(path_dst),
+        )
         return path_dst
 
+    def sha256(self, path):
+        """
+        Compute sha256 of file on host
+
+        Args:
+            path (str): path to file
+
+        Returns:
+            str: hex digest
+
+        Raises:
+            CommandExecutionFailure: if file can't be read
+        """
+        executor = self.host.executor()
+        with executor.session() as ss:
+            return self._run_script(
+                executor, ss, "sha256sum < %s" % shlex.quote(path),
+            ).out.split()[0]
+
+    @contextlib.contextmanager
+    def _read_sparse(self, executor, session, path):
+        """
+        Read file from host by 'tar --sparse', archive contains only data
+        extents of file
+
+        Returns:
+            _SparseFile: file with chunks read from archive stream
+
+        Raises:
+            CommandExecutionFailure: if tar fails
+            IOError: if path is not regular file
+        """
+        cmd = [
+            'tar', '-c', '--sparse', '--dereference', '-f', '-',
+            '-C', os.path.dirname(path) or '.', '--', os.path.basename(path),
+        ]
+        command = self._command(executor, session, cmd)
+        member = error = None
+        with command.execute() as (in_, out, err):
+            in_.close()
+            try:
+                with tarfile.open(
+                    fileobj=out, mode='r|', bufsize=READ_CHUNK,
+                ) as tar:
+                    member = tar.next()
+                    if member is not None and member.isfile():
+                        extents = member.sparse or [(0, member.size)]
+                        yield _SparseFile(
+                            member.size, extents,
+                            _read_extents(tar.fileobj, extents),
+                        )
+            except tarfile.ReadError as ex:
+                error = ex
+            out.close()
+            err = err.read()
+        # failure of tar is reported rather than state of archive
+        if command.rc:
+            raise errors.CommandExecutionFailure(
+                cmd=cmd, executor=executor, rc=command.rc,
+                err=normalize_string(err),
+            )
+        if error is not None:
+            raise error
+        if member is None or not member.isfile():
+            raise IOError("%s: not a regular file" % path)
+
+    def _write_sparse(self, executor, session, path, source):
+        """
+        Write file to host as PAX sparse member of tar stream, it is
+        extracted with holes next to destination and copied over it, so
+        existing file keeps its inode, owner and mode like with open_file
+        """
+        cmd = ['sh', '-c', _SPARSE_WRITE.format(
+            dir=shlex.quote(os.path.dirname(path) or '.'),
+            dst=shlex.quote(path),
+        )]
+        command = self._command(executor, session, cmd)
+        info, sparse_map = _sparse_tarinfo('data', source)
+        with command.execute() as (in_, _, err):
+            with tarfile.open(
+                fileobj=in_, mode='w|', bufsize=READ_CHUNK,
+                format=tarfile.PAX_FORMAT, **_TAR_COPY
+            ) as tar:
+                tar.addfile(info, _ChunkReader(sparse_map, source.chunks))
+            in_.close()
+            err = err.read()
+        if command.rc:
+            raise errors.CommandExecutionFailure(
+                cmd=cmd, executor=executor, rc=command.rc,
+                err=normalize_string(err),
+            )
+
+    def manifest(self, path, checksum=False):
+        """
+        Describe directory tree on host by single command, symbolic links
+        are not followed
+
+        Args:
+            path (str): path to directory
+            checksum (bool): compute sha256 of regular files on host
+
+        Returns:
+            dict: ManifestEntry items by path relative to directory, empty
+                when directory doesn't exist
+        """
+        executor = self.host.executor()
+        with executor.session() as ss:
+            return self._manifest(executor, ss, path, checksum)
+
+    def _manifest(self, executor, session, path, checksum):
+        script = _MANIFEST_SCRIPT % shlex.quote(path)
+        if checksum:
+            script += _MANIFEST_SUMS
+        return _parse_manifest(
+            self._run_script(executor, session, script).out_bytes
+        )
+
+    def sync(
+        self, local_dir, remote_dir, delete=False, dry_run=False,
+        checksum=False,
+    ):
+        """
+        Make remote directory same as local one, only added and changed
+        entries are transferred, all of them in one tar stream. Files differ
+        when size or mtime differ, mtime is preserved by transfer so files
+        are not sent again by following sync.
+
+        Args:
+            local_dir (str): path to local directory
+            remote_dir (str): path to directory on host, it is created when
+                missing
+            delete (bool): remove entries which are not in local directory
+            dry_run (bool): only compare, host is not modified
+            checksum (bool): compare content of files with the same size
+                instead of mtime, checksums are computed on host
+
+        Returns:
+            SyncResult: sorted relative paths of added, changed and deleted
+                entries
+
+        Raises:
+            CommandExecutionFailure: if host can't be listed or modified
+        """
+        local = local_manifest(local_dir)
+        executor = self.host.executor()
+        with executor.session() as ss:
+            remote = self._manifest(executor, ss, remote_dir, checksum)
+            added, changed, replaced, deleted = [], [], [], []
+            for rel in sorted(local):
+                entry, other = local[rel], remote.get(rel)
+                if other is None:
+                    added.append(rel)
+                elif other.type != entry.type:
+                    changed.append(rel)
+                    replaced.append(rel)
+                elif _differs(local_dir, rel, entry, other):
+                    changed.append(rel)
+            if delete:
+                # content of removed directory goes with it
+                deleted = [
+                    rel for rel in sorted(remote)
+                    if rel not in local and (
+                        os.path.dirname(rel) in local or
+                        not os.path.dirname(rel)
+                    )
+                ]
+            result = SyncResult(added, changed, deleted)
+            if dry_run:
+                return result
+            if replaced or deleted:
+                self._run_script(
+                    executor, ss,
+                    "cd %s && xargs -0r rm -rf --" % shlex.quote(remote_dir),
+                    input_='\0'.join(replaced + deleted),
+                )
+            if added or changed:
+                self._send_tar(
+                    executor, ss, local_dir, remote_dir,
+                    sorted(added + changed),
+                )
+        return result
+
+    def _send_tar(self, executor, session, local_dir, remote_dir, paths):
+        """
+        Send entries of local directory to host in one tar stream
+        """
+        script = "mkdir -p {0} && tar -x --no-same-owner -C {0} -f -".format(
+            shlex.quote(remote_dir)
+        )
+        cmd = ['sh', '-c', script]
+        command = self._command(executor, session, cmd)
+        with command.execute() as (in_, _, err):
+            with tarfile.open(
+                fileobj=in_, mode='w|', bufsize=READ_CHUNK,
+                format=tarfile.PAX_FORMAT,
+            ) as tar:
+                for rel in paths:
+                    tar.add(
+                        os.path.join(local_dir, rel), arcname=rel,
+                        recursive=False,
+                    )
+            in_.close()
+            err = err.read()
+        if command.rc:
+            raise errors.CommandExecutionFailure(
+                cmd=cmd, executor=executor, rc=command.rc,
+                err=normalize_string(err),
+            )
+
     def wget(self, url, output_file, progress_handler=None):
         """
         Download file on the host from given url
@@ -439,3 +1872,204 @@ class MountPoint(Resource):
         if rc:
             raise errors.FailToRemount(self, out, err)
         self.opts = opts
+
+
+class LogFollower(Resource):
+    """
+    Follows files on hosts by 'tail -F', with one long running command
+    per host. Lines are passed through queue of limited size, when it is
+    full reading waits and output stays buffered on hosts.
+
+    When command fails or ends, it is started again after reconnect_delay
+    and following continues from byte offset after the last queued line.
+    Lines can be repeated when file was rotated meanwhile.
+    """
+    def __init__(
+        self, hosts, paths, offsets=None, from_start=False,
+        buffer_size=10000, reconnect_delay=5.0,
+    ):
+        """
+        Args:
+            hosts (list): hosts to follow files on
+            paths (list): paths to files
+            offsets (dict): {(ip, path): offset} to continue from, e.g.
+                offsets of previous follower
+            from_start (bool): read files from beginning instead of
+                following only new lines, unless offset is given
+            buffer_size (int): maximal number of lines waiting in queue
+            reconnect_delay (float): seconds to wait before reconnecting
+        """
+        super(LogFollower, self).__init__()
+        self.hosts = list(hosts)
+        self.paths = list(paths)
+        self.reconnect_delay = reconnect_delay
+        self._queue = queue.Queue(buffer_size)
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._threads = []
+        self._inputs = {}
+        start = 0 if from_start else -1
+        self._offsets = dict(
+            ((h.ip, p), start) for h in self.hosts for p in self.paths
+        )
+        self._offsets.update(offsets or {})
+
+    @property
+    def offsets(self):
+        """
+        Returns:
+            dict: {(ip, path): offset} of byte after the last queued line,
+                -1 when following didn't start yet
+        """
+        with self._lock:
+            return dict(self._offsets)
+
+    def start(self):
+        for host in self.hosts:
+            thread = threading.Thread(target=self._follow, args=(host,))
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=10):
+        """
+        Stop following, lines which are already queued can still be read
+
+        Args:
+            timeout (float): seconds to wait for commands to finish
+        """
+        self._stopped.set()
+        with self._lock:
+            inputs = list(self._inputs.values())
+        for in_ in inputs:
+            in_.close()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, type_, value, tb):
+        self.stop()
+
+    def __iter__(self):
+        while True:
+            try:
+                yield self._queue.get(timeout=0.5)
+            except queue.Empty:
+                if self._stopped.is_set():
+                    return
+
+    def run(self, callback):
+        """
+        Pass lines to callback until it returns False
+
+        Args:
+            callback (func): function called with each FollowedLine
+        """
+        for item in self:
+            if callback(item) is False:
+                break
+
+    def _script(self, host):
+        with self._lock:
+            offsets = [self._offsets[(host.ip, p)] for p in self.paths]
+        return FOLLOW_SCRIPT % "\n".join(
+            "follow %d %s %d &" % (i, shlex.quote(path), offset)
+            for i, (path, offset) in enumerate(zip(self.paths, offsets))
+        )
+
+    def _follow(self, host):
+        while not self._stopped.is_set():
+            try:
+                self._follow_once(host)
+            except Exception as ex:
+                if self._stopped.is_set():
+                    break
+                self.logger.warning(
+                    "Following of files on %s failed: %s", host, ex
+                )
+            else:
+                if self._stopped.is_set():
+                    break
+                self.logger.warning("Following of files on %s ended", host)
+            self._stopped.wait(self.reconnect_delay)
+
+    def _follow_once(self, host):
+        executor = host.executor()
+        script = self._script(host)
+        if executor.sudo:
+            script = "sudo sh -c %s" % shlex.quote(script)
+        with executor.session() as ss:
+            command = ss.command(['sh'])
+            command.cmd = script
+            with command.execute() as (in_, out, _):
+                with self._lock:
+                    self._inputs[host] = in_
+                try:
+                    if self._stopped.is_set():
+                        in_.close()
+                    pending = b''
+                    while True:
+                        data = _read_available(out)
+                        if not data:
+                            break
+                        lines = (pending + data).split(b'\n')
+                        pending = lines.pop()
+                        for line in lines:
+                            self._handle(host, line)
+                finally:
+                    with self._lock:
+                        self._inputs.pop(host, None)
+
+    def _handle(self, host, line):
+        match = _FOLLOWED_LINE.match(line)
+        if match is None:
+            self.logger.debug("Unexpected output on %s: %r", host, line)
+            return
+        path = self.paths[int(match.group(1))]
+        kind, data = match.group(2), match.group(3)
+        key = (host.ip, path)
+        if kind == b'@':
+            with self._lock:
+                self._offsets[key] = int(data)
+        elif kind == b'!':
+            self.logger.debug("%s: %s", host, normalize_string(data))
+            if any(word in data for word in _FOLLOW_RESET):
+                with self._lock:
+                    self._offsets[key] = 0
+        elif self._put(FollowedLine(host, path, normalize_string(data))):
+            with self._lock:
+                self._offsets[key] += len(data) + 1
+
+    def _put(self, item):
+        while not self._stopped.is_set():
+            try:
+                self._queue.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+
+def follow(hosts, paths, callback=None, **kwargs):
+    """
+    Follow files on several hosts, see LogFollower
+
+    Args:
+        hosts (list): hosts to follow files on
+        paths (list): paths to files
+        callback (func): function called with each FollowedLine, it stops
+            following by returning False
+        kwargs (dict): parameters of LogFollower
+
+    Returns:
+        LogFollower: follower to use in with statement, None when callback
+            is given, the call then blocks until callback stops
+    """
+    follower = LogFollower(hosts, paths, **kwargs)
+    if callback is None:
+        return follower
+    with follower:
+        follower.run(callback)
@@ -1,6 +1,188 @@
+import contextlib
+import shlex
+
+import netaddr
+
+from rrmngmnt import errors
 from rrmngmnt.service import Service
 
 IPTABLES = 'iptables'
+IPTABLES_RESTORE = 'iptables-restore'
+IPSET = 'ipset'
+APPEND = '--append'
+INSERT = '--insert'
+DELETE = '--delete'
+SET_DIRECTIONS = {
+    '--destination': 'dst',
+    '--source': 'src',
+}
+
+
+class Rule(object):
+    """
+    Structured representation of one iptables rule.
+
+    Options are kept normalized to the form printed by 'iptables -S', so
+    rules built by Chain compare equal to rules listed from the host.
+    """
+    long_options = {
+        '--source': '-s',
+        '--destination': '-d',
+        '--protocol': '-p',
+        '--jump': '-j',
+        '--goto': '-g',
+        '--match': '-m',
+        '--in-interface': '-i',
+        '--out-interface': '-o',
+        '--fragment': '-f',
+    }
+    address_options = ('-s', '-d')
+
+    def __init__(self, chain, options):
+        """
+        Args:
+            chain (str): name of the chain the rule belongs to
+            options (list): list of (option, values) tuples, values is
+                a tuple of option arguments. Negated options are prefixed
+                with '!'.
+        """
+        super(Rule, self).__init__()
+        self.chain = chain
+        self.options = [self._normalize(o, v) for o, v in options]
+        self.options = [(o, v) for o, v in self.options if o is not None]
+
+    @classmethod
+    def _normalize(cls, option, values):
+        negate = option.startswith('!')
+        name = cls.long_options.get(option.lstrip('!'), option.lstrip('!'))
+        values = tuple(values)
+        if name == '-p' and values:
+            values = (values[0].lower(),)
+            if values == ('all',) and not negate:
+                return None, None
+        if name in cls.address_options and values and ',' not in values[0]:
+            try:
+                values = (str(netaddr.IPNetwork(values[0])),)
+            except (netaddr.AddrFormatError, ValueError):
+                pass
+        return ('!' if negate else '') + name, values
+
+    @staticmethod
+    def _parse_options(tokens):
+        options = []
+        negate = False
+        for token in tokens:
+            if token == '!':
+                negate = True
+            elif token.startswith('-') and not token[1:].isdigit():
+                options.append(('!' + token if negate else token, []))
+                negate = False
+            elif options:
+                options[-1][1].append(token)
+        return options
+
+    @classmethod
+    def parse(cls, line):
+        """
+        Parse rule from the output of 'iptables --list-rules'
+
+        Args:
+            line (str): rule specification, for example
+                '-A OUTPUT -d 2.2.2.2/32 -j DROP'
+
+        Returns:
+            Rule: parsed rule, None for lines which are not rules (chain
+                policies and definitions)
+        """
+        tokens = shlex.split(line)
+        if len(tokens) < 2 or tokens[0] not in ('-A', APPEND):
+            return None
+        return cls(tokens[1], cls._parse_options(tokens[2:]))
+
+    @classmethod
+    def from_spec(cls, chain, spec):
+        """
+        Create rules from iptables command line options.
+
+        Comma separated address lists are expanded to one rule per address,
+        the same way iptables itself does.
+
+        Args:
+            chain (str): name of the chain
+            spec (list): command line options, for example
+                ['--destination', '2.2.2.2', '--jump', 'DROP']
+
+        Returns:
+            list: list of Rule objects
+        """
+        rules = [cls(chain, cls._parse_options(spec))]
+        for option in cls.address_options:
+            expanded = []
+            for rule in rules:
+                values = dict(rule.options).get(option)
+                if not values or ',' not in values[0]:
+                    expanded.append(rule)
+                    continue
+                for address in values[0].split(','):
+                    expanded.append(
+                        cls(
+                            chain,
+                            [
+                                (o, (address,) if o == option else v)
+                                for o, v in rule.options
+                            ]
+                        )
+                    )
+            rules = expanded
+        return rules
+
+    def _key(self):
+        return self.chain, tuple(sorted(self.options))
+
+    def __eq__(self, other):
+        if not isinstance(other, Rule):
+            return NotImplemented
+        return self._key() == other._key()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self._key())
+
+    def spec(self):
+        """
+        Returns:
+            str: rule options in the form accepted by iptables
+        """
+        args = []
+        for option, values in self.options:
+            if option.startswith('!'):
+                args.append('!')
+                option = option[1:]
+            args.append(option)
+            args.extend(shlex.quote(value) for value in values)
+        return " ".join(args)
+
+    def to_command(self, action=APPEND, rule_num=None):
+        """
+        Args:
+            action (str): APPEND, INSERT or DELETE
+            rule_num (str): position of inserted rule
+
+        Returns:
+            str: line in the iptables-restore format
+        """
+        command = "%s %s" % (action, self.chain)
+        if rule_num:
+            command += " %s" % rule_num
+        return "%s %s" % (command, self.spec())
+
+    def __str__(self):
+        return self.to_command()
+
+    def __repr__(self):
+        return "Rule(%s)" % self
 
 
 class Firewall(Service):
@@ -14,6 +196,7 @@ class Firewall(Service):
         """
         super(Firewall, self).__init__(host)
         self.host = host
+        self._batch = None
 
     def is_active(self, firewall_service):
         """
@@ -38,21 +221,131 @@ class Firewall(Service):
             chain: Chain class object
 
         """
-        return Chain(self.host, chain_name)
+        return Chain(self.host, chain_name, batch=self._batch)
+
+    def ipset(self, name, set_type='hash:ip', options=None):
+        """
+        Return IPSet class to manage named set of addresses or ports
+
+        Args:
+            name (str): Name of the set
+            set_type (str): Type of the set, e.g. 'hash:ip', 'hash:net' or
+                'bitmap:port'
+            options (dict): Create options of the set, e.g.
+                {'maxelem': 262144}
+
+        Returns:
+            IPSet: IPSet class object
+        """
+        return IPSet(self.host, name, set_type, options)
+
+    def get_rules(self, chain_name=None):
+        """
+        List existing rules as structured objects
+
+        Args:
+            chain_name (str): Name of the chain, all chains when None
+
+        Returns:
+            list: List of Rule objects
+        """
+        cmd = [IPTABLES, '--list-rules']
+        if chain_name:
+            cmd.append(chain_name.upper())
+        rules = self.host.executor().run_cmd(cmd)[1]
+        rules = [Rule.parse(line) for line in rules.splitlines()]
+        return [rule for rule in rules if rule is not None]
+
+    @contextlib.contextmanager
+    def transaction(self, diff=True):
+        """
+        Collect changes done through chains of this firewall and apply them
+        atomically by single 'iptables-restore --noflush' call
+
+        Args:
+            diff (bool): Compare changes with existing rules first and send
+                only real changes: rules already present are not added again
+                and missing rules are not deleted
+
+        Yields:
+            Firewall: this instance, chains created by its chain method
+                queue their changes
+
+        Raises:
+            CommandExecutionFailure: If applying of the changes failed
+
+        Example:
+            with host.firewall.transaction() as fw:
+                chain = fw.chain('OUTPUT')
+                for address in addresses:
+                    chain.add_rule({'address': [address]}, 'DROP')
+        """
+        if self._batch is not None:
+            raise RuntimeError("Transaction is already in progress")
+        self._batch = []
+        try:
+            yield self
+            batch = self._batch
+        finally:
+            self._batch = None
+
+        lines = self._restore_lines(batch, self.get_rules() if diff else None)
+        if not lines:
+            self.logger.info("No firewall changes to apply")
+            return
+        self.logger.info("Applying %d firewall changes", len(lines))
+        cmd = [IPTABLES_RESTORE, '--noflush']
+        script = "\n".join(['*filter'] + lines + ['COMMIT']) + "\n"
+        host_executor = self.host.executor()
+        rc, _, err = host_executor.run_cmd(cmd, input_=script)
+        if rc:
+            raise errors.CommandExecutionFailure(
+                cmd=cmd, executor=host_executor, rc=rc, err=err
+            )
+
+    @staticmethod
+    def _restore_lines(batch, current=None):
+        """
+        Args:
+            batch (list): list of (action, rule_num, rule) tuples
+            current (list): existing rules to compare with, None to skip
+                comparison
+
+        Returns:
+            list: lines in the iptables-restore format
+        """
+        if current is not None:
+            current = set(current)
+        lines = []
+        for action, rule_num, rule in batch:
+            if current is not None:
+                if action == DELETE:
+                    if rule not in current:
+                        continue
+                    current.discard(rule)
+                else:
+                    if rule in current:
+                        continue
+                    current.add(rule)
+            lines.append(rule.to_command(action, rule_num))
+        return lines
 
 
 class Chain(Service):
     """
     Class for Firewall specific chain commands
     """
-    def __init__(self, host, chain_name):
+    def __init__(self, host, chain_name, batch=None):
         """
         Args:
             host (host): Host object to run commands on
             chain_name (str): Name of the firewall chain
+            batch (list): Queue of changes of running Firewall.transaction,
+                changes are applied immediately when None
         """
         super(Chain, self).__init__(host)
         self.host = host
+        self._batch = batch
         self.firewall_service = IPTABLES
         self.chain_name = chain_name.upper()
         if self.chain_name == 'OUTPUT':
@@ -64,7 +357,7 @@ class Chain(Service):
 
     def edit_chain(
         self, action, chain_name, address_type, dest, target, protocol='all',
-        ports=None, rule_num=None
+        ports=None, rule_num=None, port_set=None
     ):
         """
         Changes firewall configuration
@@ -75,15 +368,20 @@ class Chain(Service):
            address_type (str): '--destination' for outgoing rules,
                '--source' for incoming
            dest (dict): 'address' key and value containing destination host or
-               list of destination hosts
+               list of destination hosts, or 'set' key and name of ipset
+               with the hosts as value
            target (str): target rule to apply
            protocol (str): affected network protocol, Default is 'all'
            ports (list): list of ports to configure
            rule_num (str): the number given after the chain name indicates the
            position where the rule will be inserted
+           port_set (str): name of ipset with destination ports to configure,
+               use it for more than 15 ports
 
        Returns:
-           bool: True if configuration change succeeded, False otherwise
+           bool: True if configuration change succeeded, False otherwise.
+               Inside of Firewall.transaction the change is only queued and
+               True is returned.
 
        Raises:
            NotImplementedError: In case the users specifies more than 15 ports
@@ -105,26 +403,38 @@ class Chain(Service):
         if rule_num:
             cmd.extend([rule_num])
 
-        dest = ",".join(dest['address'])
-        cmd.extend(
-            [
-                address_type, dest, '--jump', target.upper(),
-                '--protocol', protocol
-            ]
-        )
+        if 'set' in dest:
+            cmd.extend(
+                [
+                    '--match', 'set', '--match-set', dest['set'],
+                    SET_DIRECTIONS[address_type],
+                ]
+            )
+        else:
+            cmd.extend([address_type, ",".join(dest['address'])])
+        cmd.extend(['--jump', target.upper(), '--protocol', protocol])
+
+        if (ports or port_set) and protocol.lower() == 'all':
+            # Adjust the protocol type, port matches require specific type
+            cmd[-1] = 'tcp'
 
         if ports:
             # Iptables multiport module accepts up to 15 ports
             if len(ports) > 15:
-                raise NotImplementedError("Up to 15 ports can be specified")
+                raise NotImplementedError(
+                    "Up to 15 ports can be specified, use port_set instead"
+                )
             ports = ",".join(ports)
+            cmd.extend(['--match', 'multiport', '--dports', ports])
 
-            if protocol.lower() == 'all':
-                # Adjust the protocol type, '--dports' option requires specific
-                # type
-                cmd[-1] = 'tcp'
+        if port_set:
+            cmd.extend(['--match', 'set', '--match-set', port_set, 'dst'])
 
-            cmd.extend(['--match', 'multiport', '--dports', ports])
+        if self._batch is not None:
+            spec = cmd[4:] if rule_num else cmd[3:]
+            for rule in Rule.from_spec(chain_name, spec):
+                self._batch.append((action, rule_num, rule))
+            return True
 
         return not self.host.executor().run_cmd(cmd)[0]
 
@@ -139,36 +449,50 @@ class Chain(Service):
         rules = self.host.executor().run_cmd(cmd)[1]
         return rules.splitlines()
 
-    def add_rule(self, dest, target, protocol='all', ports=None):
+    def get_rules(self):
+        """
+        List all existing rules in a specific Chain as structured objects
+
+        Returns:
+            list: List of Rule objects
+        """
+        return Firewall(self.host).get_rules(self.chain_name)
+
+    def add_rule(self, dest, target, protocol='all', ports=None,
+                 port_set=None):
         """
         Add new firewall rule to a specific chain
 
         Args:
             dest (dict): 'address' key and value containing destination host or
-               list of destination hosts
+               list of destination hosts, or 'set' key and name of ipset
+               with the hosts as value
             target (str): Target rule to apply
             protocol (str): affected network protocol, Default is 'all'
             ports (list): list of ports to configure
+            port_set (str): name of ipset with destination ports
 
         Returns:
             bool: False if adding new rule failed, True if it succeeded
         """
         return self.edit_chain(
-            '--append', self.chain_name, self.address_type, dest, target,
-            protocol, ports
+            APPEND, self.chain_name, self.address_type, dest, target,
+            protocol, ports, port_set=port_set
         )
 
     def insert_rule(self, dest, target, protocol='all', ports=None,
-                    rule_num=None):
+                    rule_num=None, port_set=None):
         """
         Insert new firewall rule to a specific chain
 
         Args:
             dest (dict): 'address' key and value containing destination host or
-               list of destination hosts
+               list of destination hosts, or 'set' key and name of ipset
+               with the hosts as value
             target (str): Target rule to apply
             protocol (str): affected network protocol, Default is 'all'
             ports (list): list of ports to configure
+            port_set (str): name of ipset with destination ports
             rule_num (str): the number given after the chain name indicates
             the position where the rule will be inserted. If the rule_num is
             not given , the new rule is inserted in the line 1.
@@ -177,27 +501,30 @@ class Chain(Service):
             bool: False if inserting new rule failed, True if it succeeded
         """
         return self.edit_chain(
-            '--insert', self.chain_name, self.address_type, dest, target,
-            protocol, ports, rule_num
+            INSERT, self.chain_name, self.address_type, dest, target,
+            protocol, ports, rule_num, port_set
         )
 
-    def delete_rule(self, dest, target, protocol='all', ports=None):
+    def delete_rule(self, dest, target, protocol='all', ports=None,
+                    port_set=None):
         """
         Delete existing firewall rule from a specific chain
 
         Args:
             dest (dict): 'address' key and value containing destination host or
-               list of destination hosts
+               list of destination hosts, or 'set' key and name of ipset
+               with the hosts as value
             target (str): Target rule to apply
             protocol (str): affected network protocol, Default is 'all'
             ports (list): list of ports to configure
+            port_set (str): name of ipset with destination ports
 
         Returns:
             bool: False if deleting rule failed, True if it succeeded
         """
         return self.edit_chain(
-            '--delete', self.chain_name, self.address_type, dest, target,
-            protocol, ports
+            DELETE, self.chain_name, self.address_type, dest, target,
+            protocol, ports, port_set=port_set
         )
 
     def clean_rules(self):
@@ -209,3 +536,147 @@ class Chain(Service):
         """
         cmd = [self.firewall_service, '--flush', self.chain_name]
         return not self.host.executor().run_cmd(cmd)[0]
+
+
+class IPSet(Service):
+    """
+    Class for named ipset sets, which can be matched by single Chain rule
+    regardless of their size
+
+    Example:
+        blocked = host.firewall.ipset('blocked', 'hash:net')
+        blocked.replace(storage_networks)
+        host.firewall.chain('OUTPUT').add_rule({'set': 'blocked'}, 'DROP')
+    """
+    default_options = {
+        'bitmap:port': {'range': '0-65535'},
+    }
+
+    def __init__(self, host, name, set_type='hash:ip', options=None):
+        """
+        Args:
+            host (host): Host object to run commands on
+            name (str): Name of the set
+            set_type (str): Type of the set, e.g. 'hash:ip', 'hash:net' or
+                'bitmap:port'
+            options (dict): Create options of the set
+        """
+        super(IPSet, self).__init__(host)
+        self.name = name
+        self.set_type = set_type
+        if options is None:
+            options = self.default_options.get(set_type, {})
+        self.options = options
+
+    def _create_line(self, name):
+        line = "create %s %s" % (name, self.set_type)
+        for option, value in self.options.items():
+            line += " %s %s" % (option, value)
+        return line
+
+    def _restore(self, lines):
+        """
+        Apply lines in the 'ipset restore' format by single call
+
+        Args:
+            lines (list): restore commands
+
+        Raises:
+            CommandExecutionFailure: If ipset failed
+        """
+        cmd = [IPSET, '-exist', 'restore']
+        host_executor = self.host.executor()
+        rc, _, err = host_executor.run_cmd(
+            cmd, input_="\n".join(lines) + "\n"
+        )
+        if rc:
+            raise errors.CommandExecutionFailure(
+                cmd=cmd, executor=host_executor, rc=rc, err=err
+            )
+
+    def create(self):
+        """
+        Create the set, existing set is kept as it is
+
+        Raises:
+            CommandExecutionFailure: If ipset failed
+        """
+        self._restore([self._create_line(self.name)])
+
+    def add(self, members):
+        """
+        Add members to the set, the set is created when it doesn't exist
+
+        Args:
+            members (list): addresses, networks or ports to add
+
+        Raises:
+            CommandExecutionFailure: If ipset failed
+        """
+        lines = [self._create_line(self.name)]
+        lines.extend("add %s %s" % (self.name, m) for m in members)
+        self._restore(lines)
+
+    def delete(self, members):
+        """
+        Delete members from the set, missing members are ignored
+
+        Args:
+            members (list): addresses, networks or ports to delete
+
+        Raises:
+            CommandExecutionFailure: If ipset failed
+        """
+        self._restore(["del %s %s" % (self.name, m) for m in members])
+
+    def _replace_lines(self, members):
+        tmp_name = "%s-tmp" % self.name[:27]
+        lines = [
+            self._create_line(self.name),
+            self._create_line(tmp_name),
+            "flush %s" % tmp_name,
+        ]
+        lines.extend("add %s %s" % (tmp_name, m) for m in members)
+        lines.extend(
+            ["swap %s %s" % (tmp_name, self.name), "destroy %s" % tmp_name]
+        )
+        return lines
+
+    def replace(self, members):
+        """
+        Atomically replace content of the set, the new content is filled
+        into temporary set which is then swapped with this one
+
+        Args:
+            members (list): addresses, networks or ports of the set
+
+        Raises:
+            CommandExecutionFailure: If ipset failed
+        """
+        self._restore(self._replace_lines(members))
+
+    def list_members(self):
+        """
+        List members of the set
+
+        Returns:
+            list: List of members, empty when the set doesn't exist
+        """
+        rc, out, _ = self.host.executor().run_cmd([IPSET, 'save', self.name])
+        if rc:
+            return []
+        prefix = "add %s " % self.name
+        return [
+            line[len(prefix):].strip() for line in out.splitlines()
+            if line.startswith(prefix)
+        ]
+
+    def destroy(self):
+        """
+        Destroy the set, it must not be referenced by any rule
+
+        Returns:
+            bool: True if succeeded, False otherwise
+        """
+        cmd = [IPSET, 'destroy', self.name]
+        return not self.host.executor().run_cmd(cmd)[0]
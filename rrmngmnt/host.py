@@ -9,21 +9,30 @@ import socket
 import threading
 import warnings
 
-import netaddr
-
 from rrmngmnt import errors
-from rrmngmnt import power_manager
-from rrmngmnt import ssh
 from rrmngmnt.common import fqdn2ip
-from rrmngmnt.filesystem import FileSystem
-from rrmngmnt.firewall import Firewall
-from rrmngmnt.network import Network
 from rrmngmnt.operatingsystem import OperatingSystem
 from rrmngmnt.package_manager import PackageManagerProxy
-from rrmngmnt.playbook_runner import PlaybookRunner
 from rrmngmnt.resource import Resource
 from rrmngmnt.service import Systemd, SysVinit, InitCtl
-from rrmngmnt.storage import NFSService, LVMService
+
+# Modules of services, paramiko and netaddr are imported when they are
+# used first time, so importing rrmngmnt stays cheap.
+
+
+class _DefaultExecutorFactory(object):
+    """
+    Creates default RemoteExecutorFactory on first access, assignment to
+    class or instance replaces it as any other attribute.
+    """
+    def __init__(self):
+        self._factory = None
+
+    def __get__(self, obj, objtype=None):
+        if self._factory is None:
+            from rrmngmnt import ssh
+            self._factory = ssh.RemoteExecutorFactory()
+        return self._factory
 
 
 class Host(Resource):
@@ -41,7 +50,11 @@ class Host(Resource):
         SysVinit,
         InitCtl,
     ]
-    executor_factory = ssh.RemoteExecutorFactory()
+    executor_factory = _DefaultExecutorFactory()
+    # Used instead of default SSH when the host is this machine and the
+    # executor user runs this process, e.g. LocalExecutorFactory(). It is
+    # opt-in, None always connects via SSH.
+    local_executor_factory = None
 
     class LoggerAdapter(Resource.LoggerAdapter):
         """
@@ -69,6 +82,7 @@ class Host(Resource):
             # When using ProxyCommand host is not IP and does not have fqdn.
             ip = hostname
         else:
+            import netaddr
             if not netaddr.valid_ipv4(ip) and not netaddr.valid_ipv6(ip):
                 ip = fqdn2ip(ip)
 
@@ -131,6 +145,7 @@ class Host(Resource):
                 (power_manager.SSH_TYPE for example)
             init_params (dict): power manager init parameters
         """
+        from rrmngmnt import power_manager
         self._power_managers[pm_type] = getattr(
             power_manager, power_manager.MANAGERS[pm_type]
         )(self, **init_params)
@@ -244,13 +259,30 @@ class Host(Resource):
             ef.use_pkey = pkey
             return ef.build(self, user, self.sudo)
 
-        return self.executor_factory.build(
+        factory = self.executor_factory
+        if self._runs_locally(factory, user):
+            factory = self.local_executor_factory
+        return factory.build(
             self, user, sudo=self.sudo
         )
 
+    def _runs_locally(self, factory, user):
+        """
+        Local executor replaces plain SSH to default port only, so
+        tunnels and forwarded ports keep working.
+        """
+        from rrmngmnt import ssh
+        if self.local_executor_factory is None:
+            return False
+        if not isinstance(factory, ssh.RemoteExecutorFactory):
+            return False
+        if factory.port != 22 or factory.sock:
+            return False
+        return self.local_executor_factory.can_handle(self, user)
+
     def run_command(
         self, command, input_=None, tcp_timeout=None, io_timeout=None,
-        user=None, pkey=False,
+        user=None, pkey=False, discard_output=False,
     ):
         """
         Run command on host
@@ -260,20 +292,26 @@ class Host(Resource):
             input_ (str): input data
             tcp_timeout (float): tcp timeout
             `io_timeout (float): timeout for data operation (read/write)
+            discard_output (bool): drop stdout on host, only rc and err are of
+                interest
 
         Returns:
-            tuple: tuple of (rc, out, err)
+            CommandResult: (rc, out, err), it behaves as tuple
         """
         self.logger.info("Executing command %s", ' '.join(command))
-        rc, out, err = self.executor(user=user, pkey=pkey).run_cmd(
+        kwargs = {}
+        if discard_output:
+            kwargs['discard_output'] = True
+        result = self.executor(user=user, pkey=pkey).run_cmd(
             command, input_=input_, tcp_timeout=tcp_timeout,
-            io_timeout=io_timeout
+            io_timeout=io_timeout, **kwargs
         )
-        if rc:
+        if result[0]:
             self.logger.error(
-                "Failed to run command %s ERR: %s OUT: %s", command, err, out
+                "Failed to run command %s ERR: %s OUT: %s",
+                command, result[2], result[1],
             )
-        return rc, out, err
+        return result
 
     def copy_to(self, resource, src, dst, mode=None, ownership=None):
         """
@@ -361,6 +399,7 @@ class Host(Resource):
             str: Ssh public key
 
         """
+        from rrmngmnt import ssh
         if user is None:
             user = copy.copy(self.root_user)
         id_rsa_pub = ssh.ID_RSA_PUB % os.path.expanduser(
@@ -394,6 +433,7 @@ class Host(Resource):
         Returns:
             bool: True/false
         """
+        from rrmngmnt import ssh
         if user is None:
             user = copy.copy(self.root_user)
         known_hosts = ssh.KNOWN_HOSTS % os.path.expanduser(
@@ -419,6 +459,7 @@ class Host(Resource):
         Returns:
             bool: True/false
         """
+        from rrmngmnt import ssh
         if user is None:
             user = copy.copy(self.root_user)
         authorized_keys = ssh.AUTHORIZED_KEYS % os.path.expanduser(
@@ -460,6 +501,7 @@ class Host(Resource):
             return dict([(x, None) for x in values])
 
     def get_network(self):
+        from rrmngmnt.network import Network
         return Network(self)
 
     @property
@@ -468,18 +510,22 @@ class Host(Resource):
 
     @property
     def nfs(self):
+        from rrmngmnt.storage import NFSService
         return NFSService(self)
 
     @property
     def lvm(self):
+        from rrmngmnt.storage import LVMService
         return LVMService(self)
 
     @property
     def fs(self):
+        from rrmngmnt.filesystem import FileSystem
         return FileSystem(self)
 
     @property
     def playbook(self):
+        from rrmngmnt.playbook_runner import PlaybookRunner
         return PlaybookRunner(self)
 
     @property
@@ -534,4 +580,5 @@ class Host(Resource):
 
     @property
     def firewall(self):
+        from rrmngmnt.firewall import Firewall
         return Firewall(self)
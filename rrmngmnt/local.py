@@ -0,0 +1,479 @@
+"""
+This module provides executor which runs commands on the controller itself,
+without SSH connection.
+"""
+import contextlib
+import getpass
+import logging
+import os
+import socket
+import subprocess
+import threading
+
+from rrmngmnt import metrics
+from rrmngmnt.common import normalize_string
+from rrmngmnt.executor import Executor, ExecutorFactory
+
+SHELL = '/bin/bash'
+
+_local_addresses = {}
+
+
+def is_local_address(address):
+    """
+    Check if address belongs to one of interfaces of this machine
+
+    Args:
+        address (str): IP address
+
+    Returns:
+        bool: True if the address is local, False otherwise
+    """
+    if address not in _local_addresses:
+        import netaddr
+        local = False
+        if netaddr.valid_ipv4(address) or netaddr.valid_ipv6(address):
+            ip = netaddr.IPAddress(address)
+            family = socket.AF_INET6 if ip.version == 6 else socket.AF_INET
+            try:
+                # Only addresses assigned to this machine can be bound
+                with contextlib.closing(socket.socket(family)) as sock:
+                    sock.bind((address, 0))
+                local = True
+            except (OSError, socket.error):
+                local = False
+        _local_addresses[address] = local
+    return _local_addresses[address]
+
+
+def current_user():
+    """
+    Returns:
+        str: name of user which runs this process
+    """
+    return getpass.getuser()
+
+
+class _Output(object):
+    """
+    Behaves like stream of SSH channel: output of process is buffered by
+    background thread, so process is not blocked by stream which is not
+    being read, read returns bytes and readline returns decoded line.
+    """
+    chunk_size = 64 * 1024
+    max_buffer = 2 * 1024 * 1024
+
+    def __init__(self, fh):
+        self._fh = fh
+        self._buffer = bytearray()
+        self._eof = False
+        self.closed = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._pump)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _pump(self):
+        try:
+            while True:
+                chunk = os.read(self._fh.fileno(), self.chunk_size)
+                if not chunk:
+                    break
+                with self._cond:
+                    self._cond.wait_for(
+                        lambda: self.closed or
+                        len(self._buffer) < self.max_buffer
+                    )
+                    if not self.closed:
+                        self._buffer += chunk
+                    self._cond.notify_all()
+        finally:
+            self._fh.close()
+            with self._cond:
+                self._eof = True
+                self._cond.notify_all()
+
+    def _take(self, size=-1, line=False):
+        """
+        Take data from buffer, as it is limited, data are collected while
+        the process keeps writing.
+        """
+        data = bytearray()
+        with self._cond:
+            while size < 0 or len(data) < size:
+                self._cond.wait_for(lambda: self._eof or self._buffer)
+                if not self._buffer:
+                    break
+                end = len(self._buffer)
+                if line:
+                    end = self._buffer.find(b'\n') + 1 or end
+                if size >= 0:
+                    end = min(end, size - len(data))
+                data += self._buffer[:end]
+                del self._buffer[:end]
+                self._cond.notify_all()
+                if line and data.endswith(b'\n'):
+                    break
+        return bytes(data)
+
+    def read(self, size=-1):
+        return self._take(-1 if size is None else size)
+
+    def read1(self, size=-1):
+        """
+        Read data which are available, wait only when there are none
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._eof or self._buffer)
+            end = len(self._buffer) if size < 0 else size
+            data = bytes(self._buffer[:end])
+            del self._buffer[:end]
+            self._cond.notify_all()
+        return data
+
+    def readline(self, size=-1):
+        return normalize_string(self._take(size, line=True))
+
+    def readlines(self):
+        return list(self)
+
+    def __iter__(self):
+        return iter(self.readline, '')
+
+    def close(self):
+        """
+        Drop buffered data, the pipe is closed by the thread once the
+        process closes its end.
+        """
+        with self._cond:
+            self.closed = True
+            del self._buffer[:]
+            self._cond.notify_all()
+
+
+class _Input(object):
+    """
+    Wraps binary pipe to accept both text and bytes, same as stdin of
+    SSH channel.
+    """
+    def __init__(self, fh):
+        self._fh = fh
+
+    @property
+    def closed(self):
+        return self._fh.closed
+
+    def write(self, data):
+        if not isinstance(data, bytes):
+            data = data.encode('utf-8')
+        try:
+            self._fh.write(data)
+            self._fh.flush()
+        except BrokenPipeError:
+            # process doesn't read its input, same as closed channel
+            pass
+
+    def flush(self):
+        self._fh.flush()
+
+    def close(self):
+        if not self._fh.closed:
+            try:
+                self._fh.close()
+            except BrokenPipeError:
+                pass
+
+
+class LocalExecutor(Executor):
+    """
+    Executes commands on this machine via subprocess.
+
+    Commands are interpreted by shell, same as on remote machine. When
+    the executor user differs from user running this process, commands are
+    run through 'sudo -u'. Files are opened directly by this process.
+    """
+
+    class LoggerAdapter(Executor.LoggerAdapter):
+        """
+        Makes sure that all logs which are done via this class, has
+        appropriate prefix. [user@local]
+        """
+        def process(self, msg, kwargs):
+            return (
+                "[%s@local] %s" % (
+                    self.extra['self'].user.name,
+                    msg,
+                ),
+                kwargs,
+            )
+
+    class Session(Executor.Session):
+        """
+        There is no connection to open, session only groups commands
+        """
+        def __init__(self, executor, timeout=None):
+            super(LocalExecutor.Session, self).__init__(executor)
+            self._timeout = timeout
+
+        def open(self):
+            pass
+
+        def command(self, cmd):
+            return LocalExecutor.Command(cmd, self)
+
+        def run_cmd(
+            self, cmd, input_=None, timeout=None, get_pty=False,
+            discard_output=False,
+        ):
+            if self._executor.sudo:
+                cmd.insert(0, "sudo")
+
+            cmd = self.command(cmd)
+            return cmd.run(
+                input_, timeout, get_pty=get_pty,
+                discard_output=discard_output,
+            )
+
+        @contextlib.contextmanager
+        def open_file(self, path, mode='r', bufsize=-1):
+            event = metrics.start(
+                metrics.FILE_OPEN, self._executor, path=path, mode=mode,
+            )
+            error = None
+            try:
+                with open(path, mode, bufsize) as fh:
+                    yield fh
+            except Exception as ex:
+                error = ex
+                raise
+            finally:
+                if event is not None:
+                    metrics.finish(event, error)
+
+    class Command(Executor.Command):
+        """
+        This class holds all data related to command execution.
+        """
+        def __init__(self, cmd, session):
+            super(LocalExecutor.Command, self).__init__(
+                subprocess.list2cmdline(cmd),
+                session,
+            )
+            self._proc = None
+            self._in = None
+            self._out = None
+            self._err = None
+            self._expired = False
+            self._event = None
+
+        def _argv(self):
+            executor = self._ss._executor
+            argv = [SHELL, '-c', self.cmd]
+            if executor.user.name != current_user():
+                argv = ['sudo', '-n', '-u', executor.user.name, '--'] + argv
+            return argv
+
+        def _env(self):
+            """
+            Returns:
+                dict: environment of process, None to inherit this one
+            """
+            return None
+
+        def get_rc(self, wait=False):
+            if self._rc is None and self._proc is not None:
+                if wait:
+                    self._rc = self._proc.wait()
+                else:
+                    self._rc = self._proc.poll()
+            return self._rc
+
+        def _expire(self):
+            self._expired = True
+            self._proc.kill()
+
+        @contextlib.contextmanager
+        def execute(self, bufsize=-1, timeout=None, get_pty=False):
+            """
+            This method allows you to work directly with streams.
+
+            with cmd.execute() as in_, out, err:
+                # where in_, out and err are file-like objects
+                # where you can read data from these
+
+            Process is killed when it doesn't finish in timeout. There is no
+            pseudoterminal, get_pty is accepted for compatibility with
+            RemoteExecutor.
+            """
+            self._event = metrics.start(
+                metrics.COMMAND_EXECUTE, self._ss._executor, cmd=self.cmd,
+            )
+            error = None
+            timer = None
+            try:
+                self.logger.debug("Executing: %s", self.cmd)
+                self._proc = subprocess.Popen(
+                    self._argv(),
+                    bufsize=bufsize,
+                    env=self._env(),
+                    stdin=subprocess.PIPE,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                )
+                if timeout:
+                    timer = threading.Timer(timeout, self._expire)
+                    timer.daemon = True
+                    timer.start()
+                self._in = _Input(self._proc.stdin)
+                self._out = _Output(self._proc.stdout)
+                self._err = _Output(self._proc.stderr)
+                yield self._in, self._out, self._err
+                self.get_rc(True)
+                if self._expired:
+                    raise socket.timeout(
+                        "%s: timeout(%s)" % (self._ss._executor.address, timeout)
+                    )
+            except Exception as ex:
+                error = ex
+                raise
+            finally:
+                if timer is not None:
+                    timer.cancel()
+                if self._proc is not None:
+                    self._in.close()
+                    if self._rc is None:
+                        self._proc.kill()
+                        self._rc = self._proc.wait()
+                    self._out.close()
+                    self._err.close()
+                if self.logger.isEnabledFor(logging.DEBUG):
+                    # don't decode output just for logs
+                    self.logger.debug("Results of command: %s", self.cmd)
+                    self.logger.debug("  OUT: %s", self.out)
+                    self.logger.debug("  ERR: %s", self.err)
+                    self.logger.debug("  RC: %s", self.rc)
+                if self._event is not None:
+                    self._event.attrs['rc'] = self._rc
+                    metrics.finish(self._event, error)
+
+        def run(
+            self, input_, timeout=None, get_pty=False, discard_output=False,
+        ):
+            """
+            Args:
+                input_ (str): input data
+                timeout (float): timeout for the command
+                get_pty (bool): get pseudoterminal
+                discard_output (bool): drop stdout on the host, only rc and err
+                    are of interest
+
+            Returns:
+                CommandResult: rc, out and err of command
+            """
+            if discard_output:
+                self.discard_output()
+            with self.execute(
+                timeout=timeout, get_pty=get_pty
+            ) as (in_, out, err):
+                if input_:
+                    in_.write(input_)
+                in_.close()
+                out = out.read()
+                err = err.read()
+                if self._event is not None:
+                    self._event.bytes_out += len(input_ or '')
+                    self._event.bytes_in += len(out) + len(err)
+                # decoded on first access
+                self.out = out
+                self.err = err
+            self.result.rc = self.rc
+            return self.result
+
+    def __init__(self, user, address='localhost', sudo=False):
+        """
+        Args:
+            user (instance of User): User to run commands as
+            address (str): Address of this machine, used in logs and errors
+            sudo (bool): Use sudo to execute command.
+        """
+        super(LocalExecutor, self).__init__(user)
+        self.address = address
+        self.sudo = sudo
+
+    def session(self, timeout=None):
+        """
+        Args:
+            timeout (float): Ignored, kept for compatibility
+
+        Returns:
+            instance of LocalExecutor.Session: The session
+        """
+        return LocalExecutor.Session(self, timeout)
+
+    def run_cmd(
+            self,
+            cmd,
+            input_=None,
+            tcp_timeout=None,
+            io_timeout=None,
+            get_pty=False,
+            discard_output=False,
+    ):
+        """
+        Args:
+            cmd (list): Command
+            input_ (str): Input data
+            tcp_timeout (float): Ignored, kept for compatibility
+            io_timeout (float): Timeout for the command to finish
+            get_pty (bool): Ignored, kept for compatibility
+            discard_output (bool): Drop stdout on the host, only rc and err
+                are of interest
+
+        Returns:
+            CommandResult: Rc, out, err, it behaves as tuple
+        """
+        with self.session(tcp_timeout) as session:
+            return session.run_cmd(
+                cmd, input_, io_timeout, get_pty=get_pty,
+                discard_output=discard_output,
+            )
+
+    def is_connective(self, tcp_timeout=20.0):
+        """
+        Local machine is always reachable
+
+        Returns:
+            bool: True
+        """
+        return True
+
+    def wait_for_connectivity_state(self, positive, *args, **kwargs):
+        """
+        Returns:
+            bool: True if positive state is expected, False otherwise
+        """
+        return positive
+
+
+class LocalExecutorFactory(ExecutorFactory):
+    def build(self, host, user, sudo=False):
+        return LocalExecutor(user, host.ip, sudo=sudo)
+
+    @staticmethod
+    def can_handle(host, user):
+        """
+        Check if commands for host can run locally with the same privileges
+        as they would get over SSH
+
+        Args:
+            host (Host): host to check
+            user (User): executor user
+
+        Returns:
+            bool: True if host is this machine and user is the one running
+                this process, files are then opened with the same
+                privileges as over SFTP
+        """
+        if user.name != current_user():
+            return False
+        return is_local_address(host.ip)
@@ -0,0 +1,369 @@
+"""
+This module provides instrumentation of executors.
+
+Executors report events of session lifetime, opening session, executing
+command and opening file to registered hooks. Each event is split into
+phases, so it is visible where the time goes. When no hook is registered,
+executors skip all of the bookkeeping.
+
+Example:
+    collector = metrics.MetricsCollector()
+    metrics.add_hook(collector)
+    host.network.get_info()
+    print(collector.to_openmetrics())
+"""
+import bisect
+import json
+import sys
+import threading
+import time
+
+from rrmngmnt.executor import Executor
+from rrmngmnt.resource import Resource
+
+SESSION = 'session'
+SESSION_OPEN = 'session.open'
+COMMAND_EXECUTE = 'command.execute'
+FILE_OPEN = 'file.open'
+
+# Phases reported by RemoteExecutor
+TCP_CONNECT = 'tcp_connect'
+HANDSHAKE = 'handshake'
+CHANNEL_OPEN = 'channel_open'
+EXECUTION = 'execution'
+TRANSFER = 'transfer'
+TOTAL = 'total'
+
+hooks = []
+
+
+def add_hook(hook):
+    """
+    Register hook which gets all executor events
+
+    Args:
+        hook (Hook): hook to register
+    """
+    hooks.append(hook)
+
+
+def remove_hook(hook):
+    """
+    Args:
+        hook (Hook): hook to unregister
+    """
+    hooks.remove(hook)
+
+
+class Event(object):
+    """
+    Single instrumented operation of executor
+    """
+    __slots__ = (
+        'name', 'executor', 'attrs', 'phases', 'bytes_in', 'bytes_out',
+        'start', 'end', 'error', '_mark',
+    )
+
+    def __init__(self, name, executor, **attrs):
+        """
+        Args:
+            name (str): SESSION, SESSION_OPEN, COMMAND_EXECUTE or FILE_OPEN
+            executor (Executor): executor which performs the operation
+            attrs (dict): additional attributes, e.g. cmd or path
+        """
+        self.name = name
+        self.executor = executor
+        self.attrs = attrs
+        self.phases = {}
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.start = self._mark = time.monotonic()
+        self.end = None
+        self.error = None
+
+    @property
+    def host(self):
+        return getattr(self.executor, 'address', None)
+
+    @property
+    def duration(self):
+        end = self.end if self.end is not None else time.monotonic()
+        return end - self.start
+
+    def phase(self, name):
+        """
+        Finish phase, its duration is time elapsed since the previous one
+
+        Args:
+            name (str): name of finished phase
+        """
+        now = time.monotonic()
+        self.phases[name] = self.phases.get(name, 0.0) + now - self._mark
+        self._mark = now
+
+
+def start(name, executor, **attrs):
+    """
+    Start event and pass it to pre hooks
+
+    Args:
+        name (str): name of event
+        executor (Executor): executor which performs the operation
+        attrs (dict): additional attributes
+
+    Returns:
+        Event: started event, None when no hook is registered
+    """
+    if not hooks:
+        return None
+    event = Event(name, executor, **attrs)
+    for hook in list(hooks):
+        hook.pre(event)
+    return event
+
+
+def finish(event, error=None):
+    """
+    Finish event and pass it to post hooks
+
+    Args:
+        event (Event): started event
+        error (Exception): exception which ended the operation
+    """
+    event.end = time.monotonic()
+    event.error = error
+    for hook in list(hooks):
+        hook.post(event)
+
+
+class Hook(object):
+    """
+    Base for hooks, override methods you are interested in.
+    """
+    def pre(self, event):
+        """
+        Called when operation starts
+
+        Args:
+            event (Event): started event
+        """
+
+    def post(self, event):
+        """
+        Called when operation finishes, also when it failed
+
+        Args:
+            event (Event): finished event, with phases filled in
+        """
+
+
+class Histogram(object):
+    """
+    Cumulative histogram of observed values
+    """
+    def __init__(self, buckets):
+        """
+        Args:
+            buckets (tuple): sorted upper bounds of buckets
+        """
+        super(Histogram, self).__init__()
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self):
+        """
+        Returns:
+            list: list of (upper bound, count) tuples, last bound is '+Inf'
+        """
+        result = []
+        total = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def as_dict(self):
+        return {
+            'buckets': [[str(b), c] for b, c in self.cumulative()],
+            'count': self.count,
+            'sum': self.sum,
+        }
+
+
+def _escape(value):
+    return str(value).replace(
+        '\\', '\\\\'
+    ).replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    return "{%s}" % ",".join(
+        '%s="%s"' % (k, _escape(v)) for k, v in sorted(labels.items())
+    )
+
+
+class MetricsCollector(Hook):
+    """
+    Collects per host histograms of phase durations, transferred bytes
+    and counts of commands executed by each Service / Host method.
+    """
+    default_buckets = (
+        0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+        30.0, 60.0,
+    )
+    prefix = 'rrmngmnt'
+
+    def __init__(self, buckets=None):
+        """
+        Args:
+            buckets (tuple): upper bounds of histogram buckets in seconds
+        """
+        super(MetricsCollector, self).__init__()
+        self.buckets = tuple(sorted(buckets or self.default_buckets))
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.durations = {}
+            self.bytes = {}
+            self.commands = {}
+            self.errors = {}
+
+    @staticmethod
+    def _caller():
+        """
+        Returns:
+            str: 'Class.method' of the closest public Service method on the
+                stack, or of the closest resource which is not executor
+                when there is no such, None when neither is found
+        """
+        # service imports tracing, which is built on top of this module
+        from rrmngmnt.service import Service
+        fallback = None
+        frame = sys._getframe(2)
+        while frame is not None:
+            obj = frame.f_locals.get('self')
+            if isinstance(obj, Resource) and not isinstance(obj, Executor):
+                name = "%s.%s" % (type(obj).__name__, frame.f_code.co_name)
+                if (
+                    isinstance(obj, Service) and
+                    not frame.f_code.co_name.startswith('_')
+                ):
+                    return name
+                fallback = fallback or name
+            frame = frame.f_back
+        return fallback
+
+    def pre(self, event):
+        if event.name == COMMAND_EXECUTE:
+            event.attrs.setdefault('method', self._caller())
+
+    def post(self, event):
+        host = event.host
+        phases = dict(event.phases)
+        phases[TOTAL] = event.duration
+        with self._lock:
+            for phase, value in phases.items():
+                key = (host, event.name, phase)
+                if key not in self.durations:
+                    self.durations[key] = Histogram(self.buckets)
+                self.durations[key].observe(value)
+            for direction, value in (
+                ('in', event.bytes_in), ('out', event.bytes_out)
+            ):
+                key = (host, direction)
+                self.bytes[key] = self.bytes.get(key, 0) + value
+            if event.name == COMMAND_EXECUTE:
+                key = (host, event.attrs.get('method'))
+                self.commands[key] = self.commands.get(key, 0) + 1
+            if event.error is not None:
+                key = (host, event.name)
+                self.errors[key] = self.errors.get(key, 0) + 1
+
+    def as_dict(self):
+        """
+        Returns:
+            dict: collected metrics, ready to be dumped to JSON
+        """
+        with self._lock:
+            return {
+                'durations': [
+                    dict(
+                        host=h, event=e, phase=p, **histogram.as_dict()
+                    )
+                    for (h, e, p), histogram in sorted(
+                        self.durations.items(), key=lambda i: str(i[0])
+                    )
+                ],
+                'bytes': [
+                    {'host': h, 'direction': d, 'value': v}
+                    for (h, d), v in sorted(
+                        self.bytes.items(), key=lambda i: str(i[0])
+                    )
+                ],
+                'commands': [
+                    {'host': h, 'method': m, 'value': v}
+                    for (h, m), v in sorted(
+                        self.commands.items(), key=lambda i: str(i[0])
+                    )
+                ],
+                'errors': [
+                    {'host': h, 'event': e, 'value': v}
+                    for (h, e), v in sorted(
+                        self.errors.items(), key=lambda i: str(i[0])
+                    )
+                ],
+            }
+
+    def to_json(self, **kwargs):
+        """
+        Args:
+            kwargs (dict): arguments of json.dumps
+
+        Returns:
+            str: collected metrics in JSON
+        """
+        return json.dumps(self.as_dict(), **kwargs)
+
+    def to_openmetrics(self):
+        """
+        Returns:
+            str: collected metrics in OpenMetrics text format
+        """
+        data = self.as_dict()
+        name = "%s_phase_seconds" % self.prefix
+        lines = ["# TYPE %s histogram" % name, "# UNIT %s seconds" % name]
+        for item in data['durations']:
+            labels = dict(
+                host=item['host'], event=item['event'], phase=item['phase']
+            )
+            for bound, count in item['buckets']:
+                lines.append(
+                    "%s_bucket%s %d" % (name, _labels(le=bound, **labels), count)
+                )
+            lines.append("%s_count%s %d" % (name, _labels(**labels), item['count']))
+            lines.append("%s_sum%s %r" % (name, _labels(**labels), item['sum']))
+        for metric, label in (
+            ('bytes', 'direction'), ('commands', 'method'),
+            ('errors', 'event'),
+        ):
+            name = "%s_%s" % (self.prefix, metric)
+            lines.append("# TYPE %s counter" % name)
+            for item in data[metric]:
+                lines.append(
+                    "%s_total%s %d" % (
+                        name,
+                        _labels(**{'host': item['host'], label: item[label]}),
+                        item['value'],
+                    )
+                )
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
@@ -3,6 +3,7 @@
 This module introduces support for the nmcli command which is provided by
 NetworkManager.
 """
+import contextlib
 import shlex
 
 from rrmngmnt.errors import CommandExecutionFailure
@@ -72,6 +73,23 @@ class VlanOptions:
     MTU = "mtu"
 
 
+class Checkpoint:
+    """
+    NetworkManager D-Bus checkpoint API, used to protect transactions.
+    """
+    _call = (
+        "busctl call org.freedesktop.NetworkManager "
+        "/org/freedesktop/NetworkManager org.freedesktop.NetworkManager"
+    )
+    CREATE = _call + " CheckpointCreate aouu 0 {timeout} {flags}"
+    ROLLBACK = _call + " CheckpointRollback o {path}"
+    DESTROY = _call + " CheckpointDestroy o {path}"
+    # NM_CHECKPOINT_CREATE_FLAG_DELETE_NEW_CONNECTIONS |
+    # NM_CHECKPOINT_CREATE_FLAG_DISCONNECT_NEW_DEVICES
+    DEFAULT_FLAGS = 0x02 | 0x04
+    DEFAULT_TIMEOUT = 60
+
+
 class NMCLI(Service):
     """
     This class implements network operations using nmcli.
@@ -80,6 +98,139 @@ class NMCLI(Service):
     def __init__(self, host):
         super(NMCLI, self).__init__(host)
         self._executor = host.executor()
+        self._batch = None
+
+    def _apply(self, command):
+        """
+        Executes a configuration changing command, or queues it when a
+        transaction is in progress.
+
+        Args:
+            command (str): a command to run remotely.
+
+        Raises:
+            CommandExecutionFailure: if the remote host returned a code
+                indicating a failure in execution.
+        """
+        if self._batch is not None:
+            self._batch.append(command)
+            return
+        self._exec_command(command=command)
+
+    @staticmethod
+    def _batch_script_builder(commands, rollback_timeout, checkpoint_flags):
+        """
+        Builds a shell script which applies all commands at once.
+
+        Args:
+            commands (list[str]): nmcli commands to apply in order.
+            rollback_timeout (int): seconds after which NetworkManager rolls
+                back the changes unless the checkpoint is destroyed, or None
+                to apply the commands without a checkpoint.
+            checkpoint_flags (int): NetworkManager checkpoint create flags.
+
+        Returns:
+            str: a shell script. When checkpoint is used, the checkpoint path
+                is printed on the first line of its output.
+        """
+        lines = ["set -o pipefail"]
+        on_failure = "exit $?"
+        if rollback_timeout is not None:
+            create = Checkpoint.CREATE.format(
+                timeout=rollback_timeout, flags=checkpoint_flags
+            )
+            rollback = Checkpoint.ROLLBACK.format(path='"$checkpoint"')
+            lines.extend(
+                [
+                    f"checkpoint=$({create} | cut -d '\"' -f2) || exit $?",
+                    '[ -n "$checkpoint" ] || exit 1',
+                    'echo "$checkpoint"',
+                    "rollback() {",
+                    f"    {rollback} > /dev/null",
+                    "    exit $1",
+                    "}",
+                ]
+            )
+            on_failure = "rollback $?"
+        for command in commands:
+            quoted = " ".join(shlex.quote(arg) for arg in shlex.split(command))
+            lines.append(f"{quoted} || {on_failure}")
+        return "\n".join(lines) + "\n"
+
+    @contextlib.contextmanager
+    def transaction(
+        self,
+        rollback_timeout=Checkpoint.DEFAULT_TIMEOUT,
+        checkpoint_flags=Checkpoint.DEFAULT_FLAGS,
+    ):
+        """
+        Collects configuration changes and applies them in one remote call.
+
+        All changes are applied by a single script, protected by
+        a NetworkManager checkpoint. When any command fails, the script rolls
+        the checkpoint back immediately. When the script succeeds, the
+        checkpoint is destroyed over a new connection, so if the host is no
+        longer reachable NetworkManager rolls back on its own after
+        rollback_timeout.
+
+        Args:
+            rollback_timeout (int): seconds after which NetworkManager rolls
+                back the changes unless they are confirmed, None to apply
+                the changes without a checkpoint.
+            checkpoint_flags (int): NetworkManager checkpoint create flags.
+
+        Yields:
+            NMCLI: this instance, operations done through it are queued.
+
+        Raises:
+            CommandExecutionFailure: if applying the changes or confirming
+                the checkpoint failed.
+
+        Example:
+            with host.network.nmcli.transaction() as nmcli:
+                nmcli.add_bond(con_name="bond1", ifname="bond1")
+                nmcli.add_slave(
+                    con_name="bond1-eth1", slave_type="ethernet",
+                    ifname="eth1", master="bond1",
+                )
+        """
+        if self._batch is not None:
+            raise RuntimeError("Transaction is already in progress")
+        self._batch = []
+        try:
+            yield self
+            commands = self._batch
+        finally:
+            self._batch = None
+
+        if not commands:
+            return
+
+        script = self._batch_script_builder(
+            commands=commands,
+            rollback_timeout=rollback_timeout,
+            checkpoint_flags=checkpoint_flags,
+        )
+        cmd = ["bash", "-s"]
+        rc, out, err = self._executor.run_cmd(cmd, input_=script)
+        if rc != 0:
+            self.logger.error(
+                f"\n"
+                f"script -> {script}\n"
+                f"RC -> {rc}\n"
+                f"OUT -> {out}\n"
+                f"ERROR -> {err}"
+            )
+            raise CommandExecutionFailure(
+                executor=self._executor, cmd=cmd, rc=rc, err=err
+            )
+
+        if rollback_timeout is not None:
+            self._exec_command(
+                command=Checkpoint.DESTROY.format(
+                    path=out.splitlines()[0].strip()
+                )
+            )
 
     def _exec_command(self, command):
         """
@@ -206,7 +357,7 @@ class NMCLI(Service):
             CommandExecutionFailure: if the remote host returned a code
                 indicating a failure in execution.
         """
-        self._exec_command(
+        self._apply(
             command=f"nmcli {Objects.CONNECTION} {state} {connection}"
         )
 
@@ -256,7 +407,7 @@ class NMCLI(Service):
         if mtu:
             type_options[EthernetOptions.MTU] = mtu
 
-        self._exec_command(
+        self._apply(
             command=self._nmcli_cmd_builder(
                 object_type=Objects.CONNECTION,
                 operation=Operations.ADD,
@@ -333,7 +484,7 @@ class NMCLI(Service):
         if primary:
             type_options[BondOptions.PRIMARY] = primary
 
-        self._exec_command(
+        self._apply(
             command=self._nmcli_cmd_builder(
                 object_type=Objects.CONNECTION,
                 operation=Operations.ADD,
@@ -396,7 +547,7 @@ class NMCLI(Service):
         if master:
             type_options = {SlaveOptions.MASTER: master}
 
-        self._exec_command(
+        self._apply(
             command=self._nmcli_cmd_builder(
                 object_type=Objects.CONNECTION,
                 operation=Operations.ADD,
@@ -459,7 +610,7 @@ class NMCLI(Service):
         if mtu:
             type_options[VlanOptions.MTU] = mtu
 
-        self._exec_command(
+        self._apply(
             command=self._nmcli_cmd_builder(
                 object_type=Objects.CONNECTION,
                 operation=Operations.ADD,
@@ -513,7 +664,7 @@ class NMCLI(Service):
             CommandExecutionFailure: if the remote host returned a code
                 indicating a failure in execution.
         """
-        self._exec_command(
+        self._apply(
             command=self._nmcli_cmd_builder(
                 object_type=Objects.CONNECTION,
                 operation=Operations.ADD,
@@ -549,7 +700,7 @@ class NMCLI(Service):
             {"+ipv4.addresses": "192.168.23.2"}, or a '-' in order to remove
             a property.
         """
-        self._exec_command(
+        self._apply(
             command=self._nmcli_cmd_builder(
                 object_type=Objects.CONNECTION,
                 operation=Operations.MODIFY,
@@ -569,7 +720,7 @@ class NMCLI(Service):
             CommandExecutionFailure: if the remote host returned a code
                 indicating a failure in execution.
         """
-        self._exec_command(
+        self._apply(
             command=self._nmcli_cmd_builder(
                 object_type=Objects.CONNECTION,
                 operation=Operations.DELETE,
@@ -595,7 +746,7 @@ class NMCLI(Service):
             {"+ipv4.addresses": "192.168.23.2"}, or a '-' in order to remove
             a property.
         """
-        self._exec_command(
+        self._apply(
             command=self._nmcli_cmd_builder(
                 object_type=Objects.DEVICE,
                 operation=Operations.MODIFY,
@@ -0,0 +1,325 @@
+"""
+This module provides executor which drives system OpenSSH client.
+
+Connections to each host are multiplexed over one master connection
+(ControlMaster), which stays open for ControlPersist seconds after the last
+command, so commands don't pay for handshake. Bulk data is transferred by
+OpenSSH crypto rather than paramiko.
+
+Password authentication requires sshpass, otherwise keys or ssh-agent are
+used. Failure of connection is reported by ssh client as return code 255.
+
+Example:
+    host.executor_factory = OpenSSHExecutorFactory(persist=300)
+"""
+import contextlib
+import os
+import shlex
+import shutil
+import socket
+import subprocess
+import tempfile
+import threading
+
+from rrmngmnt.executor import Executor, ExecutorFactory
+from rrmngmnt.local import LocalExecutor
+from rrmngmnt.user import UserWithPKey
+
+SSH = 'ssh'
+SSHPASS = 'sshpass'
+
+_master_lock = threading.Lock()
+
+
+def _control_dir():
+    path = os.path.join(
+        tempfile.gettempdir(), 'rrmngmnt-ssh-%s' % os.getuid()
+    )
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    return path
+
+
+class OpenSSHExecutor(Executor):
+    """
+    Executes commands by ssh binary over shared master connection.
+    """
+
+    class LoggerAdapter(Executor.LoggerAdapter):
+        """
+        Makes sure that all logs which are done via this class, has
+        appropriate prefix. [user@IP/password]
+        """
+        def process(self, msg, kwargs):
+            return (
+                "[%s@%s/%s] %s" % (
+                    self.extra['self'].user.name,
+                    self.extra['self'].address,
+                    self.extra['self'].user.credentials,
+                    msg,
+                ),
+                kwargs,
+            )
+
+    class Session(LocalExecutor.Session):
+        """
+        Commands of session share the master connection
+        """
+        random_access = False
+
+        def open(self):
+            self._executor.start_master(self._timeout)
+
+        def command(self, cmd):
+            return OpenSSHExecutor.Command(cmd, self)
+
+        @contextlib.contextmanager
+        def open_file(self, path, mode='r', bufsize=-1):
+            """
+            Open remote file through 'cat' pipe, only sequential reading,
+            writing and appending is supported.
+            """
+            redirect = {'r': '<', 'w': '>', 'a': '>>'}.get(mode[:1])
+            if redirect is None or '+' in mode:
+                raise ValueError(
+                    "Mode %s is not supported by %s" % (
+                        mode, self._executor.__class__.__name__
+                    )
+                )
+            command = self.command(['cat'])
+            command.cmd = "cat %s %s" % (redirect, shlex.quote(path))
+            with command.execute(bufsize) as (in_, out, err):
+                yield out if redirect == '<' else in_
+                in_.close()
+                # drop data which were not read
+                out.close()
+                err = err.read()
+            if command.rc:
+                raise IOError(
+                    "%s: %s" % (path, err.decode('utf-8', 'replace').strip())
+                )
+
+    class Command(LocalExecutor.Command):
+        """
+        Command executed by ssh client, streams are pipes of the client
+        """
+        def _argv(self):
+            return self._ss._executor.ssh_cmd(self.cmd, self._ss._timeout)
+
+        def _env(self):
+            return self._ss._executor.ssh_env()
+
+    def __init__(
+        self, user, address, port=22, sudo=False, sock=None,
+        persist=60, control_dir=None, options=None,
+    ):
+        """
+        Args:
+            user (instance of User): User
+            address (str): Ip / hostname
+            port (int): Port to connect
+            sudo (bool): Use sudo to execute command.
+            sock (str): ProxyCommand to use.
+            persist (int): Seconds to keep idle master connection open
+            control_dir (str): Directory for control sockets
+            options (dict): Additional ssh options
+        """
+        super(OpenSSHExecutor, self).__init__(user)
+        self.address = address
+        self.port = port
+        self.sudo = sudo
+        self.sock = sock
+        self.persist = persist
+        self.control_dir = control_dir
+        self.options = options or {}
+
+    def _options(self, timeout=None, master=False):
+        options = {
+            # Commands only use master, when it is missing they connect
+            # directly. Master started by command would inherit its stderr
+            # and keep it open.
+            'ControlMaster': 'yes' if master else 'no',
+            'ControlPath': os.path.join(
+                self.control_dir or _control_dir(), '%C'
+            ),
+            'ControlPersist': str(self.persist),
+            # same as paramiko.AutoAddPolicy with cleared host keys
+            'StrictHostKeyChecking': 'no',
+            'UserKnownHostsFile': os.devnull,
+            'LogLevel': 'ERROR',
+        }
+        if timeout:
+            options['ConnectTimeout'] = str(int(max(timeout, 1)))
+        if self.sock:
+            options['ProxyCommand'] = self.sock
+        if isinstance(self.user, UserWithPKey):
+            options['IdentityFile'] = self.user.private_key
+            options['IdentitiesOnly'] = 'yes'
+        if not self._use_sshpass():
+            options['BatchMode'] = 'yes'
+        options.update(self.options)
+        return options
+
+    def _use_sshpass(self):
+        return bool(
+            self.user.password and not isinstance(self.user, UserWithPKey) and
+            shutil.which(SSHPASS)
+        )
+
+    def ssh_cmd(self, cmd, timeout=None, *args, master=False):
+        """
+        Args:
+            cmd (str): command line to execute on host, None for no command
+            timeout (float): connection timeout
+            args (list): additional arguments of ssh client
+            master (bool): command starts master connection
+
+        Returns:
+            list: arguments of ssh client
+        """
+        argv = [SSH, '-p', str(self.port)]
+        for key, value in sorted(self._options(timeout, master).items()):
+            argv.extend(['-o', '%s=%s' % (key, value)])
+        argv.extend(args)
+        argv.extend(['-l', self.user.name, '--', self.address])
+        if cmd is not None:
+            argv.append(cmd)
+        if self._use_sshpass():
+            argv = [SSHPASS, '-e'] + argv
+        return argv
+
+    def ssh_env(self):
+        """
+        Returns:
+            dict: environment for ssh client, None to inherit this one
+        """
+        if not self._use_sshpass():
+            return None
+        env = dict(os.environ)
+        env['SSHPASS'] = self.user.password
+        return env
+
+    def session(self, timeout=None):
+        """
+        Args:
+            timeout (float): Tcp timeout
+
+        Returns:
+            instance of OpenSSHExecutor.Session: The session
+        """
+        return OpenSSHExecutor.Session(self, timeout)
+
+    def run_cmd(
+            self,
+            cmd,
+            input_=None,
+            tcp_timeout=None,
+            io_timeout=None,
+            get_pty=False,
+            discard_output=False,
+    ):
+        """
+        Args:
+            cmd (list): Command
+            input_ (str): Input data
+            tcp_timeout (float): Tcp timeout
+            io_timeout (float): Timeout for the command to finish
+            get_pty (bool): Ignored, kept for compatibility
+            discard_output (bool): Drop stdout on the host, only rc and err
+                are of interest
+
+        Returns:
+            CommandResult: Rc, out, err, it behaves as tuple
+        """
+        with self.session(tcp_timeout) as session:
+            return session.run_cmd(
+                cmd, input_, io_timeout, get_pty=get_pty,
+                discard_output=discard_output,
+            )
+
+    def is_connective(self, tcp_timeout=20.0):
+        """
+        Check if address is connective via ssh
+
+        Args:
+            tcp_timeout (float): Time to wait for response
+
+        Returns:
+            bool: True if address is connective, false otherwise
+        """
+        try:
+            rc, _, err = self.run_cmd(['true'], tcp_timeout=tcp_timeout)
+        except (socket.timeout, OSError) as ex:
+            self.logger.debug("Socket error: %s", ex)
+            return False
+        if rc:
+            self.logger.debug("SSH error: %s", err)
+        return rc == 0
+
+    def start_master(self, timeout=None):
+        """
+        Start master connection to host, unless it is running already
+
+        Args:
+            timeout (float): connection timeout
+
+        Returns:
+            bool: True if master connection is running
+        """
+        with _master_lock:
+            if self._call(self.ssh_cmd(None, timeout, '-O', 'check')) == 0:
+                return True
+            rc = self._call(
+                self.ssh_cmd(None, timeout, '-N', '-f', master=True)
+            )
+        if rc:
+            self.logger.warning(
+                "Failed to start master connection, rc %s", rc
+            )
+        return rc == 0
+
+    def _call(self, argv):
+        return subprocess.call(
+            argv,
+            env=self.ssh_env(),
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+
+    def close_master(self):
+        """
+        Close master connection to host, if there is any
+        """
+        self._call(self.ssh_cmd(None, None, '-O', 'exit'))
+
+
+class OpenSSHExecutorFactory(ExecutorFactory):
+    def __init__(
+        self, port=22, sock=None, persist=60, control_dir=None,
+        options=None,
+    ):
+        """
+        Args:
+            port (int): Port to connect
+            sock (str): ProxyCommand to use
+            persist (int): Seconds to keep idle master connection open
+            control_dir (str): Directory for control sockets
+            options (dict): Additional ssh options, e.g. {'Ciphers': ...}
+        """
+        self.port = port
+        self.sock = sock
+        self.persist = persist
+        self.control_dir = control_dir
+        self.options = options
+
+    def build(self, host, user, sudo=False):
+        return OpenSSHExecutor(
+            user,
+            host.ip,
+            port=self.port,
+            sudo=sudo,
+            sock=self.sock,
+            persist=self.persist,
+            control_dir=self.control_dir,
+            options=self.options,
+        )
@@ -1,13 +1,129 @@
 import contextlib
+import hashlib
+import io
 import json
 import os.path
+import shlex
+import shutil
+import subprocess
+import tarfile
+import tempfile
 import uuid
 
+from rrmngmnt import errors
 from rrmngmnt.common import CommandReader
 from rrmngmnt.resource import Resource
 from rrmngmnt.service import Service
 
 
+class AnsibleEvent(object):
+    """
+    Event reported by JSON lines stdout callback of Ansible.
+
+    Results of runner events are split per host, so each AnsibleEvent of
+    RESULT type carries result of one task on one host.
+    """
+    PLAY = "play"
+    TASK = "task"
+    RESULT = "result"
+    STATS = "stats"
+    OTHER = "other"
+
+    OK = "ok"
+    FAILED = "failed"
+    UNREACHABLE = "unreachable"
+    SKIPPED = "skipped"
+
+    statuses = {
+        "v2_runner_on_ok": OK,
+        "v2_runner_on_failed": FAILED,
+        "v2_runner_on_unreachable": UNREACHABLE,
+        "v2_runner_on_skipped": SKIPPED,
+    }
+    types = {
+        "v2_playbook_on_play_start": PLAY,
+        "v2_playbook_on_task_start": TASK,
+        "v2_playbook_on_handler_task_start": TASK,
+        "v2_playbook_on_stats": STATS,
+    }
+
+    def __init__(self, name, data, host=None, result=None):
+        """
+        Args:
+            name (str): name of callback event, e.g. 'v2_runner_on_ok'
+            data (dict): event data as reported by callback
+            host (str): host the result belongs to
+            result (dict): result of the task on the host
+        """
+        super(AnsibleEvent, self).__init__()
+        self.name = name
+        self.data = data
+        self.host = host
+        self.result = result
+        self.status = self.statuses.get(name)
+        if self.status:
+            self.type = self.RESULT
+        else:
+            self.type = self.types.get(name, self.OTHER)
+
+    @property
+    def play(self):
+        return self.data.get('play', {})
+
+    @property
+    def task(self):
+        return self.data.get('task', {})
+
+    @property
+    def play_name(self):
+        return self.play.get('name')
+
+    @property
+    def task_name(self):
+        return self.task.get('name')
+
+    @property
+    def stats(self):
+        return self.data.get('stats')
+
+    @property
+    def failed(self):
+        return self.status in (self.FAILED, self.UNREACHABLE) and not (
+            self.result or {}
+        ).get('ignore_errors', False)
+
+    def __repr__(self):
+        return "AnsibleEvent({0}, host={1}, task={2})".format(
+            self.name, self.host, self.task_name
+        )
+
+    @classmethod
+    def parse(cls, line):
+        """
+        Parse line of callback output
+
+        Args:
+            line (str): line of output
+
+        Returns:
+            list: list of AnsibleEvent objects, empty for lines which are not
+                events (warnings and other messages of Ansible)
+        """
+        try:
+            data = json.loads(line)
+        except ValueError:
+            return []
+        if not isinstance(data, dict) or '_event' not in data:
+            return []
+        name = data['_event']
+        if name in cls.statuses:
+            return [
+                cls(name, data, host, result)
+                for host, result in data.get('hosts', {}).items()
+            ]
+        return [cls(name, data)]
+
+
 class PlaybookRunner(Service):
     """
     Class for working with and especially executing Ansible playbooks on hosts.
@@ -43,6 +159,14 @@ class PlaybookRunner(Service):
     default_inventory_content = "localhost ansible_connection=local"
     ssh_common_args_param = "--ssh-common-args"
     check_mode_param = "--check"
+    # cache of bundles is private to user, <tmp_dir>/<bundle_cache_dir>-<user>
+    bundle_cache_dir = "rrmngmnt-playbook-cache"
+    # written as the last file of bundle, directory without it is incomplete
+    bundle_marker = ".complete"
+    # bundles not used for more days are removed by upload of other bundle
+    bundle_cache_max_age = 7
+    stdout_callback_env = "ANSIBLE_STDOUT_CALLBACK"
+    event_callback_plugin = "ansible.posix.jsonl"
 
     def __init__(self, host, logger=None):
         """
@@ -60,6 +184,7 @@ class PlaybookRunner(Service):
         self.rc = None
         self.out = None
         self.err = None
+        self.recap = None
 
     @contextlib.contextmanager
     def _exec_dir(self):
@@ -104,10 +229,236 @@ class PlaybookRunner(Service):
         )
         return file_path_on_host
 
+    @staticmethod
+    def _read_file(file_):
+        with open(file_, 'rb') as fh:
+            return fh.read()
+
+    @staticmethod
+    def _pack_bundle(files):
+        """
+        Pack files into gzipped tar archive
+
+        Args:
+            files (dict): file names mapped to their content (bytes)
+
+        Returns:
+            tuple: (str, bytes) content hash of the files and the archive
+        """
+        digest = hashlib.sha256()
+        archive = io.BytesIO()
+        with tarfile.open(fileobj=archive, mode='w:gz') as tar:
+            for name in sorted(files):
+                data = files[name]
+                digest.update(
+                    b"%s\0%d\0" % (name.encode('utf-8'), len(data))
+                )
+                digest.update(data)
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                info.mode = 0o600
+                tar.addfile(info, io.BytesIO(data))
+        return digest.hexdigest(), archive.getvalue()
+
+    def _bundle_cache(self):
+        """
+        Returns:
+            str: cache directory of bundles of the user on the host, with
+                sudo the user is root
+        """
+        executor = self.host.executor()
+        user = 'root' if executor.sudo else executor.user.name
+        return os.path.join(
+            self.tmp_dir, "%s-%s" % (self.bundle_cache_dir, user)
+        )
+
+    def clear_bundle_cache(self):
+        """
+        Remove all bundles cached on the host
+        """
+        self.host.fs.rmdir(self._bundle_cache())
+
+    def _upload_bundle(self, bundle_dir, archive):
+        """
+        Extract archive to bundle_dir on the host in single exec call,
+        the archive is sent only when bundle_dir doesn't contain complete
+        bundle yet. Cache directory is created with 0700 permissions and
+        its bundles unused for bundle_cache_max_age days are removed. With
+        sudo the script is run by sudo, the same as the playbook.
+
+        Args:
+            bundle_dir (str): directory on the host
+            archive (bytes): gzipped tar archive
+
+        Returns:
+            bool: True if the archive has been uploaded, False if bundle_dir
+                already existed
+        """
+        cache_dir = os.path.dirname(bundle_dir)
+        tmp_dir = "{}.{}".format(bundle_dir, self.short_run_uuid)
+        marker = os.path.join(bundle_dir, self.bundle_marker)
+        cmd = [
+            # cache must be private directory of the user
+            'mkdir', '-p', '-m', '700', cache_dir, '&&',
+            '[', '!', '-L', cache_dir, ']', '&&',
+            '[', '-O', cache_dir, ']', '&&',
+            'chmod', '700', cache_dir, '||', 'exit', '1', ';',
+            'find', cache_dir, '-mindepth', '1', '-maxdepth', '1',
+            '-mtime', '+%d' % self.bundle_cache_max_age,
+            '-exec', 'rm', '-rf', '{}', '+', ';',
+            'if', '[', '-f', marker, ']', ';', 'then',
+            'touch', bundle_dir, '&&', 'echo', 'hit', ';',
+            'else',
+            'echo', 'miss', '&&',
+            'mkdir', '-m', '700', tmp_dir, '&&',
+            'tar', '-xzf', '-', '-C', tmp_dir, '&&',
+            'touch', os.path.join(tmp_dir, self.bundle_marker), '&&',
+            # incomplete bundle is replaced
+            '{', '[', '-f', marker, ']', '||', 'rm', '-rf', bundle_dir, ';',
+            'mv', '-T', tmp_dir, bundle_dir, '||',
+            'rm', '-rf', tmp_dir, ';', '}', ';',
+            'fi',
+        ]
+        executor = self.host.executor()
+        with executor.session() as ss:
+            if executor.sudo:
+                # whole script runs by sudo, as the playbook does
+                script = subprocess.list2cmdline(cmd)
+                command = ss.command(['sudo', 'sh', '-c', script])
+                command.cmd = "sudo sh -c %s" % shlex.quote(script)
+            else:
+                command = ss.command(cmd)
+            with command.execute() as (in_, out, err):
+                uploaded = out.readline().strip() != 'hit'
+                if uploaded:
+                    in_.write(archive)
+                in_.close()
+                err = err.read()
+            rc = command.rc
+        if rc:
+            raise errors.CommandExecutionFailure(
+                executor=executor, cmd=cmd, rc=rc, err=err
+            )
+        return uploaded
+
+    @contextlib.contextmanager
+    def _bundle_inputs(
+        self, playbook, extra_vars, vars_files, vault_password_file,
+        inventory,
+    ):
+        """
+        Context manager that uploads all inputs of the run as one archive.
+
+        Archives are cached on the host in directory named by hash of their
+        content, so repeated run with the same inputs uploads nothing. The
+        cache directory is private to the user.
+        Runs with vault password file are not cached, their directory is
+        removed afterwards.
+
+        Yields:
+            dict: remote paths of the inputs
+        """
+        files = {}
+        names = {}
+        if extra_vars:
+            files[self.extra_vars_file] = json.dumps(extra_vars).encode()
+            names['extra_vars'] = self.extra_vars_file
+        names['vars_files'] = []
+        for f in vars_files or []:
+            files[os.path.basename(f)] = self._read_file(f)
+            names['vars_files'].append(os.path.basename(f))
+        if vault_password_file:
+            name = os.path.basename(vault_password_file)
+            files[name] = self._read_file(vault_password_file)
+            names['vault_password_file'] = name
+        if inventory:
+            names['inventory'] = os.path.basename(inventory)
+            files[names['inventory']] = self._read_file(inventory)
+        else:
+            names['inventory'] = self.default_inventory_name
+            files[names['inventory']] = (
+                self.default_inventory_content.encode()
+            )
+        if playbook:
+            names['playbook'] = os.path.basename(playbook)
+            files[names['playbook']] = self._read_file(playbook)
+
+        content_hash, archive = self._pack_bundle(files)
+        cache = not vault_password_file
+        if cache:
+            bundle_dir = os.path.join(self._bundle_cache(), content_hash)
+        else:
+            bundle_dir = os.path.join(self.tmp_dir, self.short_run_uuid)
+        if self._upload_bundle(bundle_dir, archive):
+            self.logger.debug("Uploaded run inputs to %s", bundle_dir)
+        else:
+            self.logger.debug("Reusing run inputs cached in %s", bundle_dir)
+
+        def remote(name):
+            return os.path.join(bundle_dir, name)
+
+        self.tmp_exec_dir = bundle_dir
+        try:
+            yield {
+                'extra_vars': names.get('extra_vars') and remote(
+                    names['extra_vars']
+                ),
+                'vars_files': [remote(n) for n in names['vars_files']],
+                'vault_password_file': names.get(
+                    'vault_password_file'
+                ) and remote(names['vault_password_file']),
+                'inventory': remote(names['inventory']),
+                'playbook': names.get('playbook') and remote(
+                    names['playbook']
+                ),
+            }
+        finally:
+            self.tmp_exec_dir = None
+            if not cache:
+                self.host.fs.rmdir(bundle_dir)
+
+    @contextlib.contextmanager
+    def _upload_inputs(
+        self, playbook, extra_vars, vars_files, vault_password_file,
+        inventory,
+    ):
+        """
+        Context manager that uploads all inputs of the run one by one into
+        temporary directory removed afterwards.
+
+        Yields:
+            dict: remote paths of the inputs
+        """
+        with self._exec_dir():
+            paths = {
+                'extra_vars': None,
+                'vault_password_file': None,
+                'playbook': None,
+            }
+            if extra_vars:
+                paths['extra_vars'] = self._dump_vars_to_json_file(
+                    extra_vars
+                )
+            paths['vars_files'] = [
+                self._upload_file(f) for f in vars_files or []
+            ]
+            if vault_password_file:
+                paths['vault_password_file'] = self._upload_file(
+                    vault_password_file
+                )
+            if inventory:
+                paths['inventory'] = self._upload_file(inventory)
+            else:
+                paths['inventory'] = self._generate_default_inventory()
+            if playbook:
+                paths['playbook'] = self._upload_file(playbook)
+            yield paths
+
     def run(
         self, playbook, extra_vars=None, vars_files=None, inventory=None,
         verbose_level=1, run_in_check_mode=False, ssh_common_args=None,
-        upload_playbook=True, vault_password_file=None,
+        upload_playbook=True, vault_password_file=None, bundle=False,
+        event_handler=None,
     ):
         """
         Run Ansible playbook on host
@@ -142,10 +493,86 @@ class PlaybookRunner(Service):
                 It will be automatically uploaded to a remote host,
                 same as vars_files. This is required if any of the vars_files
                 are vault-protected.
+            bundle (bool): Upload all files as one archive in single call
+                (True) instead of one by one (False - Default). The archive
+                is cached on the host by hash of its content, repeated run
+                with the same files doesn't upload anything.
+            event_handler (callable): If provided, Ansible is run with JSON
+                lines stdout callback and the handler is called with
+                AnsibleEvent for each parsed event as soon as it arrives.
+                PLAY RECAP is stored in recap attribute afterwards.
 
         Returns:
             tuple: tuple of (rc, out, err)
         """
+        for line in self._run_lines(
+            playbook, extra_vars=extra_vars, vars_files=vars_files,
+            inventory=inventory, verbose_level=verbose_level,
+            run_in_check_mode=run_in_check_mode,
+            ssh_common_args=ssh_common_args, upload_playbook=upload_playbook,
+            vault_password_file=vault_password_file, bundle=bundle,
+            events=event_handler is not None,
+        ):
+            if event_handler is not None:
+                for event in self._parse_events(line):
+                    event_handler(event)
+        return self.rc, self.out, self.err
+
+    def iter_events(self, playbook, **kwargs):
+        """
+        Run Ansible playbook on host with JSON lines stdout callback and
+        yield its events as they arrive
+
+        Example:
+            runner = my_host.playbook
+            for event in runner.iter_events('long_task.yml'):
+                if event.failed:
+                    print(event.host, event.task_name, event.result)
+            print(runner.rc, runner.recap)
+
+        Args:
+            playbook (str): Path to playbook you want to execute
+            kwargs (dict): Other parameters of run method except
+                event_handler
+
+        Yields:
+            AnsibleEvent: parsed event
+        """
+        for line in self._run_lines(playbook, events=True, **kwargs):
+            for event in self._parse_events(line):
+                yield event
+
+    def _parse_events(self, line):
+        """
+        Parse line of JSON lines callback output, and keep PLAY RECAP
+
+        Args:
+            line (str): line of playbook output
+
+        Returns:
+            list: list of AnsibleEvent objects
+        """
+        events = AnsibleEvent.parse(line)
+        for event in events:
+            if event.type == AnsibleEvent.STATS:
+                self.recap = event.stats
+        return events
+
+    def _run_lines(
+        self, playbook, extra_vars=None, vars_files=None, inventory=None,
+        verbose_level=1, run_in_check_mode=False, ssh_common_args=None,
+        upload_playbook=True, vault_password_file=None, bundle=False,
+        events=False,
+    ):
+        """
+        Generator running the playbook, see run method for description of
+        parameters. Lines of playbook output are yielded, rc, out and err
+        are stored once it finishes.
+
+        Args:
+            events (bool): Run Ansible with JSON lines stdout callback
+        """
+        self.recap = None
         self.logger.info(
             "Running playbook {} on {}".format(
                 os.path.basename(playbook),
@@ -153,29 +580,38 @@ class PlaybookRunner(Service):
             )
         )
 
-        with self._exec_dir():
+        if events:
+            self.cmd.insert(
+                0,
+                "{}={}".format(
+                    self.stdout_callback_env, self.event_callback_plugin
+                ),
+            )
 
-            if extra_vars:
-                self.cmd.append(
-                    "-e@{}".format(self._dump_vars_to_json_file(extra_vars))
-                )
+        upload_inputs = self._bundle_inputs if bundle else self._upload_inputs
+        with upload_inputs(
+            playbook=playbook if upload_playbook else None,
+            extra_vars=extra_vars,
+            vars_files=vars_files,
+            vault_password_file=vault_password_file,
+            inventory=inventory,
+        ) as paths:
 
-            if vars_files:
-                for f in vars_files:
-                    self.cmd.append("-e@{}".format(self._upload_file(f)))
+            if paths['extra_vars']:
+                self.cmd.append("-e@{}".format(paths['extra_vars']))
 
-            if vault_password_file:
+            for f in paths['vars_files']:
+                self.cmd.append("-e@{}".format(f))
+
+            if paths['vault_password_file']:
                 self.cmd.append(
                     "--vault-password-file={}".format(
-                        self._upload_file(vault_password_file)
+                        paths['vault_password_file']
                     )
                 )
 
             self.cmd.append("-i")
-            if inventory:
-                self.cmd.append(self._upload_file(inventory))
-            else:
-                self.cmd.append(self._generate_default_inventory())
+            self.cmd.append(paths['inventory'])
 
             self.cmd.append("-{}".format("v" * verbose_level))
 
@@ -190,14 +626,20 @@ class PlaybookRunner(Service):
                 )
 
             if upload_playbook:
-                playbook = self._upload_file(playbook)
+                playbook = paths['playbook']
             self.cmd.append(playbook)
 
             self.logger.debug("Executing: {}".format(" ".join(self.cmd)))
 
-            playbook_reader = CommandReader(self.host.executor(), self.cmd)
+            executor = self.host.executor()
+            cmd = self.cmd
+            if executor.sudo:
+                # env passes variable of Ansible through sudo
+                cmd = ['sudo', 'env'] + cmd
+            playbook_reader = CommandReader(executor, cmd)
             for line in playbook_reader.read_lines():
                 self.logger.debug(line)
+                yield line
             self.rc, self.out, self.err = (
                 playbook_reader.rc,
                 playbook_reader.out,
@@ -208,4 +650,229 @@ class PlaybookRunner(Service):
                 "Ansible playbook finished with RC: {}".format(self.rc)
             )
 
+
+class MultiHostPlaybookRunner(Resource):
+    """
+    Class for executing Ansible playbook from the local machine against many
+    hosts at once. Unlike PlaybookRunner, nothing is uploaded to the hosts,
+    single local ansible-playbook process connects to all of them using
+    inventory generated from Host objects.
+
+    Example:
+        runner = MultiHostPlaybookRunner(Host.inventory, forks=50)
+        rc, out, err = runner.run('configure.yml')
+        failed = [h for h, stats in runner.recap.items() if stats['failures']]
+    """
+    class LoggerAdapter(Resource.LoggerAdapter):
+
+        def process(self, msg, kwargs):
+            return "[%s] %s" % (self.extra['self'].short_run_uuid, msg), kwargs
+
+    binary = PlaybookRunner.binary
+    extra_vars_file = PlaybookRunner.extra_vars_file
+    inventory_file = "inventory.json"
+    check_mode_param = PlaybookRunner.check_mode_param
+    ssh_common_args_param = PlaybookRunner.ssh_common_args_param
+    stdout_callback_env = PlaybookRunner.stdout_callback_env
+    event_callback_plugin = PlaybookRunner.event_callback_plugin
+    default_forks = 5
+
+    def __init__(self, hosts, forks=None, logger=None):
+        """
+        Args:
+            hosts (list): Host objects to run the playbook against, for
+                example Host.inventory
+            forks (int): Number of parallel processes used by Ansible
+            logger (logging.Logger): Alternate logger for Ansible output
+        """
+        super(MultiHostPlaybookRunner, self).__init__()
+        if logger:
+            self.set_logger(logger)
+        self.hosts = list(hosts)
+        self.forks = forks or self.default_forks
+        self.run_uuid = uuid.uuid4()
+        self.short_run_uuid = str(self.run_uuid).split('-')[0]
+        self.cmd = None
+        self.rc = None
+        self.out = None
+        self.err = None
+        self.recap = None
+        self.results = None
+
+    @staticmethod
+    def _host_vars(host):
+        """
+        Ansible connection variables equivalent to host's executor
+
+        Args:
+            host (rrmngmnt.Host): host
+
+        Returns:
+            dict: host variables
+        """
+        user = host.executor_user
+        host_vars = {
+            'ansible_host': host.ip,
+            'ansible_user': user.name,
+        }
+        private_key = getattr(user, 'private_key', None)
+        if private_key:
+            host_vars['ansible_ssh_private_key_file'] = private_key
+        elif user.password:
+            host_vars['ansible_password'] = user.password
+        port = getattr(host.executor_factory, 'port', None)
+        if port:
+            host_vars['ansible_port'] = port
+        sock = getattr(host.executor_factory, 'sock', None)
+        if sock:
+            host_vars['ansible_ssh_common_args'] = (
+                "-o ProxyCommand='{}'".format(sock)
+            )
+        if host.sudo:
+            host_vars['ansible_become'] = True
+        return host_vars
+
+    def generate_inventory(self):
+        """
+        Generate inventory of all hosts, hosts are named by their ip
+
+        Returns:
+            dict: inventory in the YAML/JSON inventory format
+        """
+        return {
+            'all': {
+                'hosts': dict(
+                    (host.ip, self._host_vars(host)) for host in self.hosts
+                ),
+            },
+        }
+
+    def _write_file(self, directory, name, content):
+        path = os.path.join(directory, name)
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, 'w') as fh:
+            fh.write(content)
+        return path
+
+    def _read_lines(self, env, err_path):
+        out = []
+        # stderr goes to file, so it can't block the process when not read
+        with open(err_path, 'w+') as err:
+            with subprocess.Popen(
+                self.cmd, stdout=subprocess.PIPE, stderr=err, env=env,
+                universal_newlines=True,
+            ) as proc:
+                for line in proc.stdout:
+                    out.append(line)
+                    yield line.rstrip('\n')
+            err.seek(0)
+            self.err = err.read()
+        self.out = ''.join(out)
+        self.rc = proc.returncode
+
+    def iter_events(
+        self, playbook, extra_vars=None, vars_files=None, verbose_level=1,
+        run_in_check_mode=False, ssh_common_args=None,
+        vault_password_file=None,
+    ):
+        """
+        Run Ansible playbook against all hosts and yield its events as they
+        arrive
+
+        Args:
+            playbook (str): Local path to playbook
+            extra_vars (dict): Dictionary of extra variables
+            vars_files (list): List of local paths to variable files
+            verbose_level (int): How much should playbook be verbose, 1
+                through 5
+            run_in_check_mode (bool): Run playbook with --check parameter
+            ssh_common_args (list): List of options that will extend the list
+                of default options that Ansible uses when calling ssh
+            vault_password_file (str): Local path to a vault password file
+
+        Yields:
+            AnsibleEvent: parsed event
+        """
+        self.logger.info(
+            "Running playbook %s on %d hosts", os.path.basename(playbook),
+            len(self.hosts)
+        )
+        self.recap = None
+        self.results = dict((host.ip, []) for host in self.hosts)
+        tmp_dir = tempfile.mkdtemp(prefix="rrmngmnt-")
+        try:
+            self.cmd = [
+                self.binary,
+                "-i", self._write_file(
+                    tmp_dir, self.inventory_file,
+                    json.dumps(self.generate_inventory()),
+                ),
+                "--forks={}".format(self.forks),
+            ]
+            if extra_vars:
+                self.cmd.append(
+                    "-e@{}".format(
+                        self._write_file(
+                            tmp_dir, self.extra_vars_file,
+                            json.dumps(extra_vars),
+                        )
+                    )
+                )
+            for f in vars_files or []:
+                self.cmd.append("-e@{}".format(f))
+            if vault_password_file:
+                self.cmd.append(
+                    "--vault-password-file={}".format(vault_password_file)
+                )
+            self.cmd.append("-{}".format("v" * verbose_level))
+            if run_in_check_mode:
+                self.cmd.append(self.check_mode_param)
+            if ssh_common_args:
+                self.cmd.append(
+                    "{}={}".format(
+                        self.ssh_common_args_param, " ".join(ssh_common_args)
+                    )
+                )
+            self.cmd.append(playbook)
+
+            env = dict(os.environ)
+            env[self.stdout_callback_env] = self.event_callback_plugin
+            # same as paramiko.AutoAddPolicy used by RemoteExecutor
+            env['ANSIBLE_HOST_KEY_CHECKING'] = 'False'
+
+            self.logger.debug("Executing: {}".format(" ".join(self.cmd)))
+            err_path = os.path.join(tmp_dir, "stderr")
+            for line in self._read_lines(env, err_path):
+                self.logger.debug(line)
+                for event in AnsibleEvent.parse(line):
+                    if event.type == AnsibleEvent.RESULT:
+                        self.results.setdefault(event.host, []).append(event)
+                    elif event.type == AnsibleEvent.STATS:
+                        self.recap = event.stats
+                    yield event
+            self.logger.debug(
+                "Ansible playbook finished with RC: {}".format(self.rc)
+            )
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def run(self, playbook, event_handler=None, **kwargs):
+        """
+        Run Ansible playbook against all hosts
+
+        Per host results are stored in results attribute (dict of host ip
+        and list of AnsibleEvent objects) and PLAY RECAP in recap attribute.
+
+        Args:
+            playbook (str): Local path to playbook
+            event_handler (callable): called with AnsibleEvent for each
+                parsed event as soon as it arrives
+            kwargs (dict): Other parameters of iter_events method
+
+        Returns:
+            tuple: tuple of (rc, out, err)
+        """
+        for event in self.iter_events(playbook, **kwargs):
+            if event_handler is not None:
+                event_handler(event)
         return self.rc, self.out, self.err
@@ -1,3 +1,4 @@
+from rrmngmnt import tracing
 from rrmngmnt.resource import Resource
 import re
 
@@ -25,6 +26,10 @@ class Service(Resource):
         super(Service, self).__init__()
         self.host = host
 
+    def __init_subclass__(cls, **kwargs):
+        super(Service, cls).__init_subclass__(**kwargs)
+        tracing.register(cls)
+
 
 class SystemService(Service):
     """
@@ -1,11 +1,13 @@
+import logging
 import os
 import time
 import socket
 import paramiko
 import contextlib
 import subprocess
+import threading
 import warnings
-from rrmngmnt.common import normalize_string
+from rrmngmnt import metrics
 from rrmngmnt.executor import Executor, ExecutorFactory
 from rrmngmnt.user import UserWithPKey
 
@@ -17,6 +19,66 @@ ID_RSA_PRV = os.path.join("%s", ".ssh/id_rsa")
 CONNECTIVITY_TIMEOUT = 600
 CONNECTIVITY_SAMPLE_TIME = 20
 TCP_CONNECTION_TIMEOUT = 20
+PKEY_TYPES = (paramiko.RSAKey, paramiko.ECDSAKey, paramiko.Ed25519Key)
+
+# path -> ((mtime, size), key type, key)
+_pkeys = {}
+_pkeys_lock = threading.Lock()
+
+
+def load_pkey(filename):
+    """
+    Load private key from file. Keys are cached for whole process by path
+    and modification time of file, so file is read and parsed once, also
+    detected type of key is remembered and tried first when file changes.
+
+    Args:
+        filename (str): path to private key
+
+    Returns:
+        paramiko.PKey: loaded key
+
+    Raises:
+        SSHException: when key is not of any supported type
+    """
+    path = os.path.abspath(filename)
+    stat = os.stat(path)
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    with _pkeys_lock:
+        cached = _pkeys.get(path)
+        if cached is not None and cached[0] == stamp:
+            return cached[2]
+        key_types = PKEY_TYPES
+        if cached is not None:
+            key_types = (cached[1],) + tuple(
+                t for t in PKEY_TYPES if t is not cached[1]
+            )
+        errors = []
+        for key_type in key_types:
+            try:
+                pkey = key_type.from_private_key_file(filename=path)
+            except paramiko.ssh_exception.SSHException as exp:
+                errors.append(str(exp))
+                continue
+            _pkeys[path] = (stamp, key_type, pkey)
+            return pkey
+    raise paramiko.ssh_exception.SSHException(f"Invalid Key {errors}")
+
+
+def clear_pkey_cache():
+    """
+    Forget all loaded private keys
+    """
+    with _pkeys_lock:
+        _pkeys.clear()
+
+
+def agent_available():
+    """
+    Returns:
+        bool: True if ssh-agent is running for this process
+    """
+    return bool(os.environ.get('SSH_AUTH_SOCK'))
 
 
 class RemoteExecutor(Executor):
@@ -61,7 +123,13 @@ class RemoteExecutor(Executor):
             self._timeout = timeout
             self._ssh = paramiko.SSHClient()
             self._ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            if isinstance(self._executor.user, UserWithPKey):
+            if (
+                isinstance(self._executor.user, UserWithPKey) and
+                self._executor.use_agent and agent_available()
+            ):
+                # paramiko authenticates by keys of agent
+                self.pkey = None
+            elif isinstance(self._executor.user, UserWithPKey):
                 self.pkey = self._get_pkey(
                     filename=self._executor.user.private_key
                 )
@@ -74,6 +142,7 @@ class RemoteExecutor(Executor):
                 self._executor.user.password = None
             else:
                 self.pkey = None
+            self._event = None
 
         def __exit__(self, type_, value, tb):
             if type_ is socket.timeout:
@@ -90,7 +159,18 @@ class RemoteExecutor(Executor):
 
         def open(self):
             self._ssh.get_host_keys().clear()
+            self._event = metrics.start(metrics.SESSION, self._executor)
+            event = metrics.start(metrics.SESSION_OPEN, self._executor)
+            sock = self._executor.sock
             try:
+                if event is not None and sock is None:
+                    # Connect on our own, so TCP connect can be told apart
+                    # from key exchange and authentication.
+                    sock = socket.create_connection(
+                        (self._executor.address, self._executor.port),
+                        self._timeout,
+                    )
+                    event.phase(metrics.TCP_CONNECT)
                 self._ssh.connect(
                     self._executor.address,
                     username=self._executor.user.name,
@@ -99,21 +179,39 @@ class RemoteExecutor(Executor):
                     pkey=self.pkey,
                     port=self._executor.port,
                     disabled_algorithms=self._executor.disabled_algorithms,
-                    sock=self._executor.sock,
+                    sock=sock,
                 )
+                if event is not None:
+                    event.phase(metrics.HANDSHAKE)
             except (socket.gaierror, socket.herror) as ex:
                 args = list(ex.args)
                 message = "%s: %s" % (self._executor.address, args[1])
                 args[1] = message
                 ex.strerror = message
                 ex.args = tuple(args)
+                self._finish_open(event, ex)
                 raise
             except socket.timeout as ex:
                 self._update_timeout_exception(ex)
+                self._finish_open(event, ex)
+                raise
+            except Exception as ex:
+                self._finish_open(event, ex)
                 raise
+            self._finish_open(event)
+
+        def _finish_open(self, event, error=None):
+            if event is not None:
+                metrics.finish(event, error)
+            if error is not None and self._event is not None:
+                metrics.finish(self._event, error)
+                self._event = None
 
         def close(self):
             self._ssh.close()
+            if self._event is not None:
+                metrics.finish(self._event)
+                self._event = None
 
         def _update_timeout_exception(self, ex, timeout=None):
             if getattr(ex, '_updated', False):
@@ -129,39 +227,59 @@ class RemoteExecutor(Executor):
         def command(self, cmd):
             return RemoteExecutor.Command(cmd, self)
 
-        def run_cmd(self, cmd, input_=None, timeout=None, get_pty=False):
+        def run_cmd(
+            self, cmd, input_=None, timeout=None, get_pty=False,
+            discard_output=False,
+        ):
             if self._executor.sudo:
                 cmd.insert(0, "sudo")
 
             cmd = self.command(cmd)
-            return cmd.run(input_, timeout, get_pty=get_pty)
+            return cmd.run(
+                input_, timeout, get_pty=get_pty,
+                discard_output=discard_output,
+            )
 
         @contextlib.contextmanager
         def open_file(self, path, mode='r', bufsize=-1):
-            with contextlib.closing(self._ssh.open_sftp()) as sftp:
-                with contextlib.closing(
-                    sftp.file(
-                        path,
-                        mode,
-                        bufsize,
-                    )
-                ) as fh:
-                    yield fh
+            event = metrics.start(
+                metrics.FILE_OPEN, self._executor, path=path, mode=mode,
+            )
+            error = None
+            try:
+                with contextlib.closing(self._ssh.open_sftp()) as sftp:
+                    with contextlib.closing(
+                        sftp.file(
+                            path,
+                            mode,
+                            bufsize,
+                        )
+                    ) as fh:
+                        if event is None:
+                            yield fh
+                            return
+                        event.phase(metrics.CHANNEL_OPEN)
+                        try:
+                            yield fh
+                        finally:
+                            # Position of file is amount of data transferred
+                            # by sequential reads or writes
+                            if not fh.closed:
+                                if mode.startswith('r') and '+' not in mode:
+                                    event.bytes_in += fh.tell()
+                                else:
+                                    event.bytes_out += fh.tell()
+                    event.phase(metrics.TRANSFER)
+            except Exception as ex:
+                error = ex
+                raise
+            finally:
+                if event is not None:
+                    metrics.finish(event, error)
 
         @staticmethod
         def _get_pkey(filename):
-            errors = []
-            for key_type in (
-                    paramiko.RSAKey,
-                    paramiko.ECDSAKey,
-                    paramiko.Ed25519Key,
-            ):
-                try:
-                    return key_type.from_private_key_file(filename=filename)
-                except paramiko.ssh_exception.SSHException as exp:
-                    errors.append(str(exp))
-                    continue
-            raise paramiko.ssh_exception.SSHException(f"Invalid Key {errors}")
+            return load_pkey(filename)
 
     class Command(Executor.Command):
         """
@@ -179,6 +297,7 @@ class RemoteExecutor(Executor):
             self._in = None
             self._out = None
             self._err = None
+            self._event = None
 
         def get_rc(self, wait=False):
             if self._rc is None:
@@ -196,6 +315,10 @@ class RemoteExecutor(Executor):
                 # where in_, out and err are file-like objects
                 # where you can read data from these
             """
+            self._event = metrics.start(
+                metrics.COMMAND_EXECUTE, self._ss._executor, cmd=self.cmd,
+            )
+            error = None
             try:
                 self.logger.debug("Executing: %s", self.cmd)
                 self._in, self._out, self._err = self._ss._ssh.exec_command(
@@ -204,10 +327,18 @@ class RemoteExecutor(Executor):
                     timeout=timeout,
                     get_pty=get_pty,
                 )
+                if self._event is not None:
+                    self._event.phase(metrics.CHANNEL_OPEN)
                 yield self._in, self._out, self._err
                 self.get_rc(True)
+                if self._event is not None:
+                    self._event.phase(metrics.EXECUTION)
             except socket.timeout as ex:
                 self._ss._update_timeout_exception(ex, timeout)
+                error = ex
+                raise
+            except Exception as ex:
+                error = ex
                 raise
             finally:
                 if self._in is not None:
@@ -216,21 +347,48 @@ class RemoteExecutor(Executor):
                     self._out.close()
                 if self._err is not None:
                     self._err.close()
-                self.logger.debug("Results of command: %s", self.cmd)
-                self.logger.debug("  OUT: %s", self.out)
-                self.logger.debug("  ERR: %s", self.err)
-                self.logger.debug("  RC: %s", self.rc)
-
-        def run(self, input_, timeout=None, get_pty=False):
+                if self.logger.isEnabledFor(logging.DEBUG):
+                    # don't decode output just for logs
+                    self.logger.debug("Results of command: %s", self.cmd)
+                    self.logger.debug("  OUT: %s", self.out)
+                    self.logger.debug("  ERR: %s", self.err)
+                    self.logger.debug("  RC: %s", self.rc)
+                if self._event is not None:
+                    self._event.attrs['rc'] = self._rc
+                    metrics.finish(self._event, error)
+
+        def run(
+            self, input_, timeout=None, get_pty=False, discard_output=False,
+        ):
+            """
+            Args:
+                input_ (str): input data
+                timeout (float): timeout for the command
+                get_pty (bool): get pseudoterminal
+                discard_output (bool): drop stdout on the host, only rc and err
+                    are of interest
+
+            Returns:
+                CommandResult: rc, out and err of command
+            """
+            if discard_output:
+                self.discard_output()
             with self.execute(
                 timeout=timeout, get_pty=get_pty
             ) as (in_, out, err):
                 if input_:
                     in_.write(input_)
                     in_.close()
-                self.out = normalize_string(out.read())
-                self.err = normalize_string(err.read())
-            return self.rc, self.out, self.err
+                out = out.read()
+                err = err.read()
+                if self._event is not None:
+                    self._event.bytes_out += len(input_ or '')
+                    self._event.bytes_in += len(out) + len(err)
+                # decoded on first access
+                self.out = out
+                self.err = err
+            self.result.rc = self.rc
+            return self.result
 
     def __init__(self,
                  user,
@@ -240,6 +398,7 @@ class RemoteExecutor(Executor):
                  sudo=False,
                  disabled_algorithms=None,
                  sock=None,
+                 use_agent=False,
                  ):
         """
         Args:
@@ -249,6 +408,8 @@ class RemoteExecutor(Executor):
             port (int): Port to connect
             sudo (bool): Use sudo to execute command.
             sock (ProxyCommand): Proxy command to use.
+            use_agent (bool): Authenticate UserWithPKey by keys of
+                ssh-agent when it is running, key file is not read then.
         """
         super(RemoteExecutor, self).__init__(user)
         self.address = address
@@ -257,6 +418,7 @@ class RemoteExecutor(Executor):
         self.sudo = sudo
         self.disabled_algorithms = disabled_algorithms
         self.sock = sock
+        self.use_agent = use_agent
         if use_pkey:
             warnings.warn(
                 "Parameter 'use_pkey' is deprecated and will be removed in "
@@ -279,7 +441,8 @@ class RemoteExecutor(Executor):
             input_=None,
             tcp_timeout=None,
             io_timeout=None,
-            get_pty=False
+            get_pty=False,
+            discard_output=False,
     ):
         """
         Args:
@@ -289,12 +452,17 @@ class RemoteExecutor(Executor):
             io_timeout (float): Timeout for data operation (read/write)
             get_pty (bool) : get pseudoterminal
                 (equivalent to passing -t arg to ssh)
+            discard_output (bool): Drop stdout on the host, only rc and err
+                are of interest
 
         Returns:
-            tuple (int, str, str): Rc, out, err
+            CommandResult: Rc, out, err, it behaves as tuple
         """
         with self.session(tcp_timeout) as session:
-            return session.run_cmd(cmd, input_, io_timeout, get_pty=get_pty)
+            return session.run_cmd(
+                cmd, input_, io_timeout, get_pty=get_pty,
+                discard_output=discard_output,
+            )
 
     def is_connective(self, tcp_timeout=20.0):
         """
@@ -356,12 +524,14 @@ class RemoteExecutor(Executor):
 
 class RemoteExecutorFactory(ExecutorFactory):
     def __init__(
-        self, use_pkey=False, port=22, disabled_algorithms=None, sock=None
+        self, use_pkey=False, port=22, disabled_algorithms=None, sock=None,
+        use_agent=False,
     ):
         self.use_pkey = use_pkey
         self.port = port
         self.disabled_algorithms = disabled_algorithms
         self.sock = sock
+        self.use_agent = use_agent
         if use_pkey:
             warnings.warn(
                 "Parameter 'use_pkey' is deprecated and will be removed in "
@@ -377,4 +547,5 @@ class RemoteExecutorFactory(ExecutorFactory):
             sudo=sudo,
             disabled_algorithms=self.disabled_algorithms,
             sock=paramiko.ProxyCommand(self.sock) if self.sock else self.sock,
+            use_agent=self.use_agent,
         )
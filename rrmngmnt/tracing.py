@@ -0,0 +1,306 @@
+"""
+This module provides tracing of operations done on hosts.
+
+Public methods of services, executor sessions and commands are recorded as
+spans, each span knows its parent, so it is visible which remote commands
+were issued by which call.
+
+Example:
+    with tracing.Tracer() as tracer:
+        host.network.get_info()
+    tracer.write_chrome_trace('/tmp/trace.json')
+"""
+import functools
+import inspect
+import itertools
+import json
+import os
+import threading
+import time
+import weakref
+
+from rrmngmnt import metrics
+
+_tracers = []
+# classes registered for tracing, their methods are wrapped only when the
+# first tracer is started
+_classes = weakref.WeakSet()
+_instrumented = False
+_lock = threading.Lock()
+
+
+class Span(object):
+    """
+    Single traced operation
+    """
+    __slots__ = (
+        'span_id', 'parent_id', 'name', 'attrs', 'start', 'end', 'thread',
+        'error',
+    )
+
+    def __init__(self, span_id, parent_id, name, attrs):
+        self.span_id = span_id
+        self.parent_id = parent_id
+        self.name = name
+        self.attrs = attrs
+        self.start = time.monotonic()
+        self.end = None
+        self.thread = threading.current_thread().ident
+        self.error = None
+
+    @property
+    def duration(self):
+        end = self.end if self.end is not None else time.monotonic()
+        return end - self.start
+
+
+def _value(value):
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return str(value)
+
+
+class Tracer(metrics.Hook):
+    """
+    Records spans of services, sessions and commands while it is started.
+    """
+    def __init__(self):
+        super(Tracer, self).__init__()
+        self.spans = []
+        self._ids = itertools.count(1)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._events = {}
+        self._wall = time.time()
+        self._origin = time.monotonic()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, type_, value, tb):
+        self.stop()
+
+    def start(self):
+        """
+        Start recording of spans
+
+        Returns:
+            Tracer: self
+        """
+        _instrument()
+        _tracers.append(self)
+        metrics.add_hook(self)
+        return self
+
+    def stop(self):
+        """
+        Stop recording of spans
+        """
+        metrics.remove_hook(self)
+        _tracers.remove(self)
+
+    @property
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def open_span(self, name, **attrs):
+        """
+        Open span as child of the innermost open span of current thread
+
+        Args:
+            name (str): name of span
+            attrs (dict): attributes of span
+
+        Returns:
+            Span: opened span
+        """
+        stack = self._stack
+        span = Span(
+            next(self._ids),
+            stack[-1].span_id if stack else None,
+            name,
+            dict((k, _value(v)) for k, v in attrs.items()),
+        )
+        stack.append(span)
+        return span
+
+    def close_span(self, span, error=None):
+        """
+        Args:
+            span (Span): span to close
+            error (Exception): exception which ended the operation
+        """
+        span.end = time.monotonic()
+        if error is not None:
+            span.error = "%s: %s" % (type(error).__name__, error)
+        stack = self._stack
+        if span in stack:
+            # Spans of streams can be closed out of order
+            stack.remove(span)
+        with self._lock:
+            self.spans.append(span)
+
+    def pre(self, event):
+        attrs = dict(event.attrs)
+        attrs['host'] = event.host
+        self._events[id(event)] = self.open_span(event.name, **attrs)
+
+    def post(self, event):
+        span = self._events.pop(id(event), None)
+        if span is None:
+            return
+        for key, value in event.attrs.items():
+            span.attrs[key] = _value(value)
+        if event.bytes_in or event.bytes_out:
+            span.attrs['bytes_in'] = event.bytes_in
+            span.attrs['bytes_out'] = event.bytes_out
+        for phase, value in event.phases.items():
+            span.attrs['%s_seconds' % phase] = value
+        self.close_span(span, event.error)
+
+    def as_dicts(self):
+        """
+        Returns:
+            list: finished spans as dicts, ordered by start
+        """
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s.start)
+        return [
+            {
+                'id': s.span_id,
+                'parent': s.parent_id,
+                'name': s.name,
+                'start': self._wall + s.start - self._origin,
+                'duration': s.duration,
+                'thread': s.thread,
+                'error': s.error,
+                'attrs': s.attrs,
+            }
+            for s in spans
+        ]
+
+    def write_jsonl(self, path):
+        """
+        Write finished spans, one JSON object per line
+
+        Args:
+            path (str): path to local file
+        """
+        with open(path, 'w') as fh:
+            for span in self.as_dicts():
+                fh.write(json.dumps(span))
+                fh.write("\n")
+
+    def to_chrome_trace(self):
+        """
+        Returns:
+            dict: finished spans in Chrome trace event format, which can be
+                loaded by chrome://tracing or Perfetto
+        """
+        events = []
+        for span in self.as_dicts():
+            args = dict(span['attrs'], id=span['id'], parent=span['parent'])
+            if span['error']:
+                args['error'] = span['error']
+            events.append({
+                'name': span['name'],
+                'cat': span['name'].split('.')[0],
+                'ph': 'X',
+                'ts': span['start'] * 1e6,
+                'dur': span['duration'] * 1e6,
+                'pid': os.getpid(),
+                'tid': span['thread'],
+                'args': args,
+            })
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def write_chrome_trace(self, path):
+        """
+        Args:
+            path (str): path to local file
+        """
+        with open(path, 'w') as fh:
+            json.dump(self.to_chrome_trace(), fh)
+
+
+def _traced(func):
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        if not _tracers:
+            return func(self, *args, **kwargs)
+        name = "%s.%s" % (type(self).__name__, func.__name__)
+        host = getattr(getattr(self, 'host', None), 'ip', None)
+        spans = [(t, t.open_span(name, host=host)) for t in list(_tracers)]
+        error = None
+        try:
+            return func(self, *args, **kwargs)
+        except Exception as ex:
+            error = ex
+            raise
+        finally:
+            for tracer, span in spans:
+                tracer.close_span(span, error)
+    wrapper._traced = True
+    return wrapper
+
+
+def trace_methods(cls):
+    """
+    Wrap public methods defined by class, so they are recorded as spans
+    while any tracer is started.
+
+    Generators and context managers are left as they are, their calls
+    return before the work is done.
+
+    Args:
+        cls (type): class to instrument
+
+    Returns:
+        type: the same class
+    """
+    for name, value in list(vars(cls).items()):
+        if name.startswith('_') or not inspect.isfunction(value):
+            continue
+        if getattr(value, '_traced', False):
+            continue
+        if inspect.isgeneratorfunction(inspect.unwrap(value)):
+            continue
+        setattr(cls, name, _traced(value))
+    return cls
+
+
+def register(cls):
+    """
+    Trace public methods of class, see trace_methods. Methods are wrapped
+    when the first tracer is started, so calls have no overhead until
+    tracing is used.
+
+    Args:
+        cls (type): class to instrument
+
+    Returns:
+        type: the same class
+    """
+    with _lock:
+        if _instrumented:
+            trace_methods(cls)
+        else:
+            _classes.add(cls)
+    return cls
+
+
+def _instrument():
+    """
+    Wrap methods of all registered classes
+    """
+    global _instrumented
+    with _lock:
+        if _instrumented:
+            return
+        for cls in list(_classes):
+            trace_methods(cls)
+        _classes.clear()
+        _instrumented = True
@@ -38,6 +38,16 @@ class ByteFakeFile(six.BytesIO):
         six.BytesIO.close(self)
 
 
+class FakeStdin(six.StringIO):
+    """
+    Accepts both text and bytes, same as stdin of remote command.
+    """
+    def write(self, data):
+        if isinstance(data, six.binary_type):
+            data = data.decode("utf-8", errors="replace")
+        return six.StringIO.write(self, data)
+
+
 class FakeExecutor(Executor):
     cmd_to_data = None
     files_content = {}
@@ -62,7 +72,7 @@ class FakeExecutor(Executor):
                 data = self._executor.files_content[name]
             except KeyError:
                 raise Exception("There is not such file %s" % name)
-            if isinstance(data, FakeFile):
+            if isinstance(data, (FakeFile, ByteFakeFile)):
                 data = data.data
             return data
 
@@ -101,13 +111,14 @@ class FakeExecutor(Executor):
                     in_.write(input_)
                 self.out = out.read()
                 self.err = err.read()
-            return self.rc, self.out, self.err
+            self.result.rc = self.rc
+            return self.result
 
         @contextlib.contextmanager
         def execute(self, bufsize=-1, timeout=None):
             rc, out, err = self._ss.get_data(self.cmd)
             self._rc = rc
-            yield six.StringIO(), six.StringIO(out), six.StringIO(err)
+            yield FakeStdin(), six.StringIO(out), six.StringIO(err)
 
     def __init__(self, user, address):
         super(FakeExecutor, self).__init__(user)
@@ -0,0 +1,325 @@
+"""
+Performance benchmarks, they are skipped unless RRMNGMNT_BENCHMARK is set
+to path of results file. Every run appends one JSON line with results, so
+the file can be used to track performance across commits.
+
+    RRMNGMNT_BENCHMARK=bench.jsonl pytest tests/test_benchmark.py
+
+Benchmarks of parsers run against FakeExecutor, benchmarks of connection
+handling need docker containers from tests/docker-compose.yml and are
+enabled by RRMNGMNT_BENCHMARK_DOCKER=1.
+"""
+import json
+import os
+import platform
+import statistics
+import subprocess
+import threading
+import time
+from subprocess import list2cmdline
+
+import pytest
+
+from rrmngmnt import Database, Host, User, metrics
+from rrmngmnt.db import PsqlSession
+from rrmngmnt.openssh import OpenSSHExecutorFactory
+
+from tests.common import FakeExecutorFactory
+from tests.test_import import run_import
+
+RESULTS_PATH = os.environ.get('RRMNGMNT_BENCHMARK')
+DOCKER = os.environ.get('RRMNGMNT_BENCHMARK_DOCKER')
+MIN_TIME = float(os.environ.get('RRMNGMNT_BENCHMARK_MIN_TIME', '0.5'))
+SFTP_SIZES = (64 * 1024, 1024 * 1024, 16 * 1024 * 1024)
+PARALLEL_SIZE = 64 * 1024 * 1024
+PARALLEL_STREAMS = (1, 2, 4, 8)
+BACKENDS = ('paramiko', 'openssh')
+
+pytestmark = pytest.mark.skipif(
+    not RESULTS_PATH, reason="RRMNGMNT_BENCHMARK is not set",
+)
+docker = pytest.mark.skipif(
+    not DOCKER, reason="RRMNGMNT_BENCHMARK_DOCKER is not set",
+)
+
+if DOCKER:
+    from tests.test_docker import provisioned_hosts  # noqa: F401
+
+
+def _commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'],
+            cwd=os.path.dirname(__file__), stderr=subprocess.DEVNULL,
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+@pytest.fixture(scope='module')
+def results():
+    records = []
+    yield records
+    if not records:
+        return
+    with open(RESULTS_PATH, 'a') as fh:
+        fh.write(json.dumps({
+            'commit': _commit(),
+            'timestamp': time.time(),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'results': records,
+        }))
+        fh.write("\n")
+
+
+def measure(func, min_time=None, min_rounds=3):
+    """
+    Call function repeatedly for at least min_time seconds
+
+    Returns:
+        float: median duration of one call in seconds
+    """
+    min_time = MIN_TIME if min_time is None else min_time
+    rounds = []
+    while len(rounds) < min_rounds or sum(rounds) < min_time:
+        start = time.perf_counter()
+        func()
+        rounds.append(time.perf_counter() - start)
+    return statistics.median(rounds)
+
+
+def record(results, name, value, unit, **params):
+    results.append(
+        {'name': name, 'value': value, 'unit': unit, 'params': params}
+    )
+
+
+def fake_host(data):
+    h = Host('1.1.1.1')
+    h.add_user(User('root', '11111'))
+    h.executor_factory = FakeExecutorFactory(data, {})
+    return h
+
+
+class TestImport(object):
+    """
+    Time of 'from rrmngmnt import Host' in fresh interpreter, it was about
+    0.25s when all modules were imported eagerly
+    """
+    def test_import(self, results):
+        duration = min(run_import()['duration'] for _ in range(5))
+        record(results, 'import.host', duration, 's')
+
+
+class TestParsers(object):
+    """
+    Throughput of parsers on large synthetic outputs
+    """
+    lines = 10000
+
+    def test_fake_executor(self, results):
+        host = fake_host({'true': (0, '', '')})
+        duration = measure(lambda: host.run_command(['true']))
+        record(results, 'fake_executor.run_command', 1 / duration, 'cmd/s')
+
+    def test_nmcli_connections(self, results):
+        out = "\n".join(
+            "con%d:%08d-0000-0000-0000-000000000000:802-3-ethernet:eth%d" % (
+                i, i, i
+            )
+            for i in range(self.lines)
+        )
+        host = fake_host({'nmcli -t connection show': (0, out, '')})
+        nmcli = host.network.nmcli
+        assert len(nmcli.get_all_connections()) == self.lines
+        duration = measure(nmcli.get_all_connections)
+        record(
+            results, 'parser.nmcli.get_all_connections',
+            self.lines / duration, 'lines/s', lines=self.lines,
+        )
+
+    def test_ip_addr(self, results):
+        out = "\n".join(
+            "%d: eth%d: <BROADCAST,MULTICAST,UP,LOWER_UP> mtu 1500\n"
+            "    link/ether 52:54:00:00:%02x:%02x brd ff:ff:ff:ff:ff:ff\n"
+            "    inet 10.%d.%d.1/24 brd 10.%d.%d.255 scope global eth%d" % (
+                i, i, i // 256 % 256, i % 256, i // 256 % 256, i % 256,
+                i // 256 % 256, i % 256, i,
+            )
+            for i in range(self.lines // 3)
+        )
+        host = fake_host({'ip addr': (0, out, '')})
+        assert len(host.network.find_ips()[0]) == self.lines // 3
+        duration = measure(host.network.find_ips)
+        record(
+            results, 'parser.ip.find_ips',
+            out.count("\n") / duration, 'lines/s', lines=out.count("\n"),
+        )
+
+    def test_list_rules(self, results):
+        out = "\n".join(
+            "-A INPUT -s 10.%d.%d.0/24 -p tcp -m multiport --dports 22,80 "
+            "-j ACCEPT" % (i // 256 % 256, i % 256)
+            for i in range(self.lines)
+        )
+        host = fake_host({
+            'iptables --list-rules INPUT': (0, out, ''),
+        })
+        chain = host.firewall.chain('INPUT')
+        assert len(chain.get_rules()) == self.lines
+        for name, func in (
+            ('list_rules', chain.list_rules), ('get_rules', chain.get_rules),
+        ):
+            duration = measure(func)
+            record(
+                results, 'parser.firewall.%s' % name,
+                self.lines / duration, 'lines/s', lines=self.lines,
+            )
+
+    def test_psql(self, results):
+        db = Database(
+            fake_host({}), 'db_name', User('db_user', 'db_pass'),
+        )
+        sql = "SELECT id, name FROM vms"
+        separator = PsqlSession.record_separator
+        cmd = db._psql_base_cmd() + ['-R', separator, '-t', '-A', '-c', sql]
+        out = separator.join(
+            "%d|vm-%d" % (i, i) for i in range(self.lines)
+        )
+        copy = db._copy_to_stdout_cmd(sql)
+        csv = "".join("%d,vm-%d\n" % (i, i) for i in range(self.lines))
+        db.host = fake_host({
+            list2cmdline(cmd): (0, out, ''),
+            list2cmdline(copy): (0, csv, ''),
+        })
+        assert len(db.psql(sql)) == self.lines
+        for name, func in (
+            ('psql', lambda: db.psql(sql)),
+            ('query_iter', lambda: list(db.query_iter(sql))),
+        ):
+            duration = measure(func)
+            record(
+                results, 'parser.db.%s' % name,
+                self.lines / duration, 'rows/s', rows=self.lines,
+            )
+
+
+@docker
+class TestConnection(object):
+    """
+    Connection handling against sshd running in containers
+    """
+    commands = 50
+
+    @pytest.fixture(scope='class')
+    def hosts(self, provisioned_hosts):  # noqa: F811
+        return [provisioned_hosts[name] for name in sorted(provisioned_hosts)]
+
+    @staticmethod
+    def executor(host, backend):
+        if backend == 'openssh':
+            factory = OpenSSHExecutorFactory(
+                port=host.executor_factory.port,
+            )
+            return factory.build(host, host.executor_user)
+        return host.executor()
+
+    @pytest.mark.parametrize('backend', BACKENDS)
+    def test_commands_per_session(self, hosts, results, backend):
+        executor = self.executor(hosts[0], backend)
+
+        def run():
+            with executor.session() as ss:
+                for _ in range(self.commands):
+                    ss.run_cmd(['true'])
+
+        duration = measure(run)
+        record(
+            results, 'ssh.commands_per_session',
+            self.commands / duration, 'cmd/s', commands=self.commands,
+            backend=backend,
+        )
+
+    def test_handshake(self, hosts, results):
+        executor = hosts[0].executor()
+        collector = metrics.MetricsCollector()
+        metrics.add_hook(collector)
+        try:
+            def run():
+                with executor.session():
+                    pass
+
+            duration = measure(run)
+        finally:
+            metrics.remove_hook(collector)
+        record(results, 'ssh.handshake', duration, 's')
+        for item in collector.as_dict()['durations']:
+            if item['event'] == metrics.SESSION_OPEN:
+                record(
+                    results, 'ssh.handshake.%s' % item['phase'],
+                    item['sum'] / item['count'], 's',
+                )
+
+    @pytest.mark.parametrize('backend', BACKENDS)
+    @pytest.mark.parametrize('size', SFTP_SIZES)
+    def test_sftp(self, hosts, results, size, backend):
+        executor = self.executor(hosts[0], backend)
+        data = os.urandom(size)
+        path = '/tmp/rrmngmnt-benchmark-%d' % size
+        with executor.session() as ss:
+            def put():
+                with ss.open_file(path, 'wb') as fh:
+                    fh.write(data)
+
+            def get():
+                with ss.open_file(path, 'rb') as fh:
+                    assert len(fh.read()) == size
+
+            for name, func in (('put', put), ('get', get)):
+                duration = measure(func)
+                record(
+                    results, 'sftp.%s' % name,
+                    size / duration, 'B/s', size=size, backend=backend,
+                )
+            ss.run_cmd(['rm', '-f', path])
+
+    @pytest.mark.parametrize('streams', PARALLEL_STREAMS)
+    def test_parallel_transfer(self, hosts, results, streams, tmpdir):
+        src = tmpdir.join('src')
+        src.write_binary(os.urandom(PARALLEL_SIZE))
+        path = '/tmp/rrmngmnt-benchmark-parallel'
+        fs = hosts[0].fs
+        for name, func in (
+            ('put', lambda: fs.put(str(src), path, streams=streams)),
+            ('get', lambda: fs.get(
+                path, str(tmpdir.join('dst')), streams=streams,
+            )),
+        ):
+            duration = measure(func, min_rounds=1)
+            record(
+                results, 'sftp.parallel.%s' % name,
+                PARALLEL_SIZE / duration, 'B/s', size=PARALLEL_SIZE,
+                streams=streams,
+            )
+        fs.remove(path)
+
+    def test_fan_out(self, hosts, results):
+        for count in range(1, len(hosts) + 1):
+            selected = hosts[:count]
+
+            def run():
+                threads = [
+                    threading.Thread(target=h.run_command, args=(['true'],))
+                    for h in selected
+                ]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+
+            duration = measure(run)
+            record(
+                results, 'ssh.fan_out', count / duration, 'cmd/s',
+                hosts=count,
+            )
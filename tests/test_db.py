@@ -1,8 +1,16 @@
 # -*- coding: utf-8 -*-
+import getpass
+import gzip
+import io
+import os
+import subprocess
+
 import pytest
 
 from rrmngmnt import Host, User
-from rrmngmnt.db import Database
+from rrmngmnt.db import Database, PsqlSession
+from rrmngmnt.local import LocalExecutorFactory
+from rrmngmnt.ssh import RemoteExecutorFactory
 
 from .common import FakeExecutorFactory
 
@@ -17,6 +25,50 @@ def fake_cmd_data(cmd_to_data, files=None):
     Host.executor_factory = FakeExecutorFactory(cmd_to_data, files)
 
 
+PSQL_STUB = """#!/bin/sh
+echo "${SUDO_USER:-none} $PGPASSWORD $*" >> %(log)s
+case "$*" in
+*missing*) echo 'ERROR:  relation "missing" does not exist' >&2; exit 1;;
+*"FROM STDIN"*) cat > %(data)s; echo "COPY $(wc -l < %(data)s)";;
+*"TO STDOUT"*) echo 1;;
+*" -c "*) ;;
+*) cat > /dev/null;;
+esac
+"""
+
+
+@pytest.fixture
+def local_db(tmpdir, monkeypatch):
+    """
+    Database on this machine, commands run by LocalExecutor. psql is
+    replaced by script which records its sudo user, password and arguments
+    to psql.log and stores data of COPY FROM STDIN to psql.data, sudo by
+    script which only sets SUDO_USER.
+    """
+    bin_dir = tmpdir.mkdir("bin")
+    psql = bin_dir.join("psql")
+    psql.write(PSQL_STUB % {
+        "log": tmpdir.join("psql.log"), "data": tmpdir.join("psql.data"),
+    })
+    sudo = bin_dir.join("sudo")
+    sudo.write('#!/bin/sh\nSUDO_USER=$(id -un) exec "$@"\n')
+    for script in (psql, sudo):
+        script.chmod(0o755)
+    monkeypatch.setenv("PATH", "%s:%s" % (bin_dir, os.environ["PATH"]))
+    h = Host("127.0.0.1")
+    h.executor_user = User(getpass.getuser(), "")
+    h.executor_factory = RemoteExecutorFactory()
+    h.local_executor_factory = LocalExecutorFactory()
+    return Database(h, "db_name", User("db_user", "db_pass"))
+
+
+@pytest.fixture(scope="class")
+def db():
+    h = Host("1.1.1.1")
+    h.add_user(User("root", "34546"))
+    return Database(h, "db_name", User("db_user", "db_pass"))
+
+
 class TestDb(object):
     data = {
         "which systemctl": (0, "", ""),
@@ -94,3 +146,225 @@ class TestDb(object):
         with pytest.raises(Exception) as ex_info:
             db.psql_cmd("\\\\gg")
         assert "invalid command" in str(ex_info.value)
+
+
+class TestDbSession(object):
+    marker = "__END__"
+    data = {
+        "export PGPASSWORD=db_pass; psql -d db_name -U db_user -h localhost -X": (
+            0,
+            "".join([
+                "key1|value1__RECORD_SEPARATOR__key2|val|ue2\n",
+                "__END__\n",
+                "__END__\n",
+                " Schema |         Name         | Type  | Owner\n",
+                "__END__\n",
+            ]),
+            "".join([
+                "__END__\n",
+                "psql:<stdin>:12: ERROR:  syntax error at or near \"ERROR\"\n",
+                "__END__\n",
+                "__END__\n",
+            ]),
+        ),
+    }
+
+    @classmethod
+    def setup_class(cls):
+        fake_cmd_data(cls.data, {})
+
+    def test_session(self, db, monkeypatch):
+        monkeypatch.setattr(
+            PsqlSession, "_new_marker", staticmethod(lambda: self.marker)
+        )
+        with db.session():
+            res = db.psql("SELECT %s, %s FROM %s", "key", "value", "dist")
+            assert res == [["key1", "value1"], ["key2", "val", "ue2"]]
+            with pytest.raises(Exception) as ex_info:
+                db.psql("SELECT * FROM table ERROR")
+            assert "ERROR:  syntax error" in str(ex_info.value)
+            assert "psql:<stdin>" not in str(ex_info.value)
+            assert "Schema" in db.psql_cmd("\\dt")
+        assert db._session is None
+
+    def test_stderr_drained(self, monkeypatch):
+        monkeypatch.setattr(
+            PsqlSession, "_new_marker", staticmethod(lambda: self.marker)
+        )
+        # notices exceeding pipe buffer are written before result
+        script = (
+            "head -c 1000000 /dev/zero | tr '\\0' x >&2; echo >&2; "
+            "echo result; echo %s; echo %s >&2; cat > /dev/null"
+        ) % (self.marker, self.marker)
+        proc = subprocess.Popen(
+            ["sh", "-c", script], stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            universal_newlines=True,
+        )
+        try:
+            session = PsqlSession(proc.stdin, proc.stdout, proc.stderr)
+            failed, out, err = session.run("\\dt", PsqlSession.cmd_mode)
+        finally:
+            proc.stdin.close()
+            proc.wait()
+        assert (failed, out, len(err)) == (False, "result\n", 1000000)
+
+    def test_errors(self):
+        session = PsqlSession(None, None, None)
+        assert session._errors("psql:<stdin>:3: NOTICE:  table does not exist") == (
+            False, "NOTICE:  table does not exist",
+        )
+        assert session._errors("psql:<stdin>:3: invalid command \\gg") == (
+            True, "invalid command \\gg",
+        )
+
+
+class TestDbQueryIter(object):
+    data = {
+        "export PGPASSWORD=db_pass; psql -d db_name -U db_user -h localhost -X -q -v ON_ERROR_STOP=1 "
+        "-c \"COPY (SELECT id, name, note FROM t) TO STDOUT WITH (FORMAT csv, NULL '\\N')\"": (
+            0,
+            '1,a|b,\\N\n2,"multi\nline","with ""quotes"""\n3,c,\n',
+            "",
+        ),
+        "export PGPASSWORD=db_pass; psql -d db_name -U db_user -h localhost -X -q -v ON_ERROR_STOP=1 "
+        "-c \"COPY (SELECT id, name FROM t) TO STDOUT WITH (FORMAT csv, NULL '\\N', HEADER)\"": (
+            0,
+            "id,name\n1,a\n2,\\N\n",
+            "",
+        ),
+        "export PGPASSWORD=db_pass; psql -d db_name -U db_user -h localhost -X -q -v ON_ERROR_STOP=1 "
+        "-c \"COPY (SELECT * FROM table ERROR) TO STDOUT WITH (FORMAT csv, NULL '\\N')\"": (
+            1,
+            "",
+            "ERROR:  syntax error",
+        ),
+    }
+
+    @classmethod
+    def setup_class(cls):
+        fake_cmd_data(cls.data, {})
+
+    def test_query_iter(self, db):
+        rows = list(db.query_iter("SELECT %s, name, note FROM t;", "id", types=[int]))
+        assert rows == [
+            [1, "a|b", None],
+            [2, "multi\nline", 'with "quotes"'],
+            [3, "c", ""],
+        ]
+
+    def test_query_iter_as_dict(self, db):
+        rows = list(db.query_iter("SELECT id, name FROM t", types={"id": int}, as_dict=True))
+        assert rows == [{"id": 1, "name": "a"}, {"id": 2, "name": None}]
+
+    def test_query_batches(self, db):
+        batches = list(db.query_batches("SELECT id, name, note FROM t", batch_size=2))
+        assert [len(b) for b in batches] == [2, 1]
+
+    def test_query_iter_negative(self, db):
+        with pytest.raises(Exception) as ex_info:
+            list(db.query_iter("SELECT * FROM table ERROR"))
+        assert "syntax error" in str(ex_info.value)
+
+
+class TestDbCopy(object):
+    psql = "psql -d db_name -U db_user -h localhost -X"
+    data = {
+        "export PGPASSWORD=db_pass; " + psql + " -v ON_ERROR_STOP=1 "
+        "-c \"COPY t (a, b) FROM STDIN WITH (FORMAT csv, NULL '\\N')\"": (0, "COPY 3\n", ""),
+        "export PGPASSWORD=db_pass; gunzip -c | " + psql + " -v ON_ERROR_STOP=1 "
+        "-c \"COPY t FROM STDIN WITH (FORMAT csv, NULL '\\N', HEADER)\"": (0, "COPY 2\n", ""),
+        "export PGPASSWORD=db_pass; " + psql + " -v ON_ERROR_STOP=1 "
+        "-c \"COPY missing FROM STDIN WITH (FORMAT csv, NULL '\\N')\"": (
+            1, "", 'ERROR:  relation "missing" does not exist',
+        ),
+        "export PGPASSWORD=db_pass; " + psql + " -q -v ON_ERROR_STOP=1 "
+        "-c \"COPY t TO STDOUT WITH (FORMAT csv, NULL '\\N')\"": (0, "1,a\n2,\\N\n", ""),
+        "export PGPASSWORD=db_pass; " + psql + " -q -v ON_ERROR_STOP=1 "
+        "-c \"COPY (SELECT a FROM t) TO STDOUT WITH (FORMAT csv, NULL '\\N', HEADER)\"": (0, "a\n1\n2\n", ""),
+    }
+
+    @classmethod
+    def setup_class(cls):
+        fake_cmd_data(cls.data, {})
+
+    def test_copy_in_rows(self, db):
+        assert db.copy_in("t (a, b)", [(1, "a"), (2, None), (3, "x,y")]) == 3
+
+    def test_copy_in_compressed_file(self, db, tmpdir):
+        path = tmpdir.join("data.csv")
+        path.write("a,b\n1,a\n2,b\n")
+        assert db.copy_in("t", str(path), header=True, compress=True) == 2
+
+    def test_copy_in_negative(self, db):
+        with pytest.raises(Exception) as ex_info:
+            db.copy_in("missing", [(1,)])
+        assert "does not exist" in str(ex_info.value)
+
+    def test_copy_out_table(self, db, tmpdir):
+        path = tmpdir.join("out.csv")
+        assert db.copy_out("t", str(path)) == 9
+        assert path.read() == "1,a\n2,\\N\n"
+
+    def test_copy_out_query(self, db):
+        buf = io.BytesIO()
+        db.copy_out("SELECT a FROM t;", buf, header=True)
+        assert buf.getvalue() == b"a\n1\n2\n"
+
+    def test_csv_chunks(self, db):
+        data = b"".join(db._csv_chunks([(1, None, "a\nb")]))
+        assert data == b'1,\\N,"a\nb"\n'
+
+    def test_gzip_chunks(self, db):
+        chunks = [b"x" * 1000, b"y" * 1000]
+        data = b"".join(db._gzip_chunks(iter(chunks)))
+        assert gzip.decompress(data) == b"".join(chunks)
+
+
+class TestDbLocal(object):
+    """
+    Commands of Database run by real shell
+    """
+    psql = "db_pass -d db_name -U db_user -h localhost"
+
+    def test_session_exit(self, local_db, tmpdir):
+        with local_db.session():
+            pass
+        assert tmpdir.join("psql.log").read() == (
+            "none %s -X\n" % self.psql
+        )
+
+    def test_psql_sudo(self, local_db, tmpdir, monkeypatch):
+        monkeypatch.setattr(local_db.host, "sudo", True)
+        assert local_db.psql("SELECT 1") == []
+        with local_db.session():
+            pass
+        user = getpass.getuser()
+        assert tmpdir.join("psql.log").read() == (
+            "%s %s -R __RECORD_SEPARATOR__ -t -A -c SELECT 1\n"
+            "%s %s -X\n" % (user, self.psql, user, self.psql)
+        )
+
+    def test_query_iter_sudo(self, local_db, tmpdir, monkeypatch):
+        monkeypatch.setattr(local_db.host, "sudo", True)
+        assert list(local_db.query_iter("SELECT 1")) == [["1"]]
+        assert tmpdir.join("psql.log").read() == (
+            "%s %s -X -q -v ON_ERROR_STOP=1 -c COPY (SELECT 1) TO STDOUT "
+            "WITH (FORMAT csv, NULL '\\N')\n" % (getpass.getuser(), self.psql)
+        )
+
+    def test_copy_sudo(self, local_db, tmpdir, monkeypatch):
+        monkeypatch.setattr(local_db.host, "sudo", True)
+        assert local_db.copy_in("t", [(1, "a"), (2, None)], compress=True) == 2
+        assert tmpdir.join("psql.data").read() == "1,a\n2,\\N\n"
+        buf = io.BytesIO()
+        assert local_db.copy_out("t", buf, compress=True) == 2
+        assert buf.getvalue() == b"1\n"
+        with pytest.raises(Exception) as ex_info:
+            local_db.copy_out("missing", io.BytesIO(), compress=True)
+        assert "does not exist" in str(ex_info.value)
+        user = getpass.getuser()
+        assert [
+            line.split(" ", 2)[:2]
+            for line in tmpdir.join("psql.log").read().splitlines()
+        ] == [[user, "db_pass"]] * 3
@@ -2,11 +2,14 @@ import pytest
 from rrmngmnt import Host, User
 from rrmngmnt.ssh import RemoteExecutorFactory
 
+# More than one container is needed to measure fan-out in benchmarks
+CONTAINERS = ('ubuntu', 'ubuntu-2', 'ubuntu-3', 'ubuntu-4')
+
 
 @pytest.fixture(scope='session')
 def provisioned_hosts(docker_ip, docker_services):
     hosts = {}
-    for h in ('ubuntu',):
+    for h in CONTAINERS:
         host = Host(docker_ip)
         host.add_user(User("root", "docker.io"))
         host.executor_factory = RemoteExecutorFactory(
@@ -1,4 +1,6 @@
 from rrmngmnt import Host, User
+from rrmngmnt import executor
+from rrmngmnt.executor import CommandResult
 
 from tests.common import FakeExecutorFactory
 
@@ -20,3 +22,52 @@ def test_executor_with_proxy_command():
     )
     host.executor_factory.sock = sock
     host.executor().run_cmd(['which', 'systemctl'])
+
+
+def test_command_result():
+    result = CommandResult(1, b'\xc5\xbelu\xc5\xa5ou\xc4\x8dk\xc3\xbd\n', b'')
+    rc, out, err = result
+    assert (rc, out, err) == (1, u'žluťoučký\n', '')
+    assert result == (1, u'žluťoučký\n', '')
+    assert result[0] == 1
+    assert result[-1] == ''
+    assert len(result) == 3
+    assert result.out_bytes == b'\xc5\xbelu\xc5\xa5ou\xc4\x8dk\xc3\xbd\n'
+    assert CommandResult(0, 'text', None).out_bytes == b'text'
+    assert not hasattr(result, '__dict__')
+
+
+def test_command_result_lazy():
+    result = CommandResult(0, b'out', b'err')
+    assert result._out is executor._PENDING
+    assert result.out == 'out'
+    assert result.out is result.out
+
+
+class MinimalExecutor(executor.Executor):
+    """
+    Executor which implements only what base classes require
+    """
+    class Session(executor.Executor.Session):
+        def open(self):
+            pass
+
+        def command(self, cmd):
+            return MinimalExecutor.Command(' '.join(cmd), self)
+
+    class Command(executor.Executor.Command):
+        def run(self, input_):
+            self.result.rc = 0
+            self.out = self.cmd
+            return self.result
+
+    def session(self):
+        return MinimalExecutor.Session(self)
+
+
+def test_base_discard_output():
+    minimal = MinimalExecutor(User('root', ''))
+    assert minimal.run_cmd(['true']).out == 'true'
+    assert minimal.run_cmd(['true'], discard_output=True).out == (
+        executor.DISCARD_OUTPUT + 'true'
+    )
@@ -1,7 +1,13 @@
 # -*- coding: utf-8 -*-
+import getpass
+import os
+
 import pytest
 
-from rrmngmnt import Host, User, errors
+from rrmngmnt import Host, User, errors, filesystem
+from rrmngmnt.filesystem import local_manifest
+from rrmngmnt.local import LocalExecutor, LocalExecutorFactory
+from rrmngmnt.ssh import RemoteExecutorFactory
 
 from .common import FakeExecutorFactory
 
@@ -242,3 +248,461 @@ class TestTransfer(object):
             "/path/to/dest_dir",
         )
         assert self.files["/path/to/dest_dir/file_to_transfer"].data == "data to transfer"
+
+
+class TestFSRead(object):
+    content = "".join("line %d\n" % i for i in range(1000))
+    files = {
+        "/var/log/big.log": content,
+        "/var/log/short.log": "first\nlast",
+    }
+
+    @pytest.fixture(scope="class")
+    def host(self):
+        h = Host("1.1.1.1")
+        h.add_user(User("root", "11111"))
+        return h
+
+    @classmethod
+    def setup_class(cls):
+        fake_cmd_data({}, cls.files)
+
+    def test_iter_lines(self, host):
+        lines = list(host.fs.iter_lines("/var/log/big.log", chunk_size=100))
+        assert lines == ["line %d" % i for i in range(1000)]
+        assert list(host.fs.iter_lines("/var/log/short.log")) == [
+            "first", "last",
+        ]
+
+    def test_read_range(self, host):
+        assert host.fs.read_range("/var/log/big.log", 7, 6) == b"line 1"
+        assert host.fs.read_range("/var/log/short.log", 6, 100) == b"last"
+
+    def test_tail(self, host, monkeypatch):
+        monkeypatch.setattr("rrmngmnt.filesystem.TAIL_BLOCK", 16)
+        assert host.fs.tail("/var/log/big.log", 3) == (
+            "line 997\nline 998\nline 999\n"
+        )
+        assert host.fs.tail("/var/log/big.log", 2000) == self.content
+        assert host.fs.tail("/var/log/short.log", 1) == "last"
+        assert host.fs.tail("/var/log/short.log", 0) == ""
+
+    def test_open(self, host):
+        with host.fs.open("/var/log/short.log") as fh:
+            fh.seek(6)
+            assert fh.read() == b"last"
+
+
+@pytest.fixture
+def local_host():
+    """
+    Host which is this machine, commands run by LocalExecutor
+    """
+    h = Host("127.0.0.1")
+    h.executor_user = User(getpass.getuser(), "")
+    h.executor_factory = RemoteExecutorFactory()
+    h.local_executor_factory = LocalExecutorFactory()
+    return h
+
+
+class TestFollow(object):
+    """
+    Follows real files, host is this machine so LocalExecutor is used
+    """
+    def test_follow(self, local_host, tmpdir):
+        first, second = str(tmpdir.join("first")), str(tmpdir.join("second"))
+        tmpdir.join("first").write("1\n2\n")
+        paths = [first, second]
+        with local_host.fs.follow(paths, from_start=True) as follower:
+            lines = iter(follower)
+            assert [next(lines).line for _ in range(2)] == ["1", "2"]
+            tmpdir.join("second").write("x\n")
+            assert next(lines) == (local_host, second, "x")
+        assert follower.offsets == {
+            ("127.0.0.1", first): 4, ("127.0.0.1", second): 2,
+        }
+
+        tmpdir.join("first").write("3\n", mode="a")
+        received = []
+        local_host.fs.follow(
+            paths, callback=lambda item: received.append(item) or False,
+            offsets=follower.offsets,
+        )
+        assert received == [(local_host, first, "3")]
+
+
+class TestSearch(object):
+    """
+    Searches real files, host is this machine so LocalExecutor is used
+    """
+    @pytest.fixture(autouse=True)
+    def files(self, tmpdir):
+        tmpdir.join("x.log").write(
+            "a\nERROR one\nb\nc\nd\ne\nERROR two\nERROR three\nf\n"
+        )
+        tmpdir.mkdir("sub").join("y z.log").write("ok\nerror: \"x\" $HOME\n")
+
+    def test_grep(self, local_host, tmpdir):
+        log = str(tmpdir.join("x.log"))
+        matches = list(local_host.fs.grep("ERROR", [log], context=1))
+        assert matches == [
+            (log, 2, "ERROR one", ["a"], ["b"]),
+            (log, 7, "ERROR two", ["e"], ["ERROR three"]),
+            (log, 8, "ERROR three", ["ERROR two"], ["f"]),
+        ]
+        matches = list(local_host.fs.grep(
+            '"x" $HOME', [str(tmpdir)], recursive=True, fixed=True,
+            ignore_case=True,
+        ))
+        assert [(m.path, m.line_number) for m in matches] == [
+            (str(tmpdir.join("sub", "y z.log")), 2),
+        ]
+        assert len(list(local_host.fs.grep("ERROR|e", [log], max_matches=2))) == 2
+        assert list(local_host.fs.grep("nothing", [log])) == []
+        with pytest.raises(errors.CommandExecutionFailure):
+            list(local_host.fs.grep("nothing", [str(tmpdir.join("missing"))]))
+
+    def test_find(self, local_host, tmpdir):
+        entries = sorted(local_host.fs.find(str(tmpdir), name="*.log", min_size=30))
+        assert [(e.path, e.type, e.size) for e in entries] == [
+            (str(tmpdir.join("x.log")), "f", 44),
+        ]
+        assert [e.path for e in local_host.fs.find(str(tmpdir), max_depth=0)] == [
+            str(tmpdir),
+        ]
+        entries = local_host.fs.find(str(tmpdir), type_="f", max_size=30)
+        assert [e.path for e in entries] == [str(tmpdir.join("sub", "y z.log"))]
+        assert list(local_host.fs.find(str(tmpdir), older_than=0)) == []
+
+    def test_listdir_spaces(self, local_host, tmpdir):
+        assert sorted(local_host.fs.listdir(str(tmpdir.join("sub")))) == ["y z.log"]
+
+    def test_scandir(self, local_host, tmpdir):
+        entries = sorted(local_host.fs.scandir(str(tmpdir)))
+        assert [(e.name, e.type, e.depth) for e in entries] == [
+            ("sub", "d", 1), ("x.log", "f", 1),
+        ]
+        log = entries[1]
+        assert log.size == 44
+        assert log.mode == os.stat(log.path).st_mode & 0o7777
+        assert log.owner == getpass.getuser()
+        assert log.is_file() and not log.is_dir()
+
+    def test_tree(self, local_host, tmpdir):
+        root = str(tmpdir)
+        tree = local_host.fs.tree(root + "/")
+        assert len(tree) == 4
+        assert tree[root].is_dir()
+        assert tree[str(tmpdir.join("sub", "y z.log"))].size == 20
+        assert tree.listdir(str(tmpdir.join("sub"))) == ["y z.log"]
+        assert str(tmpdir.join("missing")) not in tree
+        assert len(local_host.fs.tree(root, max_depth=1)) == 3
+
+    def test_walk(self, local_host, tmpdir):
+        root, sub = str(tmpdir), str(tmpdir.join("sub"))
+        tmpdir.join("sub", "deep").mkdir()
+        expected = [
+            (root, ["sub"], ["x.log"]),
+            (sub, ["deep"], ["y z.log"]),
+            (os.path.join(sub, "deep"), [], []),
+        ]
+        assert list(local_host.fs.walk(root)) == expected
+        assert list(local_host.fs.walk(root, topdown=False)) == expected[::-1]
+        assert list(local_host.fs.walk(root, max_depth=1)) == expected[:1]
+        assert list(local_host.fs.walk(root, max_depth=2, topdown=False)) == [
+            expected[1], expected[0],
+        ]
+        for topdown in (True, False):
+            assert list(local_host.fs.walk(root, 0, topdown)) == [
+                (root, [], []),
+            ]
+            assert list(local_host.fs.walk(root, 1, topdown)) == expected[:1]
+
+
+class TestSync(object):
+    """
+    Synchronizes real directories, host is this machine so LocalExecutor
+    is used
+    """
+    @pytest.fixture
+    def src(self, tmpdir):
+        src = tmpdir.mkdir("src")
+        src.join("a.conf").write("a = 1\n")
+        src.mkdir("sub dir").join("b c.txt").write("data\n")
+        src.mkdir("empty")
+        return src
+
+    def test_sync(self, local_host, src, tmpdir):
+        dst = str(tmpdir.join("dst"))
+        assert local_host.fs.sync(str(src), dst) == (
+            ["a.conf", "empty", "sub dir", "sub dir/b c.txt"], [], [],
+        )
+        assert local_manifest(dst).keys() == local_manifest(str(src)).keys()
+        assert tmpdir.join("dst", "sub dir", "b c.txt").read() == "data\n"
+        assert local_host.fs.sync(str(src), dst) == ([], [], [])
+
+        src.join("a.conf").write("a = 22\n")
+        src.join("new").write("")
+        src.join("sub dir").remove()
+        tmpdir.join("dst", "extra").write("x")
+        assert local_host.fs.sync(str(src), dst, delete=True, dry_run=True) == (
+            ["new"], ["a.conf"], ["extra", "sub dir"],
+        )
+        assert tmpdir.join("dst", "extra").check()
+        local_host.fs.sync(str(src), dst, delete=True)
+        assert sorted(os.listdir(dst)) == ["a.conf", "empty", "new"]
+        assert tmpdir.join("dst", "a.conf").read() == "a = 22\n"
+        assert local_host.fs.sync(str(src), dst, delete=True) == ([], [], [])
+
+    def test_sync_checksum(self, local_host, src, tmpdir):
+        dst = tmpdir.join("dst")
+        local_host.fs.sync(str(src), str(dst))
+        mtime = src.join("a.conf").mtime()
+        dst.join("a.conf").write("b = 1\n")
+        dst.join("a.conf").setmtime(mtime)
+        assert local_host.fs.sync(str(src), str(dst)) == ([], [], [])
+        manifest = local_host.fs.manifest(str(dst), checksum=True)
+        assert manifest["sub dir/b c.txt"].sha256 == (
+            local_manifest(str(src), checksum=True)["sub dir/b c.txt"].sha256
+        )
+        assert manifest["empty"].sha256 is None
+        assert local_host.fs.sync(str(src), str(dst), checksum=True) == (
+            [], ["a.conf"], [],
+        )
+        assert dst.join("a.conf").read() == "a = 1\n"
+
+    def test_manifest_escaped(self, local_host, tmpdir):
+        tmpdir.join("back\\slash\nline").write("x")
+        manifest = local_host.fs.manifest(str(tmpdir), checksum=True)
+        assert {k: v.sha256 for k, v in manifest.items()} == {
+            k: v.sha256
+            for k, v in local_manifest(str(tmpdir), checksum=True).items()
+        }
+
+
+class TestSudoRead(object):
+    """
+    Reads with sudo go through commands, sudo is replaced by script which
+    records its calls
+    """
+    @pytest.fixture(autouse=True)
+    def sudo(self, local_host, tmpdir, monkeypatch):
+        bin_dir = tmpdir.mkdir("bin")
+        sudo = bin_dir.join("sudo")
+        sudo.write('#!/bin/sh\necho "$1" >> %s\nexec "$@"\n' % tmpdir.join("calls"))
+        sudo.chmod(0o755)
+        monkeypatch.setenv("PATH", "%s:%s" % (bin_dir, os.environ["PATH"]))
+        monkeypatch.setattr(local_host, "sudo", True)
+
+        def fail(*args, **kwargs):
+            raise AssertionError("file opened without sudo")
+
+        monkeypatch.setattr(LocalExecutor.Session, "open_file", fail)
+
+    @pytest.fixture
+    def path(self, tmpdir):
+        path = tmpdir.join("log")
+        path.write("".join("line %d\n" % i for i in range(1000)))
+        return str(path)
+
+    def test_read_range(self, local_host, path, tmpdir):
+        assert local_host.fs.read_range(path, 7, 6) == b"line 1"
+        assert tmpdir.join("calls").read() == "dd\n"
+
+    def test_tail(self, local_host, path, tmpdir):
+        assert local_host.fs.tail(path, 1) == "line 999\n"
+        assert tmpdir.join("calls").read() == "tail\n"
+
+    def test_open(self, local_host, path, tmpdir):
+        with local_host.fs.open(path) as fh:
+            assert fh.read(6) == b"line 0"
+        assert list(local_host.fs.iter_lines(path))[-1] == "line 999"
+        with local_host.fs.open(str(tmpdir.join("new")), "wb") as fh:
+            fh.write(b"data")
+        assert tmpdir.join("new").read() == "data"
+        assert tmpdir.join("calls").read() == "sh\n" * 3
+        with pytest.raises(IOError):
+            with local_host.fs.open(str(tmpdir.join("missing"))):
+                pass
+        with pytest.raises(ValueError):
+            with local_host.fs.open(path, "r+b"):
+                pass
+
+
+class TestCachedPut(object):
+    """
+    Content addressed upload to this machine, LocalExecutor is used
+    """
+    @pytest.fixture(autouse=True)
+    def clear_cache(self):
+        filesystem.clear_digest_cache()
+        yield
+        filesystem.clear_digest_cache()
+
+    def test_put(self, local_host, tmpdir, monkeypatch):
+        src = tmpdir.join("image.qcow2")
+        src.write("x" * 100)
+        cache = tmpdir.join("cache")
+        first = local_host.fs.put(str(src), str(tmpdir.join("a")), str(cache))
+        digest = filesystem.file_sha256(str(src))
+        assert [p.basename for p in cache.listdir()] == [digest]
+
+        def fail(*args, **kwargs):
+            raise AssertionError("file uploaded again")
+
+        monkeypatch.setattr(filesystem, "_sha256", fail)
+        monkeypatch.setattr(LocalExecutor.Session, "open_file", fail)
+        dst_dir = tmpdir.mkdir("dst")
+        second = local_host.fs.put(str(src), str(dst_dir), str(cache))
+        assert second == str(dst_dir.join("image.qcow2"))
+        monkeypatch.undo()
+        assert tmpdir.join("a").read() == "x" * 100
+        assert os.stat(first).st_ino == os.stat(str(cache.join(digest))).st_ino
+        copied = local_host.fs.put(
+            str(src), str(tmpdir.join("b")), str(cache), link=False,
+        )
+        assert os.stat(copied).st_ino != os.stat(first).st_ino
+
+    def test_evict(self, local_host, tmpdir):
+        cache = tmpdir.join("cache")
+        digests = []
+        for i in range(3):
+            src = tmpdir.join("f%d" % i)
+            src.write(str(i) * 100)
+            local_host.fs.put(str(src), str(tmpdir.join("dst%d" % i)), str(cache))
+            cache.join(filesystem.file_sha256(str(src))).setmtime(1000 + i)
+            digests.append(filesystem.file_sha256(str(src)))
+        # upload in progress and unrelated files are never evicted
+        pending = cache.join("%s.0123abcd.tmp" % digests[0])
+        pending.write("p" * 100)
+        pending.setmtime(900)
+        cache.join("README").write("r" * 100)
+        src = tmpdir.join("f3")
+        src.write("3" * 100)
+        local_host.fs.put(
+            str(src), str(tmpdir.join("dst3")), str(cache), cache_size=250,
+        )
+        assert sorted(p.basename for p in cache.listdir()) == sorted(
+            [digests[2], filesystem.file_sha256(str(src)), pending.basename,
+             "README"]
+        )
+        assert tmpdir.join("dst0").read() == "0" * 100
+
+    def test_newline_in_destination(self, local_host, tmpdir):
+        src = tmpdir.join("image")
+        src.write("x" * 100)
+        cache = str(tmpdir.join("cache"))
+        dst_dir = tmpdir.mkdir("new\nline")
+        for _ in range(2):
+            dst = local_host.fs.put(str(src), str(dst_dir), cache)
+            assert dst == str(dst_dir.join("image"))
+            assert dst_dir.join("image").read() == "x" * 100
+
+
+class TestSparse(object):
+    """
+    Sparse transfers of real files, LocalExecutor is used
+    """
+    size = 64 * 1024 * 1024
+
+    @pytest.fixture(params=["holes", "dense", "empty", "hole_only"])
+    def image(self, request, tmpdir):
+        path = tmpdir.join("image.raw")
+        with open(str(path), "wb") as fh:
+            if request.param == "holes":
+                fh.seek(1024 * 1024)
+                fh.write(b"data" * 1024)
+                fh.seek(self.size - 3)
+                fh.write(b"end")
+            elif request.param == "dense":
+                fh.write(os.urandom(300 * 1024))
+            elif request.param == "hole_only":
+                fh.truncate(self.size)
+        return str(path)
+
+    def check(self, src, dst):
+        with open(src, "rb") as sh, open(dst, "rb") as dh:
+            assert sh.read() == dh.read()
+        assert os.stat(dst).st_blocks <= os.stat(src).st_blocks + 8
+
+    def test_get(self, local_host, image, tmpdir):
+        dst = local_host.fs.get(image, str(tmpdir.mkdir("dst")), sparse=True)
+        self.check(image, dst)
+
+    def test_put(self, local_host, image, tmpdir):
+        dst = local_host.fs.put(image, str(tmpdir.join("put.raw")), sparse=True)
+        self.check(image, dst)
+
+    def test_transfer(self, local_host, image, tmpdir):
+        dst = str(tmpdir.join("transfer.raw"))
+        local_host.fs.transfer(image, local_host, dst, sparse=True)
+        self.check(image, dst)
+
+    def test_put_existing(self, local_host, image, tmpdir):
+        dst = tmpdir.join("existing.raw")
+        dst.write("x" * 100)
+        dst.chmod(0o640)
+        inode = dst.stat().ino
+        local_host.fs.put(image, str(dst), sparse=True)
+        self.check(image, str(dst))
+        assert dst.stat().ino == inode
+        assert dst.stat().mode & 0o777 == 0o640
+        assert sorted(p.basename for p in tmpdir.listdir()) == [
+            "existing.raw", "image.raw",
+        ]
+
+    def test_put_mode(self, local_host, image, tmpdir):
+        sparse = local_host.fs.put(image, str(tmpdir.join("a")), sparse=True)
+        plain = local_host.fs.put(image, str(tmpdir.join("b")))
+        assert os.stat(sparse).st_mode == os.stat(plain).st_mode
+
+    def test_missing(self, local_host, tmpdir):
+        with pytest.raises(errors.CommandExecutionFailure):
+            local_host.fs.get(
+                str(tmpdir.join("missing")), str(tmpdir.join("dst")),
+                sparse=True,
+            )
+
+
+class TestParallel(object):
+    """
+    Transfers by several concurrent streams, LocalExecutor is used
+    """
+    size = 5 * 1024 * 1024 + 123
+
+    @pytest.fixture
+    def src(self, tmpdir):
+        path = tmpdir.join("image.iso")
+        path.write_binary(os.urandom(self.size))
+        return str(path)
+
+    def check(self, src, dst):
+        with open(src, "rb") as sh, open(dst, "rb") as dh:
+            assert sh.read() == dh.read()
+
+    def test_get(self, local_host, src, tmpdir):
+        self.check(src, local_host.fs.get(src, str(tmpdir.join("got")), streams=4))
+
+    def test_put(self, local_host, src, tmpdir):
+        self.check(src, local_host.fs.put(src, str(tmpdir.join("put")), streams=4))
+
+    def test_transfer(self, local_host, src, tmpdir):
+        dst = str(tmpdir.join("transfer"))
+        self.check(src, local_host.fs.transfer(src, local_host, dst, streams=3))
+
+    def test_checksum_mismatch(self, local_host, src, tmpdir, monkeypatch):
+        monkeypatch.setattr(
+            filesystem.FileSystem, "sha256", lambda self, path: "0" * 64,
+        )
+        with pytest.raises(errors.ChecksumMismatch):
+            local_host.fs.put(src, str(tmpdir.join("put")), streams=2)
+
+    def test_stream_count(self):
+        mb = 1024 * 1024
+        assert filesystem._stream_count(4, 5 * mb) == 4
+        assert filesystem._stream_count(4, mb) == 1
+        assert filesystem._stream_count(None, 10 * mb) == 1
+        assert filesystem._stream_count(
+            None, 100 * filesystem.PARALLEL_PART,
+        ) == filesystem.MAX_STREAMS
+        assert filesystem._ranges(10, 3) == [(0, 4), (4, 4), (8, 2)]
@@ -2,6 +2,7 @@
 import pytest
 
 from rrmngmnt import Host
+from rrmngmnt.firewall import APPEND, DELETE, INSERT, Firewall, Rule
 from rrmngmnt.user import RootUser
 
 from .common import FakeExecutorFactory
@@ -108,3 +109,168 @@ class TestChain(object):
 
     def test_clean_firewall_rules(self, host):
         assert host.firewall.chain("OUTPUT").clean_rules()
+
+
+class TestRule(object):
+
+    def test_parse(self):
+        rule = Rule.parse(
+            '-A OUTPUT -s 10.0.0.0/8 ! -d 1.2.3.4/32 -p tcp '
+            '-m comment --comment "keep it" -j ACCEPT'
+        )
+        assert rule.chain == "OUTPUT"
+        assert rule.options == [
+            ('-s', ('10.0.0.0/8',)),
+            ('!-d', ('1.2.3.4/32',)),
+            ('-p', ('tcp',)),
+            ('-m', ('comment',)),
+            ('--comment', ('keep it',)),
+            ('-j', ('ACCEPT',)),
+        ]
+
+    def test_parse_policy(self):
+        assert Rule.parse('-P OUTPUT ACCEPT') is None
+
+    def test_spec_matches_listed_rule(self):
+        rules = Rule.from_spec(
+            "OUTPUT",
+            ['--destination', '2.2.2.2,3.3.3.3', '--jump', 'DROP', '--protocol', 'all'],
+        )
+        assert rules == [
+            Rule.parse('-A OUTPUT -d 2.2.2.2/32 -j DROP'),
+            Rule.parse('-A OUTPUT -d 3.3.3.3/32 -j DROP'),
+        ]
+
+    def test_to_command(self):
+        rule = Rule.parse('-A INPUT -s 2.2.2.2/32 -j DROP')
+        assert rule.to_command(INSERT, '3') == "--insert INPUT 3 -s 2.2.2.2/32 -j DROP"
+
+
+class TestFirewallTransaction(object):
+    data = {
+        "iptables --list-rules": (
+            0,
+            "\n".join([
+                "-P INPUT ACCEPT",
+                "-P OUTPUT ACCEPT",
+                "-A OUTPUT -d 2.2.2.2/32 -j DROP",
+            ]),
+            "",
+        ),
+        "iptables --list-rules OUTPUT": (
+            0,
+            "-P OUTPUT ACCEPT\n-A OUTPUT -d 2.2.2.2/32 -j DROP\n",
+            "",
+        ),
+        "iptables-restore --noflush": (0, "", ""),
+    }
+
+    @pytest.fixture(scope="class")
+    def host(self):
+        h = Host("1.1.1.1")
+        h.users.append(RootUser("123456"))
+        return h
+
+    @classmethod
+    def setup_class(cls):
+        fake_cmd_data(cls.data)
+
+    def test_get_rules(self, host):
+        assert host.firewall.chain("OUTPUT").get_rules() == [
+            Rule.parse('-A OUTPUT -d 2.2.2.2/32 -j DROP'),
+        ]
+
+    def test_transaction(self, host):
+        with host.firewall.transaction() as fw:
+            chain = fw.chain("OUTPUT")
+            assert chain.add_rule({"address": ["3.3.3.3", "4.4.4.4"]}, "DROP")
+            assert chain.delete_rule({"address": ["2.2.2.2"]}, "DROP")
+            assert len(fw._batch) == 3
+        assert fw._batch is None
+
+    def test_restore_lines_diff(self):
+        batch = [
+            (APPEND, None, rule) for rule in Rule.from_spec(
+                "OUTPUT", ['--destination', '2.2.2.2,3.3.3.3', '--jump', 'DROP']
+            )
+        ]
+        batch.append(
+            (DELETE, None, Rule.parse('-A OUTPUT -d 5.5.5.5/32 -j DROP'))
+        )
+        current = [Rule.parse('-A OUTPUT -d 2.2.2.2/32 -j DROP')]
+        assert Firewall._restore_lines(batch, current) == [
+            "--append OUTPUT -d 3.3.3.3/32 -j DROP",
+        ]
+        assert len(Firewall._restore_lines(batch)) == 3
+
+
+class TestIPSet(object):
+    data = {
+        "ipset -exist restore": (0, "", ""),
+        "ipset save blocked": (
+            0,
+            "\n".join([
+                "create blocked hash:net family inet hashsize 1024 maxelem 65536",
+                "add blocked 10.0.0.0/24",
+                "add blocked 10.0.1.0/24",
+            ]),
+            "",
+        ),
+        "ipset save missing": (1, "", "ipset v7.1: The set with the given name does not exist"),
+        "ipset destroy blocked": (0, "", ""),
+        "iptables --append OUTPUT --match set --match-set blocked dst --jump DROP --protocol all": (0, "", ""),
+        "iptables --append INPUT --match set --match-set blocked src --jump DROP "
+        "--protocol tcp --match set --match-set ports dst": (0, "", ""),
+    }
+
+    @pytest.fixture(scope="class")
+    def host(self):
+        h = Host("1.1.1.1")
+        h.users.append(RootUser("123456"))
+        return h
+
+    @classmethod
+    def setup_class(cls):
+        fake_cmd_data(cls.data)
+
+    def test_add(self, host):
+        host.firewall.ipset("blocked", "hash:net").add(["10.0.0.0/24"])
+
+    def test_replace_lines(self, host):
+        ipset = host.firewall.ipset("ports", "bitmap:port")
+        assert ipset._replace_lines(["22", "80"]) == [
+            "create ports bitmap:port range 0-65535",
+            "create ports-tmp bitmap:port range 0-65535",
+            "flush ports-tmp",
+            "add ports-tmp 22",
+            "add ports-tmp 80",
+            "swap ports-tmp ports",
+            "destroy ports-tmp",
+        ]
+
+    def test_list_members(self, host):
+        assert host.firewall.ipset("blocked").list_members() == [
+            "10.0.0.0/24",
+            "10.0.1.0/24",
+        ]
+
+    def test_list_members_missing_set(self, host):
+        assert host.firewall.ipset("missing").list_members() == []
+
+    def test_destroy(self, host):
+        assert host.firewall.ipset("blocked").destroy()
+
+    def test_add_set_rule(self, host):
+        assert host.firewall.chain("OUTPUT").add_rule({"set": "blocked"}, "DROP")
+
+    def test_add_set_rule_with_port_set(self, host):
+        assert host.firewall.chain("INPUT").add_rule(
+            {"set": "blocked"}, "DROP", port_set="ports"
+        )
+
+    def test_set_rule_matches_listed_rule(self, host):
+        with host.firewall.transaction(diff=False) as fw:
+            fw.chain("OUTPUT").add_rule({"set": "blocked"}, "DROP")
+            rule = fw._batch[0][2]
+            fw._batch[:] = []
+        assert rule == Rule.parse("-A OUTPUT -m set --match-set blocked dst -j DROP")
@@ -0,0 +1,64 @@
+import json
+import subprocess
+import sys
+
+SCRIPT = """
+import importlib, json, sys, time
+start = time.perf_counter()
+import rrmngmnt
+plain = sorted(sys.modules)
+from rrmngmnt import Host, User
+duration = time.perf_counter() - start
+Host('1.1.1.1')
+modules = sorted(sys.modules)
+start = time.perf_counter()
+for name in %r:
+    importlib.import_module(name)
+lazy = time.perf_counter() - start
+print(json.dumps({
+    'duration': duration, 'lazy': lazy, 'plain': plain, 'modules': modules,
+}))
+"""
+
+LAZY_MODULES = (
+    'paramiko',
+    'rrmngmnt.ssh',
+    'rrmngmnt.network',
+    'rrmngmnt.firewall',
+    'rrmngmnt.storage',
+    'rrmngmnt.filesystem',
+    'rrmngmnt.playbook_runner',
+    'rrmngmnt.power_manager',
+    'rrmngmnt.db',
+)
+
+
+def run_import():
+    out = subprocess.check_output(
+        [sys.executable, '-c', SCRIPT % (LAZY_MODULES,)]
+    )
+    return json.loads(out)
+
+
+def test_lazy_modules():
+    result = run_import()
+    for modules in (result['plain'], result['modules']):
+        assert [m for m in LAZY_MODULES if m in modules] == []
+
+
+def test_import_budget():
+    """
+    Budget is relative to import of the lazy modules, which is what eager
+    import used to add, so it doesn't depend on speed of machine. Import
+    took about quarter of it.
+    """
+    results = [run_import() for _ in range(3)]
+    assert min(r['duration'] / r['lazy'] for r in results) < 1
+
+
+def test_names():
+    import rrmngmnt
+    from rrmngmnt.host import Host
+    assert rrmngmnt.Host is Host
+    assert set(rrmngmnt.__all__) <= set(dir(rrmngmnt))
+    assert not hasattr(rrmngmnt, 'NoSuchName')
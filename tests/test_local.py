@@ -0,0 +1,123 @@
+import socket
+
+import pytest
+
+from rrmngmnt import Host, User
+from rrmngmnt.local import (
+    LocalExecutor, LocalExecutorFactory, current_user, is_local_address,
+)
+from rrmngmnt.ssh import RemoteExecutor, RemoteExecutorFactory
+
+from tests.common import FakeExecutorFactory
+
+
+@pytest.fixture
+def executor():
+    return LocalExecutor(User(current_user(), ''))
+
+
+def test_is_local_address():
+    assert is_local_address('127.0.0.1')
+    assert not is_local_address('192.0.2.1')
+    assert not is_local_address('not-an-address')
+
+
+def test_run_cmd(executor):
+    rc, out, err = executor.run_cmd(
+        ['echo', 'hello world', '|', 'tr', 'a-z', 'A-Z', ';',
+         'echo', 'oops', '>&2', ';', 'exit', '3']
+    )
+    assert (rc, out, err) == (3, "HELLO WORLD\n", "oops\n")
+
+
+def test_input(executor):
+    assert executor.run_cmd(['cat'], input_="data") == (0, "data", "")
+    assert executor.run_cmd(['wc', '-c'], input_=b"\x00\x01")[1] == "2\n"
+
+
+def test_streams(executor):
+    with executor.session() as ss:
+        command = ss.command(
+            ['head', '-c', '1000000', '/dev/zero', '>&2', ';',
+             'echo', 'a', ';', 'echo', 'b']
+        )
+        with command.execute() as (_, out, err):
+            assert out.readline() == "a\n"
+            assert list(out) == ["b\n"]
+            assert len(err.read()) == 1000000
+        assert command.rc == 0
+
+
+def test_large_output(executor):
+    rc, out, _ = executor.run_cmd(['head', '-c', '5000000', '/dev/zero'])
+    assert len(out) == 5000000
+
+
+def test_discard_output(executor):
+    result = executor.run_cmd(
+        ['echo', 'out', ';', 'echo', 'err', '>&2', ';', 'false'],
+        discard_output=True,
+    )
+    assert result == (1, '', 'err\n')
+    assert result.out_bytes == b''
+
+
+def test_timeout(executor):
+    with pytest.raises(socket.timeout):
+        executor.run_cmd(['sleep', '10'], io_timeout=0.2)
+
+
+def test_sudo(executor, monkeypatch):
+    monkeypatch.setattr(
+        LocalExecutor.Command, 'run',
+        lambda self, *args, **kwargs: (0, self.cmd, ''),
+    )
+    executor.sudo = True
+    assert executor.run_cmd(['true']) == (0, 'sudo true', '')
+    other = LocalExecutor(User('other', ''))
+    assert other.session().command(['id'])._argv() == [
+        'sudo', '-n', '-u', 'other', '--', '/bin/bash', '-c', 'id',
+    ]
+
+
+def test_open_file(executor, tmpdir):
+    path = str(tmpdir.join('file'))
+    with executor.session() as ss:
+        with ss.open_file(path, 'wb') as fh:
+            fh.write(b'data')
+        with ss.open_file(path, 'rb') as fh:
+            assert fh.read() == b'data'
+
+
+class TestHostSelection(object):
+    def get_host(self, ip, user_name):
+        host = Host(ip)
+        host.add_user(User('root', '11111'))
+        host.executor_user = User(user_name, '')
+        host.local_executor_factory = LocalExecutorFactory()
+        return host
+
+    def test_local(self):
+        host = self.get_host('127.0.0.1', current_user())
+        assert isinstance(host.executor(), LocalExecutor)
+        assert host.run_command(['echo', 'local'])[1] == "local\n"
+
+    def test_remote_address(self):
+        host = self.get_host('192.0.2.1', current_user())
+        assert isinstance(host.executor(), RemoteExecutor)
+
+    def test_other_user(self):
+        host = self.get_host('127.0.0.1', 'nobody-else')
+        assert isinstance(host.executor(), RemoteExecutor)
+
+    def test_custom_factory(self):
+        host = self.get_host('127.0.0.1', current_user())
+        host.executor_factory = RemoteExecutorFactory(port=2222)
+        assert isinstance(host.executor(), RemoteExecutor)
+        host.executor_factory = FakeExecutorFactory({}, {})
+        assert not isinstance(host.executor(), LocalExecutor)
+
+    def test_disabled(self):
+        host = Host('127.0.0.1')
+        host.executor_user = User(current_user(), '')
+        assert isinstance(host.executor(), RemoteExecutor)
@@ -0,0 +1,107 @@
+import json
+
+import pytest
+
+from rrmngmnt import Host, User, metrics
+from rrmngmnt.service import Service
+
+from tests.common import FakeExecutorFactory
+
+
+class Probe(Service):
+    def check(self):
+        event = metrics.start(
+            metrics.COMMAND_EXECUTE, self.host.executor(), cmd='true'
+        )
+        event.phase(metrics.CHANNEL_OPEN)
+        event.phase(metrics.EXECUTION)
+        event.bytes_in += 10
+        metrics.finish(event)
+
+
+@pytest.fixture
+def host():
+    h = Host('1.1.1.1')
+    h.add_user(User('root', '11111'))
+    h.executor_factory = FakeExecutorFactory({}, {})
+    return h
+
+
+@pytest.fixture
+def collector():
+    c = metrics.MetricsCollector(buckets=(0.5, 1.0))
+    metrics.add_hook(c)
+    yield c
+    metrics.remove_hook(c)
+
+
+def test_disabled():
+    assert metrics.start(metrics.SESSION_OPEN, None) is None
+
+
+def test_hooks_called(host):
+    calls = []
+
+    class Recorder(metrics.Hook):
+        def pre(self, event):
+            calls.append(('pre', event.name))
+
+        def post(self, event):
+            calls.append(('post', event.name, event.error))
+
+    hook = Recorder()
+    metrics.add_hook(hook)
+    try:
+        error = IOError('lost')
+        event = metrics.start(metrics.FILE_OPEN, host.executor(), path='/a')
+        metrics.finish(event, error)
+    finally:
+        metrics.remove_hook(hook)
+    assert calls == [
+        ('pre', metrics.FILE_OPEN),
+        ('post', metrics.FILE_OPEN, error),
+    ]
+    assert event.host == '1.1.1.1'
+    assert event.attrs == {'path': '/a'}
+
+
+def test_collector(host, collector):
+    Probe(host).check()
+    data = collector.as_dict()
+    phases = sorted(d['phase'] for d in data['durations'])
+    assert phases == [
+        metrics.CHANNEL_OPEN, metrics.EXECUTION, metrics.TOTAL,
+    ]
+    total = [d for d in data['durations'] if d['phase'] == metrics.TOTAL][0]
+    assert total['host'] == '1.1.1.1'
+    assert total['count'] == 1
+    assert total['buckets'][-1] == ['+Inf', 1]
+    assert data['commands'] == [
+        {'host': '1.1.1.1', 'method': 'Probe.check', 'value': 1}
+    ]
+    assert {'host': '1.1.1.1', 'direction': 'in', 'value': 10} in data['bytes']
+    assert json.loads(collector.to_json()) == data
+
+
+def test_openmetrics(host, collector):
+    Probe(host).check()
+    Probe(host).check()
+    text = collector.to_openmetrics()
+    assert text.endswith("# EOF\n")
+    assert (
+        'rrmngmnt_phase_seconds_bucket{event="command.execute",'
+        'host="1.1.1.1",le="+Inf",phase="total"} 2'
+    ) in text
+    assert (
+        'rrmngmnt_commands_total{host="1.1.1.1",method="Probe.check"} 2'
+    ) in text
+    collector.reset()
+    assert 'rrmngmnt_commands_total{' not in collector.to_openmetrics()
+
+
+def test_histogram():
+    histogram = metrics.Histogram((1, 2))
+    for value in (0.5, 1, 1.5, 3):
+        histogram.observe(value)
+    assert histogram.cumulative() == [(1, 2), (2, 3), ('+Inf', 4)]
+    assert histogram.sum == 6
@@ -1438,3 +1438,101 @@ class TestNmcliDummyConnection(NmcliConnectionTypeIPConfigurable):
                 ipv6_addr="2a02:ed0:52fe:ec00:dc3f:f939:a573:5984",
                 ipv6_gw="2a02:ed0:52fe:ec00:",
             )
+
+
+class TestNmcliTransaction(NmcliBase):
+    """
+    Testing batched configuration changes protected by a checkpoint.
+    """
+
+    checkpoint = "/org/freedesktop/NetworkManager/Checkpoint/1"
+    data = {
+        "bash -s": (
+            0,
+            "\n".join(
+                [
+                    checkpoint,
+                    "Connection 'bond1' (0f3c2b57) successfully added.",
+                ]
+            ),
+            "",
+        ),
+        "busctl call org.freedesktop.NetworkManager "
+        "/org/freedesktop/NetworkManager org.freedesktop.NetworkManager "
+        f"CheckpointDestroy o {checkpoint}": (0, "", ""),
+    }
+
+    def test_transaction(self, mock):
+        nmcli = mock.network.nmcli
+        with nmcli.transaction() as tx:
+            tx.add_bond(con_name="bond1", ifname="bond1", mode="1")
+            tx.add_slave(
+                con_name="bond1-slave1",
+                slave_type="ethernet",
+                ifname="enp1s0f1",
+                master="bond1",
+            )
+            tx.add_vlan(con_name="vlan10", dev="bond1", vlan_id=10)
+            assert len(tx._batch) == 3
+
+    def test_empty_transaction(self, mock):
+        with mock.network.nmcli.transaction():
+            pass
+
+    def test_transaction_discarded_on_error(self, mock):
+        nmcli = mock.network.nmcli
+        with pytest.raises(ValueError):
+            with nmcli.transaction() as tx:
+                tx.add_bond(con_name="bond1", ifname="bond1")
+                raise ValueError()
+        assert nmcli._batch is None
+
+    def test_nested_transaction(self, mock):
+        with mock.network.nmcli.transaction() as tx:
+            with pytest.raises(RuntimeError):
+                with tx.transaction():
+                    pass
+
+    def test_batch_script(self, mock):
+        script = mock.network.nmcli._batch_script_builder(
+            commands=["nmcli connection delete bond1", "nmcli con up x"],
+            rollback_timeout=30,
+            checkpoint_flags=6,
+        )
+        lines = script.splitlines()
+        assert "CheckpointCreate aouu 0 30 6" in lines[1]
+        assert lines[-2] == "nmcli connection delete bond1 || rollback $?"
+        assert lines[-1] == "nmcli con up x || rollback $?"
+
+    def test_batch_script_without_checkpoint(self, mock):
+        script = mock.network.nmcli._batch_script_builder(
+            commands=["nmcli connection delete bond1"],
+            rollback_timeout=None,
+            checkpoint_flags=6,
+        )
+        assert "Checkpoint" not in script
+        assert script.splitlines()[-1] == (
+            "nmcli connection delete bond1 || exit $?"
+        )
+
+
+class TestNmcliTransactionFailure(NmcliBase):
+    """
+    Testing a batch which failed on the remote side.
+    """
+
+    data = {
+        "bash -s": (
+            10,
+            "/org/freedesktop/NetworkManager/Checkpoint/1",
+            "Error: unknown connection 'bond1'.",
+        ),
+    }
+
+    def test_transaction_failure(self, mock):
+        with pytest.raises(
+            expected_exception=CommandExecutionFailure,
+            match=".*Error: unknown connection 'bond1'..*",
+        ):
+            with mock.network.nmcli.transaction() as tx:
+                tx.delete_connection(connection="bond1")
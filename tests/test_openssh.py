@@ -0,0 +1,109 @@
+import os
+
+import pytest
+
+from rrmngmnt import Host, User, UserWithPKey, errors
+from rrmngmnt import openssh
+from rrmngmnt.openssh import OpenSSHExecutor, OpenSSHExecutorFactory
+
+FAKE_SSH = """#!/bin/bash
+# Runs command given as last argument locally, master is always running
+for arg; do
+    [ "$arg" = "-O" ] && exit 0
+done
+exec /bin/bash -c "${@: -1}"
+"""
+
+
+@pytest.fixture
+def executor(tmpdir, monkeypatch):
+    script = tmpdir.join('ssh')
+    script.write(FAKE_SSH)
+    script.chmod(0o755)
+    monkeypatch.setattr(openssh, 'SSH', str(script))
+    monkeypatch.setattr(openssh, 'SSHPASS', 'no-such-sshpass')
+    return OpenSSHExecutor(
+        User('root', '11111'), '1.1.1.1', control_dir=str(tmpdir),
+    )
+
+
+def test_ssh_cmd(executor, tmpdir):
+    argv = executor.ssh_cmd('echo hi', 5)
+    assert argv[-4:] == ['root', '--', '1.1.1.1', 'echo hi']
+    assert 'ControlPath=%s/%%C' % tmpdir in argv
+    assert 'ControlMaster=no' in argv
+    assert 'ConnectTimeout=5' in argv
+    assert 'BatchMode=yes' in argv
+    assert 'ControlMaster=yes' in executor.ssh_cmd(None, master=True)
+
+
+def test_private_key():
+    executor = OpenSSHExecutor(
+        UserWithPKey('user', '/path/to/key'), '1.1.1.1', port=2222,
+        sock='nc %h %p', options={'Ciphers': 'aes128-gcm@openssh.com'},
+    )
+    argv = executor.ssh_cmd('true')
+    assert argv[:3] == ['ssh', '-p', '2222']
+    for option in (
+        'IdentityFile=/path/to/key', 'ProxyCommand=nc %h %p',
+        'Ciphers=aes128-gcm@openssh.com',
+    ):
+        assert option in argv
+    assert executor.ssh_env() is None
+
+
+def test_sshpass(executor, monkeypatch):
+    monkeypatch.setattr(openssh, 'SSHPASS', 'true')
+    argv = executor.ssh_cmd('true')
+    assert argv[:2] == ['true', '-e']
+    assert 'BatchMode=yes' not in argv
+    assert executor.ssh_env()['SSHPASS'] == '11111'
+
+
+def test_run_cmd(executor):
+    assert executor.run_cmd(
+        ['echo', 'hello', '|', 'tr', 'a-z', 'A-Z', ';', 'exit', '2']
+    ) == (2, "HELLO\n", "")
+    assert executor.run_cmd(['cat'], input_="data") == (0, "data", "")
+    assert executor.is_connective()
+
+
+def test_open_file(executor, tmpdir):
+    path = str(tmpdir.join('file name'))
+    data = os.urandom(3 * 1024 * 1024)
+    with executor.session() as ss:
+        with ss.open_file(path, 'wb') as fh:
+            fh.write(data)
+        with ss.open_file(path, 'ab') as fh:
+            fh.write(b'tail')
+        with ss.open_file(path, 'rb') as fh:
+            assert fh.read() == data + b'tail'
+        with ss.open_file(path, 'rb') as fh:
+            assert fh.read(4) == data[:4]
+        with pytest.raises(IOError):
+            with ss.open_file(str(tmpdir.join('missing')), 'rb') as fh:
+                fh.read()
+        with pytest.raises(ValueError):
+            with ss.open_file(path, 'r+b'):
+                pass
+
+
+def test_factory():
+    host = Host('1.1.1.1')
+    host.add_user(User('root', '11111'))
+    host.executor_factory = OpenSSHExecutorFactory(port=2222, persist=10)
+    executor = host.executor()
+    assert isinstance(executor, OpenSSHExecutor)
+    assert (executor.port, executor.persist) == (2222, 10)
+
+
+def test_read_by_command(executor, tmpdir):
+    path = tmpdir.join('log')
+    path.write("".join("line %d\n" % i for i in range(100)))
+    host = Host('1.1.1.1')
+    host.add_user(User('root', '11111'))
+    host.executor_factory = OpenSSHExecutorFactory(control_dir=str(tmpdir))
+    assert host.fs.read_range(str(path), 7, 6) == b"line 1"
+    assert host.fs.tail(str(path), 2) == "line 98\nline 99\n"
+    with pytest.raises(errors.CommandExecutionFailure):
+        host.fs.tail(str(tmpdir.join('missing')))
@@ -1,9 +1,19 @@
-import os.path
+import getpass
+import io
+import json
+import os
+import tarfile
 
 import pytest
 
-from rrmngmnt import Host, User
-from rrmngmnt.playbook_runner import PlaybookRunner
+from rrmngmnt import Host, User, UserWithPKey
+from rrmngmnt.local import LocalExecutorFactory
+from rrmngmnt.ssh import RemoteExecutorFactory
+from rrmngmnt.playbook_runner import (
+    AnsibleEvent,
+    MultiHostPlaybookRunner,
+    PlaybookRunner,
+)
 from .common import FakeExecutorFactory
 
 
@@ -364,3 +374,285 @@ class TestSSHCommonArgs(PlaybookRunnerBase):
         assert self.check_files_on_host(
             os.path.join(self.tmp_dir, PlaybookRunner.default_inventory_name)
         )
+
+
+class TestBundle(PlaybookRunnerBase):
+
+    files = {}
+
+    def upload_cmd(self, bundle_dir):
+        tmp_dir = "{}.{}".format(bundle_dir, self.fake_run_uuid)
+        return (
+            "mkdir -p -m 700 {c} && [ ! -L {c} ] && [ -O {c} ] && "
+            "chmod 700 {c} || exit 1 ; "
+            "find {c} -mindepth 1 -maxdepth 1 -mtime +7 -exec rm -rf {{}} + ; "
+            "if [ -f {b}/.complete ] ; then touch {b} && echo hit ; "
+            "else echo miss && mkdir -m 700 {t} && tar -xzf - -C {t} && "
+            "touch {t}/.complete && "
+            "{{ [ -f {b}/.complete ] || rm -rf {b} ; "
+            "mv -T {t} {b} || rm -rf {t} ; }} ; fi".format(
+                c=os.path.dirname(bundle_dir), b=bundle_dir, t=tmp_dir
+            )
+        )
+
+    @pytest.fixture()
+    def bundle_dir(self):
+        content_hash, _ = PlaybookRunner._pack_bundle({
+            PlaybookRunner.extra_vars_file: b'{"greetings": "hello"}',
+            PlaybookRunner.default_inventory_name: (
+                PlaybookRunner.default_inventory_content.encode()
+            ),
+            self.playbook_name: self.playbook_content.encode(),
+        })
+        return os.path.join(
+            PlaybookRunner.tmp_dir,
+            PlaybookRunner.bundle_cache_dir + "-root", content_hash
+        )
+
+    @pytest.fixture()
+    def bundle_host(self, bundle_dir):
+        data = {
+            self.upload_cmd(bundle_dir): (0, "hit\n", ""),
+            '{bin} -e@{d}/{extra_vars} -i {d}/{inventory} '
+            '-v {d}/{playbook}'.format(
+                bin=PlaybookRunner.binary,
+                extra_vars=PlaybookRunner.extra_vars_file,
+                d=bundle_dir,
+                inventory=PlaybookRunner.default_inventory_name,
+                playbook=self.playbook_name
+            ): self.success,
+        }
+        fh = Host('1.1.1.1')
+        fh.add_user(User('root', '11111'))
+        fh.executor_factory = FakeExecutorFactory(data, self.files)
+        return fh
+
+    def test_bundle(self, bundle_host, fake_playbook):
+        """ All inputs are uploaded as one cached archive """
+        playbook_runner = PlaybookRunner(bundle_host)
+        playbook_runner.short_run_uuid = self.fake_run_uuid
+        rc, _, _ = playbook_runner.run(
+            playbook=fake_playbook,
+            extra_vars={"greetings": "hello"},
+            bundle=True,
+        )
+        assert not rc
+        assert not self.files
+
+    def test_clear_bundle_cache(self):
+        """ Cache directory of the user is removed """
+        cache_dir = os.path.join(
+            PlaybookRunner.tmp_dir, PlaybookRunner.bundle_cache_dir + "-root"
+        )
+        fh = Host('1.1.1.1')
+        fh.add_user(User('root', '11111'))
+        fh.executor_factory = FakeExecutorFactory(
+            {'rm -rf {}'.format(cache_dir): self.success}, self.files,
+        )
+        PlaybookRunner(fh).clear_bundle_cache()
+
+    def test_pack_bundle(self):
+        """ Hash depends on content of the files, not on their order """
+        hash1, archive = PlaybookRunner._pack_bundle({"a": b"1", "b": b"2"})
+        hash2, _ = PlaybookRunner._pack_bundle({"b": b"2", "a": b"1"})
+        hash3, _ = PlaybookRunner._pack_bundle({"a": b"1", "b": b"3"})
+        assert hash1 == hash2 != hash3
+        with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+            assert tar.getnames() == ["a", "b"]
+
+
+class TestBundleSudo(object):
+    """
+    Bundle uploaded and run on this machine, sudo and ansible-playbook are
+    replaced by scripts, the latter prints its sudo user and playbook
+    """
+    @pytest.fixture
+    def local_host(self, tmpdir, monkeypatch):
+        bin_dir = tmpdir.mkdir("bin")
+        sudo = bin_dir.join("sudo")
+        sudo.write(
+            '#!/bin/sh\necho "$1" >> %s\nSUDO_USER=$(id -un) exec "$@"\n'
+            % tmpdir.join("sudo.log")
+        )
+        ansible = bin_dir.join(PlaybookRunner.binary)
+        ansible.write(
+            '#!/bin/sh\nfor last; do :; done\n'
+            'echo "${SUDO_USER:-none}"; cat "$last"\n'
+        )
+        for script in (sudo, ansible):
+            script.chmod(0o755)
+        monkeypatch.setenv("PATH", "%s:%s" % (bin_dir, os.environ["PATH"]))
+        monkeypatch.setattr(PlaybookRunner, "tmp_dir", str(tmpdir))
+        h = Host("127.0.0.1")
+        h.executor_user = User(getpass.getuser(), "")
+        h.executor_factory = RemoteExecutorFactory()
+        h.local_executor_factory = LocalExecutorFactory()
+        h.sudo = True
+        return h
+
+    def test_sudo(self, local_host, tmpdir):
+        playbook = tmpdir.join("play.yml")
+        playbook.write("- hosts: all\n")
+        for _ in range(2):
+            rc, out, _ = PlaybookRunner(local_host).run(
+                str(playbook), bundle=True,
+            )
+            assert (rc, out) == (0, "%s\n- hosts: all\n" % getpass.getuser())
+        cache = tmpdir.join(PlaybookRunner.bundle_cache_dir + "-root")
+        assert oct(cache.stat().mode & 0o777) == oct(0o700)
+        assert len(cache.listdir()) == 1
+        # upload of bundle and the playbook are run by sudo
+        assert tmpdir.join("sudo.log").read() == "sh\nenv\n" * 2
+
+
+class TestEvents(PlaybookRunnerBase):
+
+    files = {}
+    events_output = "\n".join([
+        json.dumps({
+            "_event": "v2_playbook_on_play_start",
+            "play": {"name": "test play", "id": "1"},
+        }),
+        "[WARNING]: provided hosts list is empty",
+        json.dumps({
+            "_event": "v2_playbook_on_task_start",
+            "play": {"name": "test play", "id": "1"},
+            "task": {"name": "ping", "id": "2"},
+        }),
+        json.dumps({
+            "_event": "v2_runner_on_failed",
+            "task": {"name": "ping", "id": "2"},
+            "hosts": {"localhost": {"msg": "boom", "failed": True}},
+        }),
+        json.dumps({
+            "_event": "v2_playbook_on_stats",
+            "stats": {"localhost": {"ok": 0, "failures": 1}},
+        }),
+    ])
+
+    @pytest.fixture()
+    def events_host(self):
+        data = dict(self.data)
+        data[
+            '{env}={plugin} {bin} -i {tmp_dir}/{inventory} -v '
+            '{tmp_dir}/{playbook}'.format(
+                env=PlaybookRunner.stdout_callback_env,
+                plugin=PlaybookRunner.event_callback_plugin,
+                bin=PlaybookRunner.binary,
+                tmp_dir=self.tmp_dir,
+                inventory=PlaybookRunner.default_inventory_name,
+                playbook=self.playbook_name
+            )
+        ] = (2, self.events_output, "")
+        fh = Host('1.1.1.1')
+        fh.add_user(User('root', '11111'))
+        fh.executor_factory = FakeExecutorFactory(data, {})
+        return fh
+
+    @pytest.fixture()
+    def playbook_runner(self, events_host):
+        playbook_runner = PlaybookRunner(events_host)
+        playbook_runner.short_run_uuid = self.fake_run_uuid
+        return playbook_runner
+
+    def test_iter_events(self, playbook_runner, fake_playbook):
+        """ Events are parsed from JSON lines output """
+        events = list(playbook_runner.iter_events(playbook=fake_playbook))
+        assert [e.type for e in events] == [
+            AnsibleEvent.PLAY, AnsibleEvent.TASK, AnsibleEvent.RESULT,
+            AnsibleEvent.STATS,
+        ]
+        failure = events[2]
+        assert failure.failed
+        assert failure.host == "localhost"
+        assert failure.task_name == "ping"
+        assert failure.result["msg"] == "boom"
+        assert playbook_runner.rc == 2
+        assert playbook_runner.recap == {
+            "localhost": {"ok": 0, "failures": 1}
+        }
+
+    def test_event_handler(self, playbook_runner, fake_playbook):
+        """ Events are passed to handler, results are returned as usual """
+        events = []
+        rc, out, _ = playbook_runner.run(
+            playbook=fake_playbook, event_handler=events.append
+        )
+        assert rc == 2
+        assert out == self.events_output
+        assert len(events) == 4
+        assert playbook_runner.recap["localhost"]["failures"] == 1
+
+
+class TestMultiHost(object):
+
+    fake_ansible = """#!/bin/sh
+echo "$@" > "$(dirname "$0")/args"
+cat "$2" > "$(dirname "$0")/inventory"
+echo "$ANSIBLE_STDOUT_CALLBACK" > "$(dirname "$0")/callback"
+cat <<'END'
+{"_event": "v2_runner_on_ok", "task": {"name": "ping"}, "hosts": {"1.1.1.1": {"ping": "pong"}}}
+{"_event": "v2_runner_on_unreachable", "task": {"name": "ping"}, "hosts": {"1.1.1.2": {"msg": "timeout"}}}
+{"_event": "v2_playbook_on_stats", "stats": {"1.1.1.1": {"ok": 1}, "1.1.1.2": {"ok": 0, "unreachable": 1}}}
+END
+echo "some warning" >&2
+exit 4
+"""
+
+    @pytest.fixture()
+    def hosts(self):
+        h1 = Host('1.1.1.1')
+        h1.add_user(User('root', '11111'))
+        h2 = Host('1.1.1.2')
+        h2.executor_user = UserWithPKey('admin', '/path/to/key')
+        h2.sudo = True
+        return [h1, h2]
+
+    @pytest.fixture()
+    def runner(self, hosts, tmpdir):
+        binary = tmpdir.join("ansible-playbook")
+        binary.write(self.fake_ansible)
+        binary.chmod(0o755)
+        runner = MultiHostPlaybookRunner(hosts, forks=20)
+        runner.binary = str(binary)
+        return runner
+
+    def test_generate_inventory(self, runner):
+        inventory = runner.generate_inventory()["all"]["hosts"]
+        assert inventory["1.1.1.1"] == {
+            "ansible_host": "1.1.1.1",
+            "ansible_user": "root",
+            "ansible_password": "11111",
+            "ansible_port": 22,
+        }
+        assert inventory["1.1.1.2"] == {
+            "ansible_host": "1.1.1.2",
+            "ansible_user": "admin",
+            "ansible_ssh_private_key_file": "/path/to/key",
+            "ansible_port": 22,
+            "ansible_become": True,
+        }
+
+    def test_run(self, runner, tmpdir):
+        events = []
+        rc, _, err = runner.run(
+            "site.yml", event_handler=events.append, extra_vars={"a": 1}
+        )
+        assert rc == 4
+        assert err == "some warning\n"
+        assert len(events) == 3
+        assert [e.status for e in runner.results["1.1.1.2"]] == [
+            AnsibleEvent.UNREACHABLE
+        ]
+        assert runner.results["1.1.1.1"][0].result == {"ping": "pong"}
+        assert runner.recap["1.1.1.2"]["unreachable"] == 1
+        args = tmpdir.join("args").read().split()
+        assert args[2] == "--forks=20"
+        assert args[3].startswith("-e@")
+        assert args[-1] == "site.yml"
+        assert tmpdir.join("callback").read().strip() == (
+            PlaybookRunner.event_callback_plugin
+        )
+        inventory = json.loads(tmpdir.join("inventory").read())
+        assert sorted(inventory["all"]["hosts"]) == ["1.1.1.1", "1.1.1.2"]
+        assert not os.path.exists(args[1])
@@ -0,0 +1,66 @@
+import os
+
+import paramiko
+import pytest
+
+from rrmngmnt import ssh
+from rrmngmnt.ssh import RemoteExecutor
+from rrmngmnt.user import UserWithPKey
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    ssh.clear_pkey_cache()
+    yield
+    ssh.clear_pkey_cache()
+
+
+@pytest.fixture
+def key_path(tmpdir):
+    path = str(tmpdir.join('id_ecdsa'))
+    paramiko.ECDSAKey.generate().write_private_key_file(path)
+    return path
+
+
+def test_load_pkey_cached(key_path, monkeypatch):
+    key = ssh.load_pkey(key_path)
+    assert isinstance(key, paramiko.ECDSAKey)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("key parsed again")
+
+    monkeypatch.setattr(paramiko.RSAKey, 'from_private_key_file', fail)
+    monkeypatch.setattr(paramiko.ECDSAKey, 'from_private_key_file', fail)
+    assert ssh.load_pkey(key_path) is key
+
+
+def test_load_pkey_changed(key_path, monkeypatch):
+    key = ssh.load_pkey(key_path)
+    paramiko.ECDSAKey.generate().write_private_key_file(key_path)
+    stat = os.stat(key_path)
+    os.utime(key_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+    def fail(*args, **kwargs):
+        raise AssertionError("detected type of key should be tried first")
+
+    monkeypatch.setattr(paramiko.RSAKey, 'from_private_key_file', fail)
+    new_key = ssh.load_pkey(key_path)
+    assert new_key != key
+    assert isinstance(new_key, paramiko.ECDSAKey)
+
+
+def test_load_pkey_invalid(tmpdir):
+    path = tmpdir.join('id_broken')
+    path.write("not a key")
+    with pytest.raises(paramiko.ssh_exception.SSHException):
+        ssh.load_pkey(str(path))
+
+
+def test_session_agent(key_path, monkeypatch):
+    user = UserWithPKey('root', key_path)
+    monkeypatch.setenv('SSH_AUTH_SOCK', '/nonexistent/agent.sock')
+    executor = RemoteExecutor(user, '1.1.1.1', use_agent=True)
+    assert executor.session().pkey is None
+
+    monkeypatch.delenv('SSH_AUTH_SOCK')
+    assert executor.session().pkey is ssh.load_pkey(key_path)
@@ -0,0 +1,107 @@
+import json
+import weakref
+
+import pytest
+
+from rrmngmnt import Host, User, metrics, tracing
+from rrmngmnt.service import Service
+
+from tests.common import FakeExecutorFactory
+
+
+class Inner(Service):
+    def probe(self):
+        return self.host.run_command(['true'])[0]
+
+
+class Outer(Service):
+    def check(self):
+        event = metrics.start(
+            metrics.COMMAND_EXECUTE, self.host.executor(), cmd='uptime'
+        )
+        if event is not None:
+            event.attrs['rc'] = 0
+            metrics.finish(event)
+        return Inner(self.host).probe() == 0
+
+    def fail(self):
+        raise ValueError("broken")
+
+    def _private(self):
+        pass
+
+
+@pytest.fixture
+def host():
+    h = Host('1.1.1.1')
+    h.add_user(User('root', '11111'))
+    h.executor_factory = FakeExecutorFactory({'true': (0, '', '')}, {})
+    return h
+
+
+def test_not_started(host):
+    tracer = tracing.Tracer()
+    assert Outer(host).check()
+    assert tracer.spans == []
+
+
+def test_tree(host):
+    with tracing.Tracer() as tracer:
+        assert Outer(host).check()
+        Outer(host)._private()
+    spans = tracer.as_dicts()
+    assert [s['name'] for s in spans] == [
+        'Outer.check', metrics.COMMAND_EXECUTE, 'Inner.probe',
+    ]
+    outer, command, inner = spans
+    assert outer['parent'] is None
+    assert command['parent'] == outer['id']
+    assert inner['parent'] == outer['id']
+    assert command['attrs'] == {'cmd': 'uptime', 'host': '1.1.1.1', 'rc': 0}
+    assert outer['attrs'] == {'host': '1.1.1.1'}
+    assert metrics.hooks == []
+
+
+def test_error(host):
+    with tracing.Tracer() as tracer:
+        with pytest.raises(ValueError):
+            Outer(host).fail()
+    assert tracer.as_dicts()[0]['error'] == "ValueError: broken"
+
+
+def test_export(host, tmpdir):
+    with tracing.Tracer() as tracer:
+        Outer(host).check()
+    path = tmpdir.join('trace.jsonl')
+    tracer.write_jsonl(str(path))
+    lines = [json.loads(line) for line in path.readlines()]
+    assert lines == tracer.as_dicts()
+
+    path = tmpdir.join('trace.json')
+    tracer.write_chrome_trace(str(path))
+    events = json.loads(path.read())['traceEvents']
+    assert [e['ph'] for e in events] == ['X'] * 3
+    assert events[1]['cat'] == 'command'
+    assert events[1]['args']['parent'] == events[0]['args']['id']
+    assert events[0]['ts'] <= events[1]['ts']
+
+
+def test_lazy(host, monkeypatch):
+    monkeypatch.setattr(tracing, '_instrumented', False)
+    monkeypatch.setattr(tracing, '_classes', weakref.WeakSet())
+
+    class Early(Service):
+        def probe(self):
+            pass
+
+    assert not hasattr(Early.probe, '_traced')
+    with tracing.Tracer() as tracer:
+        class Late(Service):
+            def probe(self):
+                pass
+
+        Early(host).probe()
+        Late(host).probe()
+    assert [s['name'] for s in tracer.as_dicts()] == [
+        'Early.probe', 'Late.probe',
+    ]